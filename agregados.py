@@ -0,0 +1,69 @@
+"""
+Agregados parciais do relatório de atrasos.
+
+Uma parte dos percursos (uma garagem, um intervalo de datas...) é resumida por
+rota em contagens, somas e máximos, calculados no próprio SQLite
+(`banco.agregar_atrasos_por_rota`). Partes diferentes se combinam somando as
+contagens e somas e tomando o maior dos máximos, sem trafegar linhas; o
+`resumo` e o `por_rota` do relatório saem do agregado combinado, com as mesmas
+fórmulas de `/api/relatorio/atrasos`. Como os atrasos são inteiros, as somas
+são exatas e o resultado não depende de como os percursos foram divididos.
+"""
+
+# Ordem dos valores de cada rota em um agregado parcial
+CAMPOS_PARCIAIS = (
+    'total',
+    'soma_saida', 'maior_saida', 'pontuais_saida',
+    'soma_chegada_atrasada', 'chegadas_atrasadas', 'maior_chegada', 'pontuais_chegada',
+    'maior_criacao',   # data de criação + rowid do percurso mais recente (ordena as rotas)
+)
+_CRIACAO = CAMPOS_PARCIAIS.index('maior_criacao')
+
+_MAXIMOS = frozenset(i for i, campo in enumerate(CAMPOS_PARCIAIS) if campo.startswith('maior_'))
+
+
+def _combinar_valores(a, b):
+    return tuple(
+        (x if y is None else y if x is None else max(x, y)) if i in _MAXIMOS else (x or 0) + (y or 0)
+        for i, (x, y) in enumerate(zip(a, b))
+    )
+
+
+def combinar_parciais(parciais):
+    """Combina agregados parciais ({nome_rota: valores}) em um só"""
+    combinado = {}
+    for parcial in parciais:
+        for rota, valores in parcial.items():
+            anterior = combinado.get(rota)
+            combinado[rota] = valores if anterior is None else _combinar_valores(anterior, valores)
+    return combinado
+
+
+def _metricas(valores):
+    total, soma_saida, maior_saida, pontuais_saida, soma_chegada, atrasadas, maior_chegada, pontuais_chegada = \
+        valores[:_CRIACAO]
+    return {
+        'total_percursos': total,
+        'media_atraso_saida': round(soma_saida / total, 1) if total else 0,
+        # Média de chegada só dos atrasos reais (valores positivos)
+        'media_atraso_chegada': round(soma_chegada / atrasadas, 1) if atrasadas else 0,
+        'maior_atraso_saida': maior_saida if total else 0,
+        'maior_atraso_chegada': maior_chegada if total else 0,
+        'pontualidade_saida': round(pontuais_saida / total * 100, 1) if total else 0,
+        'pontualidade_chegada': round(pontuais_chegada / total * 100, 1) if total else 0,
+    }
+
+
+def relatorio_de_agregado(agregado):
+    """`resumo` e `por_rota` do relatório de atrasos a partir de um agregado combinado.
+
+    As rotas saem na ordem dos detalhes do relatório: a do percurso mais
+    recente primeiro.
+    """
+    rotas = sorted(agregado, key=lambda rota: agregado[rota][_CRIACAO] or '', reverse=True)
+    vazio = (0,) * len(CAMPOS_PARCIAIS)
+    geral = combinar_parciais([{None: valores} for valores in agregado.values()]).get(None, vazio)
+    return {
+        'resumo': _metricas(geral),
+        'por_rota': {rota: _metricas(agregado[rota]) for rota in rotas},
+    }
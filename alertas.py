@@ -0,0 +1,319 @@
+"""
+Detecção incremental de anomalias de atraso.
+
+Cada gravação de percurso atualiza, em O(1) e na mesma transação, as
+estatísticas acumuladas do slot (rota × turno × horário programado) e da rota:
+média e variância pelo método de Welford e uma média móvel exponencial (EWMA).
+O estado fica na tabela `estatisticas_atraso`, então um reinício não exige
+reprocessar o histórico; só há reconstrução completa quando o banco foi
+alterado sem passar por aqui (ex.: carga pelo `dados_alimentar.py`).
+
+Alertas gerados:
+- `atraso_atipico`: atraso com z-score alto em relação ao histórico do slot
+- `atraso_limite`: atraso acima de um limite absoluto
+- `degradacao_rota`: EWMA da rota ultrapassa a média histórica + desvio
+"""
+
+import math
+import threading
+from datetime import datetime
+
+from banco import apos_commit, obter_conexao, registrar_gancho_percurso
+
+# Métrica -> horário real que precisa estar preenchido para o atraso valer
+METRICAS = {
+    'atraso_saida': 'horario_saida_real',
+    'atraso_chegada': 'horario_chegada_real',
+}
+
+# Turno/horário usados na chave das estatísticas agregadas por rota
+TODOS = '*'
+
+ALFA_EWMA = 0.1            # peso da viagem mais recente na EWMA
+MINIMO_AMOSTRAS = 20       # histórico mínimo para avaliar z-score/degradação
+LIMIAR_ZSCORE = 3.0
+EXCESSO_MINIMO = 5         # minutos acima da média para um atraso ser atípico
+LIMITE_ATRASO = 30         # minutos; sempre gera alerta
+FATOR_DEGRADACAO = 1.0     # desvios acima da média para a EWMA da rota
+
+_novos_alertas = threading.Condition()
+
+
+class _Estado:
+    """Estatísticas acumuladas de uma métrica (Welford + EWMA)"""
+    __slots__ = ('n', 'media', 'm2', 'ewma')
+
+    def __init__(self, n=0, media=0.0, m2=0.0, ewma=None):
+        self.n, self.media, self.m2, self.ewma = n, media, m2, ewma
+
+    @property
+    def desvio(self):
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0
+
+    def adicionar(self, valor):
+        self.n += 1
+        delta = valor - self.media
+        self.media += delta / self.n
+        self.m2 += delta * (valor - self.media)
+        self.ewma = valor if self.ewma is None else self.ewma + ALFA_EWMA * (valor - self.ewma)
+
+    def remover(self, valor):
+        """Desfaz `adicionar` na média/variância (a EWMA não é revertida)"""
+        if self.n <= 1:
+            self.n, self.media, self.m2 = 0, 0.0, 0.0
+            return
+        media_anterior = (self.n * self.media - valor) / (self.n - 1)
+        self.m2 = max(self.m2 - (valor - self.media) * (valor - media_anterior), 0.0)
+        self.media = media_anterior
+        self.n -= 1
+
+
+def _chaves(percurso):
+    """Chaves (rota, turno, horário) do slot e da rota inteira"""
+    return (
+        (percurso.rota_id, percurso.turno, percurso.horario_saida_programado or ''),
+        (percurso.rota_id, TODOS, TODOS),
+    )
+
+
+def _valores(percurso):
+    """Atrasos válidos do percurso (só os que têm horário real informado)"""
+    if percurso is None:
+        return {}
+    return {
+        metrica: percurso[metrica] or 0
+        for metrica, horario_real in METRICAS.items() if percurso[horario_real]
+    }
+
+
+class _Estados:
+    """Estados lidos sob demanda durante uma gravação e salvos ao final"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._estados = {}
+
+    def __getitem__(self, chave):
+        if chave not in self._estados:
+            row = self.conn.execute('''
+                SELECT n, media, m2, ewma FROM estatisticas_atraso
+                WHERE rota_id = ? AND turno = ? AND horario_saida_programado = ? AND metrica = ?
+            ''', chave).fetchone()
+            self._estados[chave] = _Estado(*row) if row else _Estado()
+        return self._estados[chave]
+
+    def salvar(self):
+        self.conn.executemany('''
+            INSERT INTO estatisticas_atraso (rota_id, turno, horario_saida_programado, metrica, n, media, m2, ewma)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (rota_id, turno, horario_saida_programado, metrica) DO UPDATE SET
+                n = excluded.n, media = excluded.media, m2 = excluded.m2, ewma = excluded.ewma
+        ''', [(*chave, e.n, e.media, e.m2, e.ewma) for chave, e in self._estados.items()])
+
+
+def _marcar_sincronizado(conn):
+    """Registra até qual versão de percursos (ver percursos_versoes) o estado está em dia"""
+    conn.execute('''
+        INSERT INTO alertas_estado (id, versao)
+        VALUES (1, (SELECT COALESCE(MAX(versao), 0) FROM percursos_versoes))
+        ON CONFLICT (id) DO UPDATE SET versao = excluded.versao
+    ''')
+
+
+def _avaliar(percurso, metrica, valor, estado_slot, estado_rota, ewma_anterior):
+    """Alertas disparados por um atraso, dado o histórico anterior a ele"""
+    alertas = []
+    base = {'metrica': metrica, 'valor': valor}
+
+    if estado_slot.n >= MINIMO_AMOSTRAS and estado_slot.desvio > 0:
+        zscore = (valor - estado_slot.media) / estado_slot.desvio
+        if zscore >= LIMIAR_ZSCORE and valor - estado_slot.media >= EXCESSO_MINIMO:
+            alertas.append({**base, 'tipo': 'atraso_atipico', 'media': estado_slot.media,
+                            'desvio': estado_slot.desvio, 'zscore': zscore})
+
+    if valor >= LIMITE_ATRASO:
+        alertas.append({**base, 'tipo': 'atraso_limite', 'media': estado_slot.media,
+                        'desvio': estado_slot.desvio, 'zscore': None})
+
+    # Degradação: a EWMA da rota cruzou o limiar nesta gravação
+    if estado_rota.n >= MINIMO_AMOSTRAS and ewma_anterior is not None:
+        limiar = estado_rota.media + FATOR_DEGRADACAO * estado_rota.desvio
+        if ewma_anterior <= limiar < estado_rota.ewma:
+            alertas.append({**base, 'tipo': 'degradacao_rota', 'valor': estado_rota.ewma,
+                            'media': estado_rota.media, 'desvio': estado_rota.desvio, 'zscore': None})
+
+    return alertas
+
+
+def _ao_gravar_percurso(conn, anterior, atual):
+    """Gancho de banco.py: atualiza as estatísticas e registra alertas da gravação"""
+    antigos, novos = _valores(anterior), _valores(atual)
+    mesmo_slot = anterior is not None and atual is not None and _chaves(anterior) == _chaves(atual)
+
+    if not (mesmo_slot and antigos == novos):
+        estados = _Estados(conn)
+        alertas = []
+
+        if antigos:
+            for chave in _chaves(anterior):
+                for metrica, valor in antigos.items():
+                    estados[(*chave, metrica)].remover(valor)
+
+        chave_slot, chave_rota = _chaves(atual) if atual is not None else (None, None)
+        for metrica, valor in novos.items():
+            estado_slot = estados[(*chave_slot, metrica)]
+            estado_rota = estados[(*chave_rota, metrica)]
+            ewma_anterior = estado_rota.ewma
+            estado_rota.adicionar(valor)
+            # O histórico do slot usado no z-score ainda não inclui a própria viagem
+            alertas += _avaliar(atual, metrica, valor, estado_slot, estado_rota, ewma_anterior)
+            estado_slot.adicionar(valor)
+
+        estados.salvar()
+        if alertas:
+            _registrar_alertas(conn, atual, alertas)
+
+    _marcar_sincronizado(conn)
+
+
+def _registrar_alertas(conn, percurso, alertas):
+    agora = datetime.now().isoformat()
+    conn.executemany('''
+        INSERT OR IGNORE INTO alertas (
+            tipo, metrica, percurso_id, rota_id, nome_rota, turno, horario_saida_programado,
+            data, valor, media, desvio, zscore, criado_em
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [
+        (a['tipo'], a['metrica'], percurso.id, percurso.rota_id, percurso.nome_rota, percurso.turno,
+         percurso.horario_saida_programado, percurso.data, a['valor'], a['media'], a['desvio'],
+         a['zscore'], agora)
+        for a in alertas
+    ])
+    # Quem espera em aguardar_alertas relê o banco: só acorda depois do commit
+    apos_commit(conn, _avisar_novos_alertas)
+
+
+def _avisar_novos_alertas():
+    with _novos_alertas:
+        _novos_alertas.notify_all()
+
+
+registrar_gancho_percurso(_ao_gravar_percurso)
+
+
+# === Reconstrução ===
+
+def reconstruir_estatisticas(conn):
+    """Recalcula todo o estado a partir dos percursos (sem gerar alertas)"""
+    estados = {}
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute('''
+        SELECT rota_id, turno, COALESCE(horario_saida_programado, ''),
+               horario_saida_real, atraso_saida, horario_chegada_real, atraso_chegada
+        FROM percursos
+        ORDER BY data, horario_saida_programado
+    ''')
+    for rota_id, turno, horario, saida_real, atraso_saida, chegada_real, atraso_chegada in cursor:
+        for metrica, real, valor in (('atraso_saida', saida_real, atraso_saida),
+                                     ('atraso_chegada', chegada_real, atraso_chegada)):
+            if not real:
+                continue
+            for chave in ((rota_id, turno, horario, metrica), (rota_id, TODOS, TODOS, metrica)):
+                estado = estados.get(chave)
+                if estado is None:
+                    estado = estados[chave] = _Estado()
+                estado.adicionar(valor or 0)
+
+    conn.execute('DELETE FROM estatisticas_atraso')
+    conn.executemany('''
+        INSERT INTO estatisticas_atraso (rota_id, turno, horario_saida_programado, metrica, n, media, m2, ewma)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(*chave, e.n, e.media, e.m2, e.ewma) for chave, e in estados.items()])
+    _marcar_sincronizado(conn)
+
+
+def sincronizar_estatisticas():
+    """Reconstrói o estado só se houve gravações de percursos fora deste módulo.
+
+    Retorna True se foi necessário reconstruir.
+    """
+    with obter_conexao() as conn:
+        row = conn.execute('''
+            SELECT (SELECT versao FROM alertas_estado WHERE id = 1),
+                   (SELECT COALESCE(MAX(versao), 0) FROM percursos_versoes)
+        ''').fetchone()
+        if row[0] == row[1]:
+            return False
+        reconstruir_estatisticas(conn)
+        conn.commit()
+        return True
+
+
+# === Consulta ===
+
+def _alerta_para_dict(row):
+    alerta = dict(row)
+    for campo in ('valor', 'media', 'desvio', 'zscore'):
+        if alerta[campo] is not None:
+            alerta[campo] = round(alerta[campo], 2)
+    return alerta
+
+
+def listar_alertas(desde_id=None, rota_id=None, tipo=None, limite=100):
+    """Alertas mais recentes primeiro; com `desde_id`, só os posteriores, em ordem de criação"""
+    condicoes, params = [], []
+    if desde_id is not None:
+        condicoes.append('id > ?')
+        params.append(desde_id)
+    if rota_id:
+        condicoes.append('rota_id = ?')
+        params.append(rota_id)
+    if tipo:
+        condicoes.append('tipo = ?')
+        params.append(tipo)
+    filtros = ' WHERE ' + ' AND '.join(condicoes) if condicoes else ''
+    ordem = 'ASC' if desde_id is not None else 'DESC'
+
+    with obter_conexao() as conn:
+        rows = conn.execute(
+            f'SELECT * FROM alertas{filtros} ORDER BY id {ordem} LIMIT ?', params + [limite]
+        ).fetchall()
+    return [_alerta_para_dict(row) for row in rows]
+
+
+def aguardar_alertas(desde_id, timeout=1.0, rota_id=None, tipo=None):
+    """Alertas posteriores a `desde_id`, esperando até `timeout` segundos por novos"""
+    alertas = listar_alertas(desde_id, rota_id, tipo)
+    if alertas:
+        return alertas
+    with _novos_alertas:
+        _novos_alertas.wait(timeout)
+    return listar_alertas(desde_id, rota_id, tipo)
+
+
+def obter_estatisticas(rota_id=None):
+    """Estado atual das estatísticas por slot e por rota"""
+    filtro, params = (' WHERE e.rota_id = ?', [rota_id]) if rota_id else ('', [])
+    with obter_conexao() as conn:
+        rows = conn.execute(f'''
+            SELECT e.*, COALESCE(r.nome, e.rota_id) AS nome_rota
+            FROM estatisticas_atraso e LEFT JOIN rotas r ON r.id = e.rota_id{filtro}
+            ORDER BY e.rota_id, e.turno, e.horario_saida_programado, e.metrica
+        ''', params).fetchall()
+
+    estatisticas = []
+    for row in rows:
+        estado = _Estado(row['n'], row['media'], row['m2'], row['ewma'])
+        estatisticas.append({
+            'rota_id': row['rota_id'],
+            'nome_rota': row['nome_rota'],
+            'turno': row['turno'],
+            'horario_saida_programado': row['horario_saida_programado'],
+            'metrica': row['metrica'],
+            'n': estado.n,
+            'media': round(estado.media, 2),
+            'desvio': round(estado.desvio, 2),
+            'ewma': round(estado.ewma, 2) if estado.ewma is not None else None
+        })
+    return estatisticas
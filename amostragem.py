@@ -0,0 +1,269 @@
+"""
+Relatório de atrasos aproximado, calculado sobre uma amostra dos percursos.
+
+Para períodos de anos, `resumo` e `por_rota` saem de alguns milhares de
+percursos em vez de todos. A amostra é estratificada por rota: o total de
+percursos de cada rota no período vem do índice da chave natural (sem ler as
+linhas), e os percursos são sorteados por rowid no momento da consulta, cada
+um buscado direto pela chave primária. Rotas com poucos percursos sorteados
+são lidas inteiras, assim como, com a janela `desde`/`ate`, os dias das
+pontas, onde há percursos dentro e fora dela. Cada métrica é estimada com o
+peso de cada estrato (total da rota / sorteados da rota) e acompanhada do
+intervalo de confiança de 95% (variância do estimador de razão por
+linearização, com correção de população finita). Períodos pequenos usam o
+cálculo exato.
+"""
+
+import math
+import random
+from datetime import date, datetime, timedelta
+
+from banco import agregar_atrasos_por_estrato, contar_percursos_por_rota, faixa_rowids_percursos
+
+# Ordem dos valores de cada grupo (rota, nome, na janela) da amostra
+CAMPOS_ESTRATO = (
+    'total',
+    'soma_saida', 'soma_quadrados_saida', 'maior_saida', 'pontuais_saida',
+    'soma_chegada_atrasada', 'soma_quadrados_chegada_atrasada', 'chegadas_atrasadas', 'maior_chegada',
+    'pontuais_chegada',
+    'maior_criacao',
+)
+_I = {campo: i for i, campo in enumerate(CAMPOS_ESTRATO)}
+
+# Percursos sorteados por consulta (~±1 ponto percentual nas pontualidades)
+AMOSTRA_PADRAO = 10000
+
+# Até esta quantidade de percursos no período o relatório é exato
+LIMITE_EXATO = 50000
+
+# Rotas com menos percursos sorteados que isto são lidas inteiras
+MINIMO_POR_ESTRATO = 30
+
+Z_95 = 1.96
+
+METRICAS = (
+    'total_percursos', 'media_atraso_saida', 'media_atraso_chegada', 'maior_atraso_saida',
+    'maior_atraso_chegada', 'pontualidade_saida', 'pontualidade_chegada',
+)
+
+
+def _total(partes):
+    """Total estimado e variância a partir de (N, n, soma, soma dos quadrados) de cada estrato"""
+    estimativa = variancia = 0.0
+    for populacao, amostra, soma, quadrados in partes:
+        estimativa += populacao / amostra * soma
+        if 1 < amostra < populacao:
+            s2 = (quadrados - soma * soma / amostra) / (amostra - 1)
+            variancia += populacao * populacao * (1 - amostra / populacao) * s2 / amostra
+    return estimativa, variancia
+
+
+def _razao(partes):
+    """Razão Y/X estimada e variância, de (N, n, soma de y, soma de y², soma de x) de cada estrato.
+
+    x é um indicador (0/1) e y só é diferente de zero quando x = 1, então
+    soma de x² = soma de x e soma de x·y = soma de y.
+    """
+    y = sum(populacao / amostra * soma_y for populacao, amostra, soma_y, _, _ in partes)
+    x = sum(populacao / amostra * soma_x for populacao, amostra, _, _, soma_x in partes)
+    if not x:
+        return 0.0, 0.0
+    razao = y / x
+    variancia = 0.0
+    for populacao, amostra, soma_y, quadrados_y, soma_x in partes:
+        if 1 < amostra < populacao:
+            soma_z = soma_y - razao * soma_x
+            quadrados_z = quadrados_y - 2 * razao * soma_y + razao * razao * soma_x
+            s2 = (quadrados_z - soma_z * soma_z / amostra) / (amostra - 1)
+            variancia += populacao * populacao * (1 - amostra / populacao) * s2 / amostra
+    return razao, variancia / (x * x)
+
+
+def _intervalo(valor, variancia, escala=1, minimo=None, maximo=None, casas=1):
+    margem = Z_95 * math.sqrt(max(variancia, 0.0))
+    inferior, superior = (valor - margem) * escala, (valor + margem) * escala
+    if minimo is not None:
+        inferior = max(inferior, minimo)
+    if maximo is not None:
+        superior = min(superior, maximo)
+    return [round(inferior, casas), round(superior, casas)]
+
+
+def _estimar(estratos, somas, completo):
+    """Métricas e intervalos de um domínio (o período todo ou uma rota).
+
+    `estratos`: {estrato: (N, n)}; `somas`: {estrato: valores somados do domínio}.
+    """
+    def partes(*campos):
+        return [
+            (populacao, amostra, *(somas[estrato][_I[campo]] if estrato in somas else 0 for campo in campos))
+            for estrato, (populacao, amostra) in estratos.items()
+        ]
+
+    total, var_total = _total(partes('total', 'total'))
+    saida, var_saida = _razao(partes('soma_saida', 'soma_quadrados_saida', 'total'))
+    chegada, var_chegada = _razao(partes(
+        'soma_chegada_atrasada', 'soma_quadrados_chegada_atrasada', 'chegadas_atrasadas'))
+    pontual_saida, var_pontual_saida = _razao(partes('pontuais_saida', 'pontuais_saida', 'total'))
+    pontual_chegada, var_pontual_chegada = _razao(partes('pontuais_chegada', 'pontuais_chegada', 'total'))
+    maximos = [max((v[_I[campo]] for v in somas.values() if v[_I[campo]] is not None), default=0)
+               for campo in ('maior_saida', 'maior_chegada')]
+
+    metricas = {
+        'total_percursos': round(total),
+        'media_atraso_saida': round(saida, 1),
+        'media_atraso_chegada': round(chegada, 1),
+        'maior_atraso_saida': maximos[0],
+        'maior_atraso_chegada': maximos[1],
+        'pontualidade_saida': round(pontual_saida * 100, 1),
+        'pontualidade_chegada': round(pontual_chegada * 100, 1),
+    }
+    intervalos = {
+        'total_percursos': _intervalo(total, var_total, minimo=0, casas=None),
+        'media_atraso_saida': _intervalo(saida, var_saida),
+        'media_atraso_chegada': _intervalo(chegada, var_chegada, minimo=0),
+        # Máximo da amostra: o real é no mínimo este (sem limite superior, salvo se tudo foi lido)
+        'maior_atraso_saida': [maximos[0], maximos[0] if completo else None],
+        'maior_atraso_chegada': [maximos[1], maximos[1] if completo else None],
+        'pontualidade_saida': _intervalo(pontual_saida, var_pontual_saida, 100, 0, 100),
+        'pontualidade_chegada': _intervalo(pontual_chegada, var_pontual_chegada, 100, 0, 100),
+    }
+    return metricas, intervalos
+
+
+def _somar(grupos, filtro):
+    """Soma, por estrato, os valores dos grupos (estrato, nome_rota) aceitos por `filtro`"""
+    somas = {}
+    for (estrato, nome), valores in grupos.items():
+        if not filtro(nome):
+            continue
+        anterior = somas.get(estrato)
+        somas[estrato] = valores if anterior is None else tuple(
+            max(a, b, key=lambda v: (v is not None, v)) if campo.startswith('maior_') else a + b
+            for campo, a, b in zip(CAMPOS_ESTRATO, anterior, valores)
+        )
+    return somas
+
+
+def intervalos_exatos(relatorio):
+    """Intervalos de largura zero para um relatório exato (mesmo formato do aproximado)"""
+    def exatos(metricas):
+        return {metrica: [metricas[metrica], metricas[metrica]] for metrica in METRICAS}
+    return {
+        'resumo': exatos(relatorio['resumo']),
+        'por_rota': {rota: exatos(metricas) for rota, metricas in relatorio['por_rota'].items()},
+    }
+
+
+def _texto(dia):
+    return dia.isoformat() if dia else None
+
+
+def _dividir_periodo(data_inicio, data_fim, desde, ate):
+    """Separa o período em miolo, onde todos os percursos estão na janela `desde`/`ate`, e bordas.
+
+    A saída programada cai no dia de operação ou na madrugada seguinte, então
+    só nos dias perto de `desde` (o anterior e o próprio) e de `ate` (ele e o
+    anterior) há percursos dentro e fora da janela; esses dias são as bordas,
+    lidas inteiras. Retorna ((início, fim) do miolo, ou None se não sobrar
+    miolo, [(início, fim) de cada borda]).
+    """
+    um_dia = timedelta(days=1)
+    inicio = date.fromisoformat(data_inicio) if data_inicio else None
+    fim = date.fromisoformat(data_fim) if data_fim else None
+    miolo_inicio, miolo_fim, bordas = inicio, fim, []
+    if desde:
+        dia = datetime.fromisoformat(desde).date()
+        miolo_inicio = max(inicio, dia + um_dia) if inicio else dia + um_dia
+        bordas.append((max(inicio, dia - um_dia) if inicio else dia - um_dia, miolo_inicio - um_dia))
+    if ate:
+        dia = datetime.fromisoformat(ate).date()
+        miolo_fim = min(fim, dia - 2 * um_dia) if fim else dia - 2 * um_dia
+        bordas.append((miolo_fim + um_dia, min(fim, dia) if fim else dia))
+    if miolo_inicio and miolo_fim and miolo_inicio > miolo_fim:
+        return None, bordas
+    return (_texto(miolo_inicio), _texto(miolo_fim)), [
+        (_texto(borda_inicio), _texto(borda_fim)) for borda_inicio, borda_fim in bordas if borda_inicio <= borda_fim
+    ]
+
+
+def relatorio_aproximado(rota_id=None, data_inicio=None, data_fim=None, desde=None, ate=None,
+                         amostra=AMOSTRA_PADRAO, limite_exato=LIMITE_EXATO):
+    """`resumo`, `por_rota`, `intervalos` e `amostra` do relatório de atrasos estimados por amostragem.
+
+    Retorna None quando o cálculo exato é barato: período com até
+    `limite_exato` percursos, ou amostra que seria uma fração grande da tabela.
+    """
+    try:
+        miolo, bordas = _dividir_periodo(data_inicio, data_fim, desde, ate)
+    except ValueError:
+        # Datas fora do formato AAAA-MM-DD: o cálculo exato compara como texto, como no relatório
+        return None
+    if miolo is None:
+        return None
+    filtros = {'rota_id': rota_id, 'desde': desde, 'ate': ate}
+    populacao = contar_percursos_por_rota(data_inicio=miolo[0], data_fim=miolo[1], **filtros)
+    total = sum(populacao.values())
+    if total <= limite_exato:
+        return None
+    menor, maior = faixa_rowids_percursos()
+    faixa = maior - menor + 1
+    sorteios = math.ceil(amostra * faixa / total)
+    if sorteios * 4 > faixa:
+        # Sortear um quarto da tabela custa mais que ler o período
+        return None
+
+    # Estratos do miolo (um por rota), sorteados; os percursos gravados depois da contagem ficam de fora
+    sorteio = random.sample(range(menor, maior + 1), sorteios)
+    grupos = {
+        chave: valores
+        for chave, valores in agregar_atrasos_por_estrato(sorteio, data_inicio=miolo[0], data_fim=miolo[1],
+                                                          **filtros).items()
+        if chave[0] in populacao
+    }
+    sorteados = dict.fromkeys(populacao, 0)
+    for (rota, _, _), valores in grupos.items():
+        sorteados[rota] += valores[0]
+    estratos = {}
+    for rota, quantidade in populacao.items():
+        if sorteados[rota] < MINIMO_POR_ESTRATO:
+            # Rota pequena: lida inteira (peso 1, sem erro de amostragem)
+            grupos = {chave: valores for chave, valores in grupos.items() if chave[0] != rota}
+            grupos.update(agregar_atrasos_por_estrato(
+                data_inicio=miolo[0], data_fim=miolo[1], **{**filtros, 'rota_id': rota}))
+            estratos[rota] = (quantidade, quantidade)
+        else:
+            estratos[rota] = (quantidade, sorteados[rota])
+
+    # Bordas da janela desde/ate: lidas inteiras, cada rota de cada borda é um estrato completo
+    for i, (inicio, fim) in enumerate(bordas):
+        for (rota, nome, janela), valores in agregar_atrasos_por_estrato(
+                data_inicio=inicio, data_fim=fim, **filtros).items():
+            estrato = ('borda', i, rota)
+            grupos[(estrato, nome, janela)] = valores
+            lidos = estratos.get(estrato, (0, 0))[0] + valores[0]
+            estratos[estrato] = (lidos, lidos)
+    completo = all(populacao == amostra for populacao, amostra in estratos.values())
+
+    # Domínios: só os percursos dentro da janela desde/ate, no total e por nome de rota
+    na_janela = {(estrato, nome): valores for (estrato, nome, janela), valores in grupos.items() if janela}
+    resumo, intervalos_resumo = _estimar(estratos, _somar(na_janela, lambda nome: True), completo)
+    recentes = {}
+    for (_, nome), valores in na_janela.items():
+        recentes[nome] = max(recentes.get(nome) or '', valores[_I['maior_criacao']] or '')
+    por_rota, intervalos_por_rota = {}, {}
+    for nome in sorted(recentes, key=recentes.get, reverse=True):
+        por_rota[nome], intervalos_por_rota[nome] = _estimar(
+            estratos, _somar(na_janela, lambda outro: outro == nome), completo)
+
+    return {
+        'resumo': resumo,
+        'por_rota': por_rota,
+        'intervalos': {'resumo': intervalos_resumo, 'por_rota': intervalos_por_rota},
+        'amostra': {
+            'percursos': sum(amostra for _, amostra in estratos.values()),
+            'populacao': sum(populacao for populacao, _ in estratos.values()),
+            'estratos_completos': sum(populacao == amostra for populacao, amostra in estratos.values()),
+            'confianca': 0.95,
+        },
+    }
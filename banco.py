@@ -1,90 +1,609 @@
 import sqlite3
 import json
 import uuid
-from datetime import datetime
+from collections import namedtuple
+from functools import lru_cache, partial
+from datetime import datetime, timedelta
 from contextlib import contextmanager
+from contextvars import ContextVar
 import secrets
+import re
 import hashlib
+import threading
+import time
+
+from escritor import EscritorUnico
 
 # Nome do arquivo de banco de dados
 DATABASE_FILE = 'dados.db'
 
+# Arquivo de banco do contexto atual (uma garagem, ver garagens.py); None usa DATABASE_FILE
+_banco_atual = ContextVar('banco_atual', default=None)
+
+def banco_atual():
+    """Arquivo de banco usado pelas conexões abertas no contexto atual"""
+    return _banco_atual.get() or DATABASE_FILE
+
+def usar_banco(caminho):
+    """Direciona as conexões abertas no contexto atual para `caminho`; retorna o token para restaurar"""
+    return _banco_atual.set(caminho)
+
+def restaurar_banco(token):
+    _banco_atual.reset(token)
+
+def _nova_conexao(caminho=None):
+    """Abre uma conexão com o banco de dados"""
+    conn = sqlite3.connect(caminho or banco_atual())
+    conn.row_factory = sqlite3.Row  # Para acessar colunas por nome
+    conn.create_function('capturar_anterior', -1, _capturar_anterior)
+    return conn
+
+# Colunas antigas capturadas pelo UPDATE em andamento nesta thread (ver _atualizar_percurso)
+_capturados = threading.local()
+
+def _capturar_anterior(valor, *anteriores):
+    """Função SQL: guarda os valores antigos da linha (as expressões do SET os enxergam) e devolve `valor`"""
+    _capturados.linhas.append(anteriores)
+    return valor
+
+# Fonte das conexões de leitura da requisição atual: None usa o banco principal;
+# uma função sem argumentos que abre conexão (ex.: a réplica de replica.py) desvia
+# as leituras para ela. O atributo `arquivo` da fonte, se houver, é o arquivo que
+# outros processos abrem para ler o mesmo conteúdo
+_fonte_leitura = ContextVar('fonte_leitura', default=None)
+
+def usar_fonte_leitura(fonte):
+    """Desvia as conexões abertas no contexto atual para `fonte`; retorna o token para restaurar"""
+    return _fonte_leitura.set(fonte)
+
+def restaurar_fonte_leitura(token):
+    _fonte_leitura.reset(token)
+
+def arquivo_leitura():
+    """Arquivo com o que as conexões do contexto atual leem, para abrir em outro processo.
+    
+    None se a fonte de leitura atual só existe neste processo (ex.: réplica em memória).
+    """
+    fonte = _fonte_leitura.get()
+    if fonte is None:
+        return banco_atual()
+    return getattr(fonte, 'arquivo', None)
+
+def _abrir_conexao(fonte=None):
+    return fonte() if fonte is not None else _nova_conexao()
+
 @contextmanager
 def obter_conexao():
     """Context manager para conexões com o banco de dados"""
-    conn = sqlite3.connect(DATABASE_FILE)
-    conn.row_factory = sqlite3.Row  # Para acessar colunas por nome
+    conn = _abrir_conexao(_fonte_leitura.get())
     try:
         yield conn
     finally:
         conn.close()
 
-def inicializar_banco():
-    """Cria as tabelas se não existirem"""
+# === ESCRITOR ÚNICO (opcional) ===
+
+# Quando ativo, as gravações de percursos passam pela thread de escrita com
+# commit em grupo (ver escritor.py) em vez de abrir conexão e commitar cada uma.
+# Há um escritor por arquivo de banco (garagem), criado na primeira gravação.
+_escritores = {}
+_config_escritor = None
+_lock_escritores = threading.Lock()
+
+def ativar_escritor_unico(intervalo=0.005, max_lote=256):
+    """Inicia a thread de escrita única com group commit (a do banco atual)"""
+    global _config_escritor
+    _config_escritor = {'intervalo': intervalo, 'max_lote': max_lote}
+    return _escritor_do_banco(banco_atual())
+
+def _conexao_do_escritor(caminho):
+    usar_banco(caminho)  # chamada na thread do escritor, que passa a usar só esse banco
+    return _nova_conexao(caminho)
+
+def _escritor_do_banco(caminho):
+    escritor = _escritores.get(caminho)
+    if escritor is not None and escritor.ativo:
+        return escritor
+    with _lock_escritores:
+        escritor = _escritores.get(caminho)
+        if escritor is None or not escritor.ativo:
+            escritor = _escritores[caminho] = EscritorUnico(
+                partial(_conexao_do_escritor, caminho), ao_concluir=_concluir_transacao, **_config_escritor
+            ).iniciar()
+        return escritor
+
+def desativar_escritor_unico():
+    """Grava o que estiver pendente e encerra as threads de escrita"""
+    global _config_escritor
+    _config_escritor = None
+    with _lock_escritores:
+        escritores = list(_escritores.values())
+        _escritores.clear()
+    for escritor in escritores:
+        escritor.parar()
+
+def executar_escrita(funcao, *args):
+    """Executa `funcao(conn, *args)` em transação: via escritor único, se ativo, ou em conexão própria"""
+    if _config_escritor is not None:
+        escritor = _escritor_do_banco(banco_atual())
+        if not escritor.na_thread_do_escritor():
+            return escritor.executar(funcao, *args)
     with obter_conexao() as conn:
-        cursor = conn.cursor()
-        
-        # Tabela de rotas
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS rotas (
-                id TEXT PRIMARY KEY,
-                nome TEXT NOT NULL,
-                ativa INTEGER NOT NULL DEFAULT 1,
-                horarios TEXT NOT NULL
-            )
-        ''')
-        
-        # Tabela de percursos
+        try:
+            resultado = funcao(conn, *args)
+            conn.commit()
+        except BaseException:
+            _concluir_transacao(conn, False)
+            raise
+        _concluir_transacao(conn, True)
+        return resultado
+
+# Funções a chamar depois do COMMIT da transação aberta em cada conexão de
+# escrita (ex.: avisar quem espera por dados que só ficam visíveis após o commit)
+_apos_commit = {}
+
+def apos_commit(conn, funcao):
+    """Agenda `funcao()` para depois do commit da transação atual de `conn` (descartada no rollback)"""
+    funcoes = _apos_commit.setdefault(conn, [])
+    if funcao not in funcoes:
+        funcoes.append(funcao)
+
+def _concluir_transacao(conn, confirmada):
+    funcoes = _apos_commit.pop(conn, ())
+    if confirmada:
+        for funcao in funcoes:
+            funcao()
+
+# Funções chamadas a cada gravação de percurso, na mesma transação da escrita:
+# gancho(conn, anterior, atual), com `anterior` None na inserção e `atual`
+# None na remoção. `anterior` traz ao menos as colunas de CAMPOS_PERCURSO_ANTERIOR
+_ganchos_percurso = []
+
+def registrar_gancho_percurso(funcao):
+    """Registra `funcao(conn, anterior, atual)` para ser chamada a cada gravação de percurso"""
+    if funcao not in _ganchos_percurso:
+        _ganchos_percurso.append(funcao)
+    return funcao
+
+def _notificar_ganchos(conn, anterior, atual):
+    for gancho in _ganchos_percurso:
+        gancho(conn, anterior, atual)
+
+# Funções chamadas a cada gravação de rota (criação, alteração ou remoção), na
+# mesma transação da escrita: gancho(conn, rota_id)
+_ganchos_rota = []
+
+def registrar_gancho_rota(funcao):
+    """Registra `funcao(conn, rota_id)` para ser chamada a cada gravação de rota"""
+    if funcao not in _ganchos_rota:
+        _ganchos_rota.append(funcao)
+    return funcao
+
+def _notificar_ganchos_rota(conn, rota_id):
+    for gancho in _ganchos_rota:
+        gancho(conn, rota_id)
+
+def _reconstruir_busca_percursos(cursor):
+    """Reindexa as observações de todos os percursos no índice de busca"""
+    cursor.execute('DELETE FROM percursos_busca')
+    cursor.execute('''
+        INSERT INTO percursos_busca (rowid, observacoes)
+        SELECT rowid, observacoes FROM percursos WHERE COALESCE(observacoes, '') <> ''
+    ''')
+
+def reconstruir_busca_percursos():
+    """Reconstrói o índice de busca (necessário após um VACUUM, que pode renumerar os rowids)"""
+    with obter_conexao() as conn:
+        _reconstruir_busca_percursos(conn.cursor())
+        conn.commit()
+
+# === MIGRAÇÕES DE ESQUEMA ===
+#
+# Cada migração recebe um cursor e roda em sua própria transação; a versão
+# aplicada fica registrada em `schema_version`. Os passos usam IF NOT EXISTS
+# para também servirem a bancos criados antes do controle de versões. Nunca
+# altere uma migração já publicada: acrescente uma nova no final da lista.
+
+def _migracao_esquema_inicial(cursor):
+    """Tabelas de rotas, percursos e usuários"""
+    # Tabela de rotas
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rotas (
+            id TEXT PRIMARY KEY,
+            nome TEXT NOT NULL,
+            ativa INTEGER NOT NULL DEFAULT 1,
+            horarios TEXT NOT NULL
+        )
+    ''')
+    
+    # Tabela de percursos
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS percursos (
+            id TEXT PRIMARY KEY,
+            rota_id TEXT NOT NULL,
+            nome_rota TEXT NOT NULL,
+            data TEXT NOT NULL,
+            turno TEXT NOT NULL,
+            horario_saida_programado TEXT,
+            horario_chegada_programado TEXT,
+            horario_saida_real TEXT,
+            horario_chegada_real TEXT,
+            atraso_saida INTEGER DEFAULT 0,
+            atraso_chegada INTEGER DEFAULT 0,
+            observacoes TEXT DEFAULT '',
+            data_criacao TEXT NOT NULL,
+            data_atualizacao TEXT,
+            FOREIGN KEY (rota_id) REFERENCES rotas (id)
+        )
+    ''')
+    
+    # Tabela de usuários
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS usuarios (
+            id TEXT PRIMARY KEY,
+            username TEXT UNIQUE NOT NULL,
+            nome TEXT,
+            senha_hash TEXT NOT NULL,
+            is_admin INTEGER NOT NULL DEFAULT 0,
+            ativo INTEGER NOT NULL DEFAULT 1,
+            criado_em TEXT NOT NULL,
+            atualizado_em TEXT,
+            ultimo_login TEXT
+        )
+    ''')
+
+def _migracao_dados_iniciais(cursor):
+    """Usuário admin e rotas padrão em banco vazio"""
+    cursor.execute('SELECT COUNT(*) FROM usuarios')
+    if cursor.fetchone()[0] == 0:
+        _inserir_usuario(cursor, 'admin', 'Administrador', 'admin', is_admin=True)
+    
+    cursor.execute('SELECT COUNT(*) FROM rotas')
+    if cursor.fetchone()[0] == 0:
+        inserir_dados_padrao(cursor)
+
+def _migracao_chave_natural(cursor):
+    """Chave natural única dos percursos e índice por dia/slot"""
+    # Chave natural do percurso: um registro por rota, dia, turno e horário.
+    # Na primeira execução remove as duplicatas existentes antes de criar o índice.
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'uq_percursos_chave'")
+    if not cursor.fetchone():
+        _deduplicar_percursos(cursor)
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS percursos (
-                id TEXT PRIMARY KEY,
-                rota_id TEXT NOT NULL,
-                nome_rota TEXT NOT NULL,
-                data TEXT NOT NULL,
-                turno TEXT NOT NULL,
-                horario_saida_programado TEXT,
-                horario_chegada_programado TEXT,
-                horario_saida_real TEXT,
-                horario_chegada_real TEXT,
-                atraso_saida INTEGER DEFAULT 0,
-                atraso_chegada INTEGER DEFAULT 0,
-                observacoes TEXT DEFAULT '',
-                data_criacao TEXT NOT NULL,
-                data_atualizacao TEXT,
-                FOREIGN KEY (rota_id) REFERENCES rotas (id)
-            )
+            CREATE UNIQUE INDEX uq_percursos_chave
+            ON percursos (rota_id, data, turno, horario_saida_programado)
         ''')
-        
-        # Tabela de usuários
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS usuarios (
-                id TEXT PRIMARY KEY,
-                username TEXT UNIQUE NOT NULL,
-                nome TEXT,
-                senha_hash TEXT NOT NULL,
-                is_admin INTEGER NOT NULL DEFAULT 0,
-                ativo INTEGER NOT NULL DEFAULT 1,
-                criado_em TEXT NOT NULL,
-                atualizado_em TEXT,
-                ultimo_login TEXT
+    
+    # Índice por dia e slot da escala (filtros por período e cobertura)
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_percursos_data_slot
+        ON percursos (data, rota_id, turno, horario_saida_programado)
+    ''')
+
+def _migracao_escala_slots(cursor):
+    """Escala expandida usada no relatório de cobertura"""
+    # Escala expandida das rotas (um registro por rota × turno × horário),
+    # reconstruída a partir de rotas.horarios pelo módulo cobertura
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS escala_slots (
+            rota_id TEXT NOT NULL,
+            nome_rota TEXT NOT NULL,
+            turno TEXT NOT NULL,
+            horario_saida TEXT NOT NULL,
+            horario_chegada TEXT,
+            PRIMARY KEY (rota_id, turno, horario_saida)
+        )
+    ''')
+
+def _migracao_versoes_percursos(cursor):
+    """Versões dos percursos para a sincronização incremental"""
+    # Controle de versões dos percursos para sincronização incremental:
+    # um registro por percurso com a versão da última alteração (e lápide
+    # para removidos), mantido por triggers em todo INSERT/UPDATE/DELETE
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'percursos_versoes'")
+    versoes_existentes = cursor.fetchone() is not None
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS percursos_versoes (
+            percurso_id TEXT PRIMARY KEY,
+            versao INTEGER NOT NULL,
+            criado_versao INTEGER NOT NULL,
+            removido INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_percursos_versoes_versao ON percursos_versoes (versao)')
+    if not versoes_existentes:
+        # Percursos gravados antes do controle de versões entram na versão 1
+        cursor.execute('INSERT INTO percursos_versoes (percurso_id, versao, criado_versao) SELECT id, 1, 1 FROM percursos')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_percursos_versao_insert AFTER INSERT ON percursos
+        BEGIN
+            INSERT INTO percursos_versoes (percurso_id, versao, criado_versao, removido)
+            VALUES (new.id, (SELECT COALESCE(MAX(versao), 0) + 1 FROM percursos_versoes),
+                    (SELECT COALESCE(MAX(versao), 0) + 1 FROM percursos_versoes), 0)
+            ON CONFLICT (percurso_id) DO UPDATE SET
+                versao = excluded.versao, criado_versao = excluded.criado_versao, removido = 0;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_percursos_versao_update AFTER UPDATE ON percursos
+        BEGIN
+            INSERT INTO percursos_versoes (percurso_id, versao, criado_versao, removido)
+            VALUES (new.id, (SELECT COALESCE(MAX(versao), 0) + 1 FROM percursos_versoes), 0, 0)
+            ON CONFLICT (percurso_id) DO UPDATE SET versao = excluded.versao;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_percursos_versao_delete AFTER DELETE ON percursos
+        BEGIN
+            INSERT INTO percursos_versoes (percurso_id, versao, criado_versao, removido)
+            VALUES (old.id, (SELECT COALESCE(MAX(versao), 0) + 1 FROM percursos_versoes), 0, 1)
+            ON CONFLICT (percurso_id) DO UPDATE SET versao = excluded.versao, removido = 1;
+        END
+    ''')
+
+def _migracao_busca_observacoes(cursor):
+    """Índice FTS5 das observações"""
+    # Busca textual nas observações (FTS5, sem distinção de acentos e
+    # maiúsculas). O rowid do índice é o rowid do percurso; só observações
+    # não vazias são indexadas.
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'percursos_busca'")
+    busca_existente = cursor.fetchone() is not None
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS percursos_busca
+        USING fts5(observacoes, tokenize = 'unicode61 remove_diacritics 2')
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_percursos_busca_insert AFTER INSERT ON percursos
+        WHEN COALESCE(new.observacoes, '') <> ''
+        BEGIN
+            INSERT INTO percursos_busca (rowid, observacoes) VALUES (new.rowid, new.observacoes);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_percursos_busca_update AFTER UPDATE OF observacoes ON percursos
+        WHEN old.observacoes IS NOT new.observacoes
+        BEGIN
+            DELETE FROM percursos_busca WHERE rowid = old.rowid;
+            INSERT INTO percursos_busca (rowid, observacoes)
+            SELECT new.rowid, new.observacoes WHERE COALESCE(new.observacoes, '') <> '';
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_percursos_busca_delete AFTER DELETE ON percursos
+        WHEN COALESCE(old.observacoes, '') <> ''
+        BEGIN
+            DELETE FROM percursos_busca WHERE rowid = old.rowid;
+        END
+    ''')
+    if not busca_existente:
+        _reconstruir_busca_percursos(cursor)
+
+def _migracao_indice_slot_atrasos(cursor):
+    """Índice de cobertura dos indicadores por slot"""
+    # Índice de cobertura para indicadores por slot: agrupa por slot na ordem
+    # do índice e lê data e atrasos sem acessar a tabela
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_percursos_slot_atrasos
+        ON percursos (rota_id, turno, horario_saida_programado, data, atraso_saida, atraso_chegada)
+    ''')
+
+def _migracao_alertas(cursor):
+    """Estatísticas incrementais de atraso e alertas"""
+    # Estatísticas acumuladas de atraso (Welford + EWMA) por rota/slot e
+    # alertas gerados a partir delas (ver alertas.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS estatisticas_atraso (
+            rota_id TEXT NOT NULL,
+            turno TEXT NOT NULL,
+            horario_saida_programado TEXT NOT NULL,
+            metrica TEXT NOT NULL,
+            n INTEGER NOT NULL DEFAULT 0,
+            media REAL NOT NULL DEFAULT 0,
+            m2 REAL NOT NULL DEFAULT 0,
+            ewma REAL,
+            PRIMARY KEY (rota_id, turno, horario_saida_programado, metrica)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS alertas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tipo TEXT NOT NULL,
+            metrica TEXT NOT NULL,
+            percurso_id TEXT NOT NULL,
+            rota_id TEXT NOT NULL,
+            nome_rota TEXT,
+            turno TEXT,
+            horario_saida_programado TEXT,
+            data TEXT,
+            valor REAL,
+            media REAL,
+            desvio REAL,
+            zscore REAL,
+            criado_em TEXT NOT NULL,
+            UNIQUE (percurso_id, tipo, metrica)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS alertas_estado (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            versao INTEGER NOT NULL
+        )
+    ''')
+
+def _migracao_previsoes(cursor):
+    """Previsões de atraso por slot"""
+    # Previsões de atraso por slot e dia (ver previsao.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS previsoes (
+            rota_id TEXT NOT NULL,
+            turno TEXT NOT NULL,
+            horario_saida_programado TEXT NOT NULL,
+            data TEXT NOT NULL,
+            atraso_saida_previsto REAL,
+            atraso_chegada_previsto REAL,
+            erro_medio_saida REAL,
+            erro_medio_chegada REAL,
+            amostras INTEGER NOT NULL,
+            modelo TEXT NOT NULL,
+            gerado_em TEXT NOT NULL,
+            PRIMARY KEY (data, rota_id, turno, horario_saida_programado)
+        )
+    ''')
+
+def _migracao_horarios_absolutos(cursor):
+    """Data e hora absolutas das saídas e chegadas (programadas e reais)"""
+    # `data` é o dia de operação: no segundo turno (da tarde até a madrugada),
+    # horários antes de 12:00 já caem no dia seguinte. A chegada programada é a
+    # primeira ocorrência do horário depois da saída, e os horários reais ficam
+    # a menos de 12 h do programado (regra de calcular_atraso). São colunas
+    # geradas: valem para qualquer gravação, e a criação do índice calcula os
+    # valores das linhas já existentes.
+    saida = _sql_minutos('horario_saida_programado')
+    chegada = _sql_minutos('horario_chegada_programado')
+    
+    def no_dia_de_operacao(minutos):
+        return f"({minutos} + CASE WHEN turno = 'segundo_turno' AND {minutos} < 720 THEN 1440 ELSE 0 END)"
+    
+    def perto_de(minutos_real, minutos_programado):
+        # diferença levada para [-720, 720], como em calcular_atraso
+        diferenca = f'({minutos_real} - {minutos_programado})'
+        return f'(({diferenca} + 2160) % 1440 - 720 + 1440 * ({diferenca} = 720))'
+    
+    saida_programada = no_dia_de_operacao(saida)
+    chegada_programada = (f'(CASE WHEN {saida} IS NULL THEN {no_dia_de_operacao(chegada)} '
+                          f'ELSE {saida_programada} + ({chegada} - {saida} + 1440) % 1440 END)')
+    colunas = {
+        'saida_programada_em': saida_programada,
+        'chegada_programada_em': chegada_programada,
+        'saida_real_em': f"({saida_programada} + {perto_de(_sql_minutos('horario_saida_real'), saida)})",
+        'chegada_real_em': f"({chegada_programada} + {perto_de(_sql_minutos('horario_chegada_real'), chegada)})",
+    }
+    
+    cursor.execute('PRAGMA table_xinfo(percursos)')
+    existentes = {row[1] for row in cursor.fetchall()}
+    for coluna, minutos in colunas.items():
+        if coluna not in existentes:
+            cursor.execute(f"""
+                ALTER TABLE percursos ADD COLUMN {coluna} TEXT GENERATED ALWAYS AS (
+                    strftime('%Y-%m-%dT%H:%M', data, {minutos} || ' minutes')
+                ) VIRTUAL
+            """)
+    
+    # Janelas de operação (desde/ate) viram varredura de faixa no índice
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_percursos_saida_programada_em
+        ON percursos (saida_programada_em)
+    ''')
+
+def _migracao_horizonte_lapides(cursor):
+    """Horizonte das lápides de percursos removidos"""
+    # Lápides antigas de percursos_versoes são descartadas (purgar_lapides);
+    # o horizonte é a maior versão descartada, e quem sincroniza a partir de
+    # uma versão anterior a ele recebe a lista completa
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS percursos_versoes_horizonte (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            versao INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO percursos_versoes_horizonte (id, versao) VALUES (1, 0)')
+
+MIGRACOES = [
+    (1, 'Tabelas de rotas, percursos e usuários', _migracao_esquema_inicial),
+    (2, 'Usuário admin e rotas padrão', _migracao_dados_iniciais),
+    (3, 'Chave natural e índice por dia/slot dos percursos', _migracao_chave_natural),
+    (4, 'Escala expandida (escala_slots)', _migracao_escala_slots),
+    (5, 'Versões de percursos para sincronização', _migracao_versoes_percursos),
+    (6, 'Busca FTS5 nas observações', _migracao_busca_observacoes),
+    (7, 'Índice de atrasos por slot', _migracao_indice_slot_atrasos),
+    (8, 'Estatísticas de atraso e alertas', _migracao_alertas),
+    (9, 'Previsões de atraso', _migracao_previsoes),
+    (10, 'Horários absolutos dos percursos', _migracao_horarios_absolutos),
+    (11, 'Horizonte das lápides de percursos', _migracao_horizonte_lapides),
+]
+
+VERSAO_ESQUEMA = MIGRACOES[-1][0]
+
+def versao_esquema(conn):
+    """Versão do esquema aplicada ao banco (0 se nunca foi migrado)"""
+    try:
+        return conn.execute('SELECT MAX(versao) FROM schema_version').fetchone()[0] or 0
+    except sqlite3.OperationalError:
+        return 0
+
+def _aplicar_migracoes(conn):
+    """Aplica as migrações pendentes, cada uma em sua transação"""
+    conn.isolation_level = None  # transações controladas manualmente
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            versao INTEGER PRIMARY KEY,
+            descricao TEXT NOT NULL,
+            aplicada_em TEXT NOT NULL,
+            duracao_ms REAL NOT NULL
+        )
+    ''')
+    
+    aplicadas = []
+    cursor = conn.cursor()
+    for versao, descricao, migracao in MIGRACOES:
+        inicio = time.perf_counter()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            # Outro processo pode ter aplicado enquanto esperávamos o lock
+            if versao <= versao_esquema(conn):
+                cursor.execute('COMMIT')
+                continue
+            migracao(cursor)
+            duracao_ms = round((time.perf_counter() - inicio) * 1000, 1)
+            cursor.execute(
+                'INSERT INTO schema_version (versao, descricao, aplicada_em, duracao_ms) VALUES (?, ?, ?, ?)',
+                (versao, descricao, datetime.now().isoformat(), duracao_ms)
             )
-        ''')
-        conn.commit()
+            cursor.execute('COMMIT')
+        except Exception:
+            cursor.execute('ROLLBACK')
+            raise
+        aplicadas.append({'versao': versao, 'descricao': descricao, 'duracao_ms': duracao_ms})
+    return aplicadas
 
-        # Cria admin padrão se base estiver vazia
-        cursor.execute('SELECT COUNT(*) FROM usuarios')
-        if cursor.fetchone()[0] == 0:
-            criar_usuario('admin', 'Administrador', 'admin', is_admin=True)
-        
-        conn.commit()
-        
-        # Inserir dados padrão se a tabela de rotas estiver vazia
-        cursor.execute('SELECT COUNT(*) FROM rotas')
-        if cursor.fetchone()[0] == 0:
-            inserir_dados_padrao()
+def inicializar_banco():
+    """Cria/atualiza o esquema aplicando as migrações pendentes.
+    
+    Com o banco em dia, faz apenas uma leitura da versão. Retorna um resumo com
+    a versão final, as migrações aplicadas e o tempo gasto.
+    """
+    inicio = time.perf_counter()
+    with obter_conexao() as conn:
+        versao_inicial = versao_esquema(conn)
+        aplicadas = _aplicar_migracoes(conn) if versao_inicial < VERSAO_ESQUEMA else []
+    
+    return {
+        'versao_inicial': versao_inicial,
+        'versao': max([versao_inicial] + [m['versao'] for m in aplicadas]),
+        'migracoes': aplicadas,
+        'tempo_ms': round((time.perf_counter() - inicio) * 1000, 1)
+    }
+
+def _deduplicar_percursos(cursor):
+    """Remove percursos repetidos na chave natural, mantendo o mais recente de cada grupo"""
+    cursor.execute('''
+        DELETE FROM percursos
+        WHERE rowid IN (
+            SELECT rowid FROM (
+                SELECT rowid, ROW_NUMBER() OVER (
+                    PARTITION BY rota_id, data, turno, horario_saida_programado
+                    ORDER BY COALESCE(data_atualizacao, data_criacao) DESC, rowid DESC
+                ) AS ordem
+                FROM percursos
+                WHERE horario_saida_programado IS NOT NULL
+            )
+            WHERE ordem > 1
+        )
+    ''')
+    return cursor.rowcount
 
-def inserir_dados_padrao():
-    """Insere dados padrão das rotas"""
+def inserir_dados_padrao(cursor=None):
+    """Insere dados padrão das rotas (no cursor informado ou em conexão própria)"""
     rotas_padrao = [
         {
             "id": "CANAA",
@@ -620,14 +1139,17 @@ def inserir_dados_padrao():
         }
     ]
     
-    with obter_conexao() as conn:
-        cursor = conn.cursor()
-        for rota in rotas_padrao:
-            cursor.execute('''
-                INSERT INTO rotas (id, nome, ativa, horarios) 
-                VALUES (?, ?, ?, ?)
-            ''', (rota['id'], rota['nome'], 1 if rota['ativa'] else 0, json.dumps(rota['horarios'])))
-        conn.commit()
+    if cursor is None:
+        with obter_conexao() as conn:
+            inserir_dados_padrao(conn.cursor())
+            conn.commit()
+        return
+    
+    for rota in rotas_padrao:
+        cursor.execute('''
+            INSERT INTO rotas (id, nome, ativa, horarios) 
+            VALUES (?, ?, ?, ?)
+        ''', (rota['id'], rota['nome'], 1 if rota['ativa'] else 0, json.dumps(rota['horarios'])))
 
 # === FUNÇÕES PARA ROTAS ===
 
@@ -651,6 +1173,14 @@ def carregar_rotas_config():
         return {'rotas': rotas}
 
 
+def _rota_para_dict(row):
+    return {
+        'id': row['id'],
+        'nome': row['nome'],
+        'ativa': bool(row['ativa']),
+        'horarios': json.loads(row['horarios'])
+    }
+
 def obter_rota_por_id(rota_id):
     """Obtém uma rota específica por ID"""
     with obter_conexao() as conn:
@@ -659,327 +1189,696 @@ def obter_rota_por_id(rota_id):
         row = cursor.fetchone()
         
         if row:
-            return {
-                'id': row['id'],
-                'nome': row['nome'],
-                'ativa': bool(row['ativa']),
-                'horarios': json.loads(row['horarios'])
-            }
+            return _rota_para_dict(row)
         return None
 
+def _criar_rota(conn, rota_data):
+    conn.execute('''
+        INSERT INTO rotas (id, nome, ativa, horarios) 
+        VALUES (?, ?, ?, ?)
+    ''', (rota_data['id'], rota_data['nome'], 1 if rota_data['ativa'] else 0, json.dumps(rota_data['horarios'])))
+    _notificar_ganchos_rota(conn, rota_data['id'])
+    return rota_data
+
 def criar_rota(rota_data):
     """Cria uma nova rota"""
-    with obter_conexao() as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO rotas (id, nome, ativa, horarios) 
-            VALUES (?, ?, ?, ?)
-        ''', (rota_data['id'], rota_data['nome'], 1 if rota_data['ativa'] else 0, json.dumps(rota_data['horarios'])))
-        conn.commit()
-        return rota_data
+    return executar_escrita(_criar_rota, rota_data)
+
+def _atualizar_rota(conn, rota_id, valores):
+    if not valores:
+        return conn.execute('SELECT * FROM rotas WHERE id = ?', (rota_id,)).fetchone()
+    
+    atribuicoes = ', '.join(f'{campo} = :{campo}' for campo in valores)
+    row = conn.execute(
+        f'UPDATE rotas SET {atribuicoes} WHERE id = :id RETURNING *', {**valores, 'id': rota_id}
+    ).fetchone()
+    if row:
+        _notificar_ganchos_rota(conn, rota_id)
+    return row
 
 def atualizar_rota(rota_id, dados_atualizacao):
-    """Atualiza uma rota existente"""
-    with obter_conexao() as conn:
-        cursor = conn.cursor()
-        
-        # Obter rota atual
-        cursor.execute('SELECT * FROM rotas WHERE id = ?', (rota_id,))
-        row = cursor.fetchone()
-        
-        if not row:
-            return None
-        
-        # Atualizar dados
-        rota_atual = {
-            'id': row['id'],
-            'nome': row['nome'],
-            'ativa': bool(row['ativa']),
-            'horarios': json.loads(row['horarios'])
-        }
-        
-        rota_atual.update(dados_atualizacao)
-        
-        # Salvar no banco
-        cursor.execute('''
-            UPDATE rotas 
-            SET nome = ?, ativa = ?, horarios = ? 
-            WHERE id = ?
-        ''', (rota_atual['nome'], 1 if rota_atual['ativa'] else 0, json.dumps(rota_atual['horarios']), rota_id))
-        
-        conn.commit()
-        return rota_atual
+    """Atualiza só os campos enviados de uma rota, devolvendo a rota gravada"""
+    valores = {}
+    if 'nome' in dados_atualizacao:
+        valores['nome'] = dados_atualizacao['nome']
+    if 'ativa' in dados_atualizacao:
+        valores['ativa'] = 1 if dados_atualizacao['ativa'] else 0
+    if 'horarios' in dados_atualizacao:
+        valores['horarios'] = json.dumps(dados_atualizacao['horarios'])
+    
+    row = executar_escrita(_atualizar_rota, rota_id, valores)
+    return _rota_para_dict(row) if row else None
+
+def _deletar_rota(conn, rota_id):
+    row = conn.execute('DELETE FROM rotas WHERE id = ? RETURNING *', (rota_id,)).fetchone()
+    if row:
+        _notificar_ganchos_rota(conn, rota_id)
+    return row
 
 def deletar_rota(rota_id):
-    """Deleta uma rota"""
-    with obter_conexao() as conn:
-        cursor = conn.cursor()
-        
-        # Obter rota antes de deletar
-        cursor.execute('SELECT * FROM rotas WHERE id = ?', (rota_id,))
-        row = cursor.fetchone()
-        
-        if not row:
-            return None
-        
-        rota_removida = {
-            'id': row['id'],
-            'nome': row['nome'],
-            'ativa': bool(row['ativa']),
-            'horarios': json.loads(row['horarios'])
-        }
-        
-        # Deletar rota
-        cursor.execute('DELETE FROM rotas WHERE id = ?', (rota_id,))
-        conn.commit()
-        
-        return rota_removida
+    """Deleta uma rota, devolvendo a rota removida"""
+    row = executar_escrita(_deletar_rota, rota_id)
+    return _rota_para_dict(row) if row else None
 
 # === FUNÇÕES PARA PERCURSOS ===
 
+CAMPOS_PERCURSO = (
+    'id', 'rota_id', 'nome_rota', 'data', 'turno',
+    'horario_saida_programado', 'horario_chegada_programado',
+    'horario_saida_real', 'horario_chegada_real',
+    'atraso_saida', 'atraso_chegada', 'observacoes',
+    'data_criacao', 'data_atualizacao',
+    'saida_programada_em', 'chegada_programada_em', 'saida_real_em', 'chegada_real_em'
+)
+
+# Data e hora absolutas ('AAAA-MM-DDTHH:MM'), calculadas pelo banco a partir de
+# data, turno e horários (colunas geradas, ver _migracao_horarios_absolutos)
+CAMPOS_PERCURSO_CALCULADOS = ('saida_programada_em', 'chegada_programada_em', 'saida_real_em', 'chegada_real_em')
+
+def _expressao_coluna(campo):
+    """Expressão SQL de uma coluna de percurso (observações nulas viram '')"""
+    return "COALESCE(observacoes, '') AS observacoes" if campo == 'observacoes' else campo
+
+# Colunas na ordem de CAMPOS_PERCURSO
+_COLUNAS_PERCURSO_SQL = ', '.join(_expressao_coluna(campo) for campo in CAMPOS_PERCURSO)
+
+# Campos que podem ser alterados em atualizar_percurso
+CAMPOS_PERCURSO_EDITAVEIS = (frozenset(CAMPOS_PERCURSO) - {'id', 'data_criacao', 'data_atualizacao'}
+                             - frozenset(CAMPOS_PERCURSO_CALCULADOS))
+
+# Atraso -> (horário programado, horário real) de que ele depende
+_ATRASOS_PERCURSO = {
+    'atraso_saida': ('horario_saida_programado', 'horario_saida_real'),
+    'atraso_chegada': ('horario_chegada_programado', 'horario_chegada_real'),
+}
+
+# Colunas do registro anterior passadas aos ganchos de percurso: chave do slot,
+# horários reais e atrasos
+CAMPOS_PERCURSO_ANTERIOR = ('id', 'rota_id', 'turno', 'horario_saida_programado',
+                            'horario_saida_real', 'horario_chegada_real', 'atraso_saida', 'atraso_chegada')
+
+def _sql_minutos(expressao):
+    """Minutos desde 00:00 de um horário 'HH:MM' (NULL se vazio ou inválido), em SQL"""
+    return (f"CASE WHEN {expressao} GLOB '[0-2][0-9]:[0-5][0-9]' AND substr({expressao}, 1, 2) < '24' "
+            f"THEN CAST(substr({expressao}, 1, 2) AS INTEGER) * 60 + CAST(substr({expressao}, 4, 2) AS INTEGER) END")
+
+def _sql_atraso(programado, real):
+    """Atraso em minutos em SQL, com a regra de servidor.calcular_atraso (virada da meia-noite; 0 sem horário)"""
+    return (f'(SELECT COALESCE(CASE WHEN d > 720 THEN d - 1440 WHEN d < -720 THEN d + 1440 ELSE d END, 0) '
+            f'FROM (SELECT {_sql_minutos(real)} - {_sql_minutos(programado)} AS d))')
+
+class _AcessoPorNome:
+    """Acesso estilo dict (`p['campo']`, `p.get()`) para registros namedtuple"""
+    __slots__ = ()
+
+    def __getitem__(self, chave):
+        if isinstance(chave, str):
+            try:
+                return getattr(self, chave)
+            except AttributeError:
+                raise KeyError(chave) from None
+        return tuple.__getitem__(self, chave)
+
+    def get(self, chave, padrao=None):
+        return getattr(self, chave, padrao)
+
+    def keys(self):
+        return self._fields
+
+    def para_dict(self):
+        """Mapeamento pronto para JSON"""
+        return dict(zip(self._fields, self))
+
+class Percurso(_AcessoPorNome, namedtuple('_PercursoBase', CAMPOS_PERCURSO)):
+    """Linha de percurso apoiada em tupla (sem dict por linha).
+
+    Aceita acesso por atributo (`p.data`) e, por compatibilidade com o código que
+    usava dicts, `p['data']` e `p.get('data')`. A conversão para dict só acontece
+    na serialização, via `para_dict()`.
+    """
+    __slots__ = ()
+
+@lru_cache(maxsize=64)
+def _tipo_percurso(campos):
+    """Tipo de registro para uma projeção de colunas (Percurso se forem todas)"""
+    if campos == CAMPOS_PERCURSO:
+        return Percurso
+    base = namedtuple('_PercursoParcialBase', campos)
+    return type('PercursoParcial', (_AcessoPorNome, base), {'__slots__': ()})
+
+def validar_campos_percurso(campos):
+    """Valida uma projeção contra CAMPOS_PERCURSO, retornando a tupla normalizada"""
+    campos = tuple(dict.fromkeys(campos))
+    invalidos = [c for c in campos if c not in CAMPOS_PERCURSO]
+    if invalidos or not campos:
+        raise ValueError(f'Campos inválidos: {", ".join(invalidos) or "(vazio)"}. '
+                         f'Permitidos: {", ".join(CAMPOS_PERCURSO)}')
+    return campos
+
+def _fabrica_percurso(cursor, row):
+    """row_factory: cria o Percurso direto da tupla do SQLite"""
+    return tuple.__new__(Percurso, row)
+
+def percursos_para_json(percursos):
+    """Converte uma lista de registros de percurso em lista de dicts para serialização"""
+    if not percursos:
+        return []
+    campos = percursos[0]._fields
+    return [dict(zip(campos, p)) for p in percursos]
+
+def _consultar_percursos(conn, sufixo='', params=(), campos=None):
+    """Executa SELECT das colunas de percurso (ou de uma projeção delas) retornando registros"""
+    cursor = conn.cursor()
+    if campos is None:
+        cursor.row_factory = _fabrica_percurso
+        colunas = _COLUNAS_PERCURSO_SQL
+    else:
+        campos = validar_campos_percurso(campos)
+        tipo = _tipo_percurso(campos)
+        cursor.row_factory = lambda _cursor, row: tuple.__new__(tipo, row)
+        colunas = ', '.join(_expressao_coluna(campo) for campo in campos)
+    cursor.execute(f'SELECT {colunas} FROM percursos' + sufixo, params)
+    return cursor
+
 def carregar_percursos():
     """Carrega os dados de percursos do banco de dados"""
     with obter_conexao() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM percursos ORDER BY data_criacao DESC')
-        rows = cursor.fetchall()
-        
-        percursos = []
-        for row in rows:
-            percurso = {
-                'id': row['id'],
-                'rota_id': row['rota_id'],
-                'nome_rota': row['nome_rota'],
-                'data': row['data'],
-                'turno': row['turno'],
-                'horario_saida_programado': row['horario_saida_programado'],
-                'horario_chegada_programado': row['horario_chegada_programado'],
-                'horario_saida_real': row['horario_saida_real'],
-                'horario_chegada_real': row['horario_chegada_real'],
-                'atraso_saida': row['atraso_saida'],
-                'atraso_chegada': row['atraso_chegada'],
-                'observacoes': row['observacoes'] or '',
-                'data_criacao': row['data_criacao'],
-                'data_atualizacao': row['data_atualizacao']
-            }
-            percursos.append(percurso)
-        
+        percursos = _consultar_percursos(conn, ' ORDER BY data_criacao DESC').fetchall()
         return {'percursos': percursos}
 
+def normalizar_momento(valor):
+    """Data/hora ISO (ex.: 2025-07-01T22:00 ou '2025-07-01 22:00') no formato das colunas *_em"""
+    return datetime.fromisoformat(valor).strftime('%Y-%m-%dT%H:%M')
 
-def obter_percursos_filtrados(rota_id=None, data_inicio=None, data_fim=None, turno=None):
-    """Obtém percursos com filtros aplicados"""
+def montar_filtros_percursos(rota_id=None, data_inicio=None, data_fim=None, turno=None, desde=None, ate=None):
+    """Monta a cláusula WHERE e os parâmetros dos filtros de percursos.
+    
+    `desde`/`ate` (inclusivos) filtram pela saída programada absoluta
+    (`saida_programada_em`), usando o índice dessa coluna.
+    """
+    query = ' WHERE 1=1'
+    params = []
+    
+    if rota_id:
+        query += ' AND rota_id = ?'
+        params.append(rota_id)
+    
+    if data_inicio:
+        query += ' AND data >= ?'
+        params.append(data_inicio)
+    
+    if data_fim:
+        query += ' AND data <= ?'
+        params.append(data_fim)
+    
+    if turno:
+        query += ' AND turno = ?'
+        params.append(turno)
+    
+    if desde:
+        query += ' AND saida_programada_em >= ?'
+        params.append(normalizar_momento(desde))
+    
+    if ate:
+        query += ' AND saida_programada_em <= ?'
+        params.append(normalizar_momento(ate))
+    
+    return query, params
+
+def obter_percursos_filtrados(rota_id=None, data_inicio=None, data_fim=None, turno=None, campos=None,
+                              desde=None, ate=None):
+    """Obtém percursos com filtros aplicados.
+    
+    `campos` restringe as colunas lidas do banco (projeção); os registros
+    retornados têm apenas esses campos.
+    """
+    with obter_conexao() as conn:
+        filtros, params = montar_filtros_percursos(rota_id, data_inicio, data_fim, turno, desde, ate)
+        # rowid desempata percursos criados no mesmo instante (importações), como em agregar_atrasos_por_rota
+        return _consultar_percursos(conn, filtros + ' ORDER BY data_criacao DESC, rowid DESC', params,
+                                    campos).fetchall()
+
+def _expressao_busca(texto):
+    """Converte o texto digitado em consulta FTS5: todas as palavras, aceitando prefixos"""
+    palavras = re.findall(r'\w+', texto or '')
+    if not palavras:
+        raise ValueError('Informe ao menos uma palavra para a busca')
+    return ' '.join(f'"{palavra}"*' for palavra in palavras)
+
+def buscar_percursos(texto, rota_id=None, data_inicio=None, data_fim=None, turno=None, campos=None,
+                     desde=None, ate=None):
+    """Busca percursos pelas observações, do mais ao menos relevante.
+    
+    Aceita os mesmos filtros de `obter_percursos_filtrados`. Retorna pares
+    (registro, trecho), onde o trecho é a parte da observação encontrada com os
+    termos entre colchetes.
+    """
+    filtros, params = montar_filtros_percursos(rota_id, data_inicio, data_fim, turno, desde, ate)
+    if campos is None:
+        colunas, tipo = _COLUNAS_PERCURSO_SQL, Percurso
+    else:
+        campos = validar_campos_percurso(campos)
+        colunas, tipo = ', '.join(map(_expressao_coluna, campos)), _tipo_percurso(campos)
+    
     with obter_conexao() as conn:
         cursor = conn.cursor()
-        
-        query = 'SELECT * FROM percursos WHERE 1=1'
-        params = []
-        
-        if rota_id:
-            query += ' AND rota_id = ?'
-            params.append(rota_id)
-        
-        if data_inicio:
-            query += ' AND data >= ?'
-            params.append(data_inicio)
-        
-        if data_fim:
-            query += ' AND data <= ?'
-            params.append(data_fim)
-        
-        if turno:
-            query += ' AND turno = ?'
-            params.append(turno)
-        
-        query += ' ORDER BY data_criacao DESC'
-        
+        cursor.row_factory = lambda _cursor, row: (tuple.__new__(tipo, row[:-1]), row[-1])
+        cursor.execute(f'''
+            SELECT {colunas}, b.trecho
+            FROM (
+                SELECT rowid AS busca_rowid, rank AS relevancia,
+                       snippet(percursos_busca, 0, '[', ']', '…', 12) AS trecho
+                FROM percursos_busca WHERE percursos_busca MATCH ?
+            ) b
+            JOIN percursos ON percursos.rowid = b.busca_rowid
+        ''' + filtros + ' ORDER BY b.relevancia, data_criacao DESC', [_expressao_busca(texto), *params])
+        return cursor.fetchall()
+
+def iterar_percursos_filtrados(colunas, rota_id=None, data_inicio=None, data_fim=None, turno=None,
+                               ordenacao='data_criacao DESC', tamanho_lote=1000, desde=None, ate=None):
+    """Itera tuplas de percursos filtrados direto do cursor, em lotes.
+    
+    A conexão fica aberta enquanto o gerador é consumido, de modo que a memória
+    usada não depende da quantidade de linhas (usado nas exportações em streaming).
+    A fonte de leitura (e o banco) é fixada na chamada: o gerador costuma ser
+    consumido depois que a view já retornou.
+    """
+    filtros, params = montar_filtros_percursos(rota_id, data_inicio, data_fim, turno, desde, ate)
+    query = f'SELECT {", ".join(colunas)} FROM percursos' + filtros + f' ORDER BY {ordenacao}'
+    fonte = _fonte_leitura.get() or partial(_nova_conexao, banco_atual())
+    return _iterar_consulta(query, params, tamanho_lote, fonte)
+
+def _iterar_consulta(query, params, tamanho_lote, fonte):
+    conn = _abrir_conexao(fonte)
+    try:
+        cursor = conn.cursor()
+        cursor.row_factory = None  # tuplas simples são mais baratas que sqlite3.Row
         cursor.execute(query, params)
-        rows = cursor.fetchall()
-        
-        percursos = []
-        for row in rows:
-            percurso = {
-                'id': row['id'],
-                'rota_id': row['rota_id'],
-                'nome_rota': row['nome_rota'],
-                'data': row['data'],
-                'turno': row['turno'],
-                'horario_saida_programado': row['horario_saida_programado'],
-                'horario_chegada_programado': row['horario_chegada_programado'],
-                'horario_saida_real': row['horario_saida_real'],
-                'horario_chegada_real': row['horario_chegada_real'],
-                'atraso_saida': row['atraso_saida'],
-                'atraso_chegada': row['atraso_chegada'],
-                'observacoes': row['observacoes'] or '',
-                'data_criacao': row['data_criacao'],
-                'data_atualizacao': row['data_atualizacao']
-            }
-            percursos.append(percurso)
-        
-        return percursos
+        while True:
+            rows = cursor.fetchmany(tamanho_lote)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        conn.close()
 
-def criar_percurso(percurso_data):
-    """Cria um novo percurso"""
+def agregar_atrasos_por_rota(rota_id=None, data_inicio=None, data_fim=None, turno=None, desde=None, ate=None):
+    """Agregados parciais do relatório de atrasos por rota, calculados no SQLite.
+    
+    Retorna {nome_rota: tupla na ordem de agregados.CAMPOS_PARCIAIS}; parciais
+    de bancos ou períodos diferentes se combinam com agregados.combinar_parciais.
+    O último valor identifica o percurso mais recente da rota (data de criação
+    e rowid, como na ordenação de obter_percursos_filtrados).
+    """
+    filtros, params = montar_filtros_percursos(rota_id, data_inicio, data_fim, turno, desde, ate)
     with obter_conexao() as conn:
         cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(f'''
+            SELECT nome_rota,
+                   COUNT(*),
+                   SUM(atraso_saida), MAX(atraso_saida), SUM(atraso_saida <= 0),
+                   SUM(CASE WHEN atraso_chegada > 0 THEN atraso_chegada ELSE 0 END),
+                   SUM(atraso_chegada > 0), MAX(atraso_chegada), SUM(atraso_chegada <= 0),
+                   MAX(data_criacao || char(9) || printf('%012d', rowid))
+            FROM percursos{filtros}
+            GROUP BY nome_rota
+        ''', params)
+        return {row[0]: row[1:] for row in cursor}
+
+def _datas_da_janela(data_inicio, data_fim, desde, ate):
+    """Período de `data` que contém todos os percursos com saída programada entre `desde` e `ate`.
+    
+    A saída programada cai no dia de operação ou, no segundo turno, na
+    madrugada seguinte; o período resultante vai de um dia antes de `desde`
+    até o dia de `ate`, limitado por `data_inicio`/`data_fim`.
+    """
+    if desde:
+        dia = (datetime.fromisoformat(desde) - timedelta(days=1)).strftime('%Y-%m-%d')
+        data_inicio = max(data_inicio, dia) if data_inicio else dia
+    if ate:
+        dia = datetime.fromisoformat(ate).strftime('%Y-%m-%d')
+        data_fim = min(data_fim, dia) if data_fim else dia
+    return data_inicio, data_fim
+
+def contar_percursos_por_rota(rota_id=None, data_inicio=None, data_fim=None, turno=None, desde=None, ate=None):
+    """Quantidade de percursos de cada rota no período: {rota_id: total}.
+    
+    Conta só pelo índice da chave natural (rota_id, data, ...): as rotas saem
+    do próprio índice, saltando de uma para a próxima, e cada uma é contada na
+    sua faixa de datas. A janela `desde`/`ate` vira o período de datas que a
+    contém (`_datas_da_janela`), então a contagem inclui percursos desses dias
+    fora da janela.
+    """
+    data_inicio, data_fim = _datas_da_janela(data_inicio, data_fim, desde, ate)
+    with obter_conexao() as conn:
+        if rota_id:
+            rotas = [rota_id]
+        else:
+            rotas = [row[0] for row in conn.execute('''
+                WITH RECURSIVE rotas(id) AS (
+                    SELECT MIN(rota_id) FROM percursos
+                    UNION ALL
+                    SELECT (SELECT MIN(rota_id) FROM percursos WHERE rota_id > rotas.id)
+                    FROM rotas WHERE id IS NOT NULL
+                )
+                SELECT id FROM rotas WHERE id IS NOT NULL
+            ''')]
+        contagens = {}
+        for rota in rotas:
+            filtros, params = montar_filtros_percursos(rota, data_inicio, data_fim, turno)
+            total = conn.execute(f'SELECT COUNT(*) FROM percursos{filtros}', params).fetchone()[0]
+            if total:
+                contagens[rota] = total
+        return contagens
+
+def agregar_atrasos_por_estrato(rowids=None, rota_id=None, data_inicio=None, data_fim=None, turno=None,
+                                desde=None, ate=None):
+    """Somas, somas dos quadrados e máximos dos atrasos por rota, para amostragem.
+    
+    Lê os mesmos percursos contados por `contar_percursos_por_rota` (com
+    `rowids`, só os desses rowids: a amostra do relatório aproximado) e agrupa
+    por (rota_id, nome_rota, na_janela), onde na_janela indica se a saída
+    programada está entre `desde` e `ate`. Retorna {chave: tupla na ordem de
+    amostragem.CAMPOS_ESTRATO}.
+    """
+    data_inicio, data_fim = _datas_da_janela(data_inicio, data_fim, desde, ate)
+    filtros, params = montar_filtros_percursos(rota_id, data_inicio, data_fim, turno)
+    condicoes = (['saida_programada_em >= ?'] if desde else []) + (['saida_programada_em <= ?'] if ate else [])
+    params_janela = [normalizar_momento(momento) for momento in (desde, ate) if momento]
+    na_janela = f'COALESCE({" AND ".join(condicoes)}, 0)' if condicoes else '1'
+    origem = 'percursos'
+    if rowids is not None:
+        # CROSS JOIN fixa a ordem: uma busca por rowid para cada sorteado, em vez de varrer o período
+        origem = 'json_each(?) AS amostra CROSS JOIN percursos ON percursos.rowid = amostra.value'
+        params_janela.append(json.dumps(sorted(rowids)))
+    with obter_conexao() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(f'''
+            SELECT rota_id, nome_rota, {na_janela},
+                   COUNT(*),
+                   SUM(atraso_saida), SUM(atraso_saida * atraso_saida), MAX(atraso_saida),
+                   SUM(atraso_saida <= 0),
+                   SUM(CASE WHEN atraso_chegada > 0 THEN atraso_chegada ELSE 0 END),
+                   SUM(CASE WHEN atraso_chegada > 0 THEN atraso_chegada * atraso_chegada ELSE 0 END),
+                   SUM(atraso_chegada > 0), MAX(atraso_chegada), SUM(atraso_chegada <= 0),
+                   MAX(data_criacao || char(9) || printf('%012d', percursos.rowid))
+            FROM {origem}{filtros}
+            GROUP BY 1, 2, 3
+        ''', params_janela + params)
+        return {row[:3]: row[3:] for row in cursor}
+
+def faixa_rowids_percursos():
+    """Menor e maior rowid de percursos (None, None se a tabela estiver vazia)"""
+    with obter_conexao() as conn:
+        return conn.execute(
+            'SELECT (SELECT MIN(rowid) FROM percursos), (SELECT MAX(rowid) FROM percursos)'
+        ).fetchone()
+
+# Insere ou, se já houver percurso na mesma chave natural (rota, dia, turno e
+# horário programado), atualiza o existente mantendo seu id e data de criação.
+_SQL_UPSERT_PERCURSO = '''
+    INSERT INTO percursos (
+        id, rota_id, nome_rota, data, turno,
+        horario_saida_programado, horario_chegada_programado,
+        horario_saida_real, horario_chegada_real,
+        atraso_saida, atraso_chegada, observacoes,
+        data_criacao, data_atualizacao
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (rota_id, data, turno, horario_saida_programado) DO UPDATE SET
+        nome_rota = excluded.nome_rota,
+        horario_chegada_programado = excluded.horario_chegada_programado,
+        horario_saida_real = excluded.horario_saida_real,
+        horario_chegada_real = excluded.horario_chegada_real,
+        atraso_saida = excluded.atraso_saida,
+        atraso_chegada = excluded.atraso_chegada,
+        observacoes = excluded.observacoes,
+        data_atualizacao = excluded.data_criacao
+'''
+
+def _parametros_upsert_percurso(percurso_data):
+    """Completa id/data de criação e monta os parâmetros do upsert"""
+    # Gerar ID se não fornecido
+    if 'id' not in percurso_data:
+        percurso_data['id'] = str(uuid.uuid4())
+    
+    # Data de criação se não fornecida
+    if 'data_criacao' not in percurso_data:
+        percurso_data['data_criacao'] = datetime.now().isoformat()
+    
+    return (
+        percurso_data['id'],
+        percurso_data['rota_id'],
+        percurso_data['nome_rota'],
+        percurso_data['data'],
+        percurso_data['turno'],
+        percurso_data.get('horario_saida_programado'),
+        percurso_data.get('horario_chegada_programado'),
+        percurso_data.get('horario_saida_real'),
+        percurso_data.get('horario_chegada_real'),
+        percurso_data.get('atraso_saida', 0),
+        percurso_data.get('atraso_chegada', 0),
+        percurso_data.get('observacoes', ''),
+        percurso_data['data_criacao'],
+        percurso_data.get('data_atualizacao')
+    )
+
+def _criar_percurso(conn, percurso_data):
+    parametros = _parametros_upsert_percurso(percurso_data)
+    
+    anterior = None
+    if _ganchos_percurso:
+        # Percurso já gravado na mesma chave natural (será atualizado pelo upsert)
+        anterior = _consultar_percursos(
+            conn, ' WHERE rota_id = ? AND data = ? AND turno = ? AND horario_saida_programado = ?',
+            (parametros[1], parametros[3], parametros[4], parametros[5]), campos=CAMPOS_PERCURSO_ANTERIOR
+        ).fetchone()
+    
+    cursor = conn.cursor()
+    cursor.row_factory = _fabrica_percurso
+    cursor.execute(_SQL_UPSERT_PERCURSO + f' RETURNING {_COLUNAS_PERCURSO_SQL}', parametros)
+    # Registro gravado (id e data de criação do existente, se houve conflito)
+    percurso = cursor.fetchone()
+    
+    _notificar_ganchos(conn, anterior, percurso)
+    return percurso
+
+def criar_percurso(percurso_data):
+    """Cria um novo percurso (ou atualiza o existente na mesma chave natural)"""
+    return executar_escrita(_criar_percurso, percurso_data)
+
+def _criar_percursos_em_lote(conn, percursos):
+    if _ganchos_percurso:
+        # Os ganchos precisam do registro anterior e do gravado de cada percurso
+        return sum(1 for percurso in percursos if _criar_percurso(conn, percurso))
+    cursor = conn.cursor()
+    cursor.executemany(_SQL_UPSERT_PERCURSO, (_parametros_upsert_percurso(p) for p in percursos))
+    return cursor.rowcount
+
+def criar_percursos_em_lote(percursos):
+    """Grava vários percursos em uma única transação, com a mesma semântica de upsert"""
+    return executar_escrita(_criar_percursos_em_lote, percursos)
+
+def obter_alteracoes_percursos(desde=0):
+    """Percursos inseridos, atualizados e removidos depois da versão `desde`.
+    
+    Com `desde` <= 0 ou anterior ao horizonte das lápides (ver purgar_lapides)
+    retorna a lista completa (todos como inseridos), que é o ponto de partida
+    da cópia local do cliente. A versão retornada deve ser enviada na próxima
+    chamada.
+    """
+    with obter_conexao() as conn:
+        # Versão e linhas lidas no mesmo snapshot
+        conn.execute('BEGIN')
+        versao, horizonte = conn.execute('''
+            SELECT COALESCE(MAX(versao), 0), (SELECT versao FROM percursos_versoes_horizonte WHERE id = 1)
+            FROM percursos_versoes
+        ''').fetchone()
         
-        # Gerar ID se não fornecido
-        if 'id' not in percurso_data:
-            percurso_data['id'] = str(uuid.uuid4())
-        
-        # Data de criação se não fornecida
-        if 'data_criacao' not in percurso_data:
-            percurso_data['data_criacao'] = datetime.now().isoformat()
+        # Antes do horizonte, lápides de removidos podem ter sido descartadas
+        if desde <= 0 or desde < horizonte:
+            inseridos = _consultar_percursos(conn, ' ORDER BY data_criacao DESC').fetchall()
+            conn.commit()
+            return {'versao': versao, 'completo': True, 'inseridos': inseridos, 'atualizados': [], 'removidos': []}
         
-        cursor.execute('''
-            INSERT INTO percursos (
-                id, rota_id, nome_rota, data, turno,
-                horario_saida_programado, horario_chegada_programado,
-                horario_saida_real, horario_chegada_real,
-                atraso_saida, atraso_chegada, observacoes,
-                data_criacao, data_atualizacao
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            percurso_data['id'],
-            percurso_data['rota_id'],
-            percurso_data['nome_rota'],
-            percurso_data['data'],
-            percurso_data['turno'],
-            percurso_data.get('horario_saida_programado'),
-            percurso_data.get('horario_chegada_programado'),
-            percurso_data.get('horario_saida_real'),
-            percurso_data.get('horario_chegada_real'),
-            percurso_data.get('atraso_saida', 0),
-            percurso_data.get('atraso_chegada', 0),
-            percurso_data.get('observacoes', ''),
-            percurso_data['data_criacao'],
-            percurso_data.get('data_atualizacao')
-        ))
+        cursor = conn.cursor()
+        cursor.row_factory = lambda _cursor, row: (row[:3], tuple.__new__(Percurso, row[3:]))
+        cursor.execute(f'''
+            SELECT v.percurso_id, v.criado_versao, v.removido, {_COLUNAS_PERCURSO_SQL}
+            FROM percursos_versoes v LEFT JOIN percursos p ON p.id = v.percurso_id
+            WHERE v.versao > ? AND v.versao <= ?
+            ORDER BY v.versao
+        ''', (desde, versao))
         
+        inseridos, atualizados, removidos = [], [], []
+        for (percurso_id, criado_versao, removido), percurso in cursor:
+            if removido or percurso.id is None:
+                removidos.append(percurso_id)
+            elif criado_versao > desde:
+                inseridos.append(percurso)
+            else:
+                atualizados.append(percurso)
         conn.commit()
-        return percurso_data
+        
+        return {'versao': versao, 'completo': False, 'inseridos': inseridos,
+                'atualizados': atualizados, 'removidos': removidos}
+
+def _purgar_lapides(conn, retencao):
+    versao = conn.execute('SELECT COALESCE(MAX(versao), 0) FROM percursos_versoes').fetchone()[0]
+    # A versão mais recente nunca é descartada: as próximas gravações numeram a
+    # partir dela e não podem repetir versões que os clientes já viram
+    limite = versao - max(retencao, 1)
+    horizonte = conn.execute(
+        'SELECT MAX(versao) FROM percursos_versoes WHERE removido = 1 AND versao <= ?', (limite,)
+    ).fetchone()[0]
+    if horizonte is None:
+        return 0
+    
+    removidas = conn.execute(
+        'DELETE FROM percursos_versoes WHERE removido = 1 AND versao <= ?', (horizonte,)
+    ).rowcount
+    conn.execute('UPDATE percursos_versoes_horizonte SET versao = MAX(versao, ?) WHERE id = 1', (horizonte,))
+    return removidas
+
+def purgar_lapides(retencao):
+    """Descarta as lápides de percursos removidos mais antigas que as últimas `retencao` versões.
+    
+    Retorna quantas foram descartadas. Clientes que sincronizam a partir de uma
+    versão anterior à maior lápide descartada recebem a lista completa.
+    """
+    return executar_escrita(_purgar_lapides, retencao)
 
 def obter_percurso_por_id(percurso_id):
     """Obtém um percurso específico por ID"""
     with obter_conexao() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM percursos WHERE id = ?', (percurso_id,))
-        row = cursor.fetchone()
-        
-        if row:
-            return {
-                'id': row['id'],
-                'rota_id': row['rota_id'],
-                'nome_rota': row['nome_rota'],
-                'data': row['data'],
-                'turno': row['turno'],
-                'horario_saida_programado': row['horario_saida_programado'],
-                'horario_chegada_programado': row['horario_chegada_programado'],
-                'horario_saida_real': row['horario_saida_real'],
-                'horario_chegada_real': row['horario_chegada_real'],
-                'atraso_saida': row['atraso_saida'],
-                'atraso_chegada': row['atraso_chegada'],
-                'observacoes': row['observacoes'] or '',
-                'data_criacao': row['data_criacao'],
-                'data_atualizacao': row['data_atualizacao']
-            }
-        return None
+        return _consultar_percursos(conn, ' WHERE id = ?', (percurso_id,)).fetchone()
+
+def _atualizar_percurso(conn, percurso_id, dados_atualizacao):
+    # Só as colunas enviadas entram no UPDATE
+    campos = {k: v for k, v in dados_atualizacao.items() if k in CAMPOS_PERCURSO_EDITAVEIS}
+    atribuicoes = [f'{campo} = :{campo}' for campo in campos]
+    
+    # Atraso não informado é recalculado no próprio UPDATE quando um de seus
+    # horários muda, com o valor novo ou o já gravado
+    for atraso, horarios in _ATRASOS_PERCURSO.items():
+        if atraso not in campos and any(horario in campos for horario in horarios):
+            programado, real = (f':{horario}' if horario in campos else horario for horario in horarios)
+            atribuicoes.append(f'{atraso} = {_sql_atraso(programado, real)}')
+    if 'rota_id' in campos:
+        # Rota inexistente vira NULL e viola o NOT NULL (ver abaixo); o nome vem da rota
+        atribuicoes[list(campos).index('rota_id')] = 'rota_id = (SELECT id FROM rotas WHERE id = :rota_id)'
+        if 'nome_rota' not in campos:
+            atribuicoes.append('nome_rota = (SELECT nome FROM rotas WHERE id = :rota_id)')
+    if _ganchos_percurso:
+        # Os ganchos recebem o registro anterior capturado pelo próprio UPDATE
+        atribuicoes.append(f'data_atualizacao = capturar_anterior(:data_atualizacao, '
+                           f'{", ".join(CAMPOS_PERCURSO_ANTERIOR)})')
+        _capturados.linhas = []
+    else:
+        atribuicoes.append('data_atualizacao = :data_atualizacao')
+    
+    cursor = conn.cursor()
+    cursor.row_factory = _fabrica_percurso
+    try:
+        cursor.execute(
+            f'UPDATE percursos SET {", ".join(atribuicoes)} WHERE id = :id RETURNING {_COLUNAS_PERCURSO_SQL}',
+            {**campos, 'data_atualizacao': datetime.now().isoformat(), 'id': percurso_id}
+        )
+    except sqlite3.IntegrityError as e:
+        if str(e) == 'NOT NULL constraint failed: percursos.rota_id':
+            raise ValueError('Rota não encontrada') from None
+        raise
+    percurso = cursor.fetchone()
+    
+    if percurso is not None and _ganchos_percurso:
+        anterior = tuple.__new__(_tipo_percurso(CAMPOS_PERCURSO_ANTERIOR), _capturados.linhas[0])
+        _notificar_ganchos(conn, anterior, percurso)
+    return percurso
 
 def atualizar_percurso(percurso_id, dados_atualizacao):
-    """Atualiza um percurso existente"""
-    with obter_conexao() as conn:
-        cursor = conn.cursor()
-        
-        # Obter percurso atual
-        cursor.execute('SELECT * FROM percursos WHERE id = ?', (percurso_id,))
-        row = cursor.fetchone()
-        
-        if not row:
-            return None
-        
-        # Atualizar dados
-        percurso_atual = {
-            'id': row['id'],
-            'rota_id': row['rota_id'],
-            'nome_rota': row['nome_rota'],
-            'data': row['data'],
-            'turno': row['turno'],
-            'horario_saida_programado': row['horario_saida_programado'],
-            'horario_chegada_programado': row['horario_chegada_programado'],
-            'horario_saida_real': row['horario_saida_real'],
-            'horario_chegada_real': row['horario_chegada_real'],
-            'atraso_saida': row['atraso_saida'],
-            'atraso_chegada': row['atraso_chegada'],
-            'observacoes': row['observacoes'] or '',
-            'data_criacao': row['data_criacao'],
-            'data_atualizacao': row['data_atualizacao']
-        }
-        
-        percurso_atual.update(dados_atualizacao)
-        percurso_atual['data_atualizacao'] = datetime.now().isoformat()
-        
-        # Salvar no banco
-        cursor.execute('''
-            UPDATE percursos 
-            SET rota_id = ?, nome_rota = ?, data = ?, turno = ?,
-                horario_saida_programado = ?, horario_chegada_programado = ?,
-                horario_saida_real = ?, horario_chegada_real = ?,
-                atraso_saida = ?, atraso_chegada = ?, observacoes = ?,
-                data_atualizacao = ?
-            WHERE id = ?
-        ''', (
-            percurso_atual['rota_id'],
-            percurso_atual['nome_rota'],
-            percurso_atual['data'],
-            percurso_atual['turno'],
-            percurso_atual['horario_saida_programado'],
-            percurso_atual['horario_chegada_programado'],
-            percurso_atual['horario_saida_real'],
-            percurso_atual['horario_chegada_real'],
-            percurso_atual['atraso_saida'],
-            percurso_atual['atraso_chegada'],
-            percurso_atual['observacoes'],
-            percurso_atual['data_atualizacao'],
-            percurso_id
-        ))
-        
-        conn.commit()
-        return percurso_atual
+    """Atualiza um percurso existente em um único UPDATE ... RETURNING (None se não existe).
+    
+    Levanta ValueError se `rota_id` não é de uma rota cadastrada.
+    """
+    return executar_escrita(_atualizar_percurso, percurso_id, dados_atualizacao)
+
+def _deletar_percurso(conn, percurso_id):
+    # Remove e devolve o registro removido no mesmo comando
+    cursor = conn.cursor()
+    cursor.row_factory = _fabrica_percurso
+    cursor.execute(f'DELETE FROM percursos WHERE id = ? RETURNING {_COLUNAS_PERCURSO_SQL}', (percurso_id,))
+    percurso_removido = cursor.fetchone()
+    
+    if not percurso_removido:
+        return None
+    
+    _notificar_ganchos(conn, percurso_removido, None)
+    return percurso_removido
 
 def deletar_percurso(percurso_id):
     """Deleta um percurso"""
+    return executar_escrita(_deletar_percurso, percurso_id)
+
+# Origem dos percursos, para a remoção em massa: os gerados por
+# dados_alimentar.py têm "Dados fictícios" nas observações (em qualquer
+# posição, como na limpeza original de dados_alimentar.py)
+ORIGENS_PERCURSO = {
+    'ficticio': "observacoes LIKE '%Dados fictícios%'",
+    'operacao': "COALESCE(observacoes, '') NOT LIKE '%Dados fictícios%'",
+}
+
+def _filtros_remocao(rota_id, data_inicio, data_fim, turno, origem):
+    filtros, params = montar_filtros_percursos(rota_id, data_inicio, data_fim, turno)
+    if origem:
+        if origem not in ORIGENS_PERCURSO:
+            raise ValueError(f'Origem inválida: {origem}. Permitidas: {", ".join(ORIGENS_PERCURSO)}')
+        filtros += f' AND {ORIGENS_PERCURSO[origem]}'
+    return filtros, params
+
+def contar_percursos_filtrados(rota_id=None, data_inicio=None, data_fim=None, turno=None, origem=None):
+    """Quantidade de percursos selecionados pelos filtros (simulação da remoção em massa)"""
+    filtros, params = _filtros_remocao(rota_id, data_inicio, data_fim, turno, origem)
     with obter_conexao() as conn:
-        cursor = conn.cursor()
-        
-        # Obter percurso antes de deletar
-        cursor.execute('SELECT * FROM percursos WHERE id = ?', (percurso_id,))
-        row = cursor.fetchone()
-        
-        if not row:
-            return None
-        
-        percurso_removido = {
-            'id': row['id'],
-            'rota_id': row['rota_id'],
-            'nome_rota': row['nome_rota'],
-            'data': row['data'],
-            'turno': row['turno'],
-            'horario_saida_programado': row['horario_saida_programado'],
-            'horario_chegada_programado': row['horario_chegada_programado'],
-            'horario_saida_real': row['horario_saida_real'],
-            'horario_chegada_real': row['horario_chegada_real'],
-            'atraso_saida': row['atraso_saida'],
-            'atraso_chegada': row['atraso_chegada'],
-            'observacoes': row['observacoes'] or '',
-            'data_criacao': row['data_criacao'],
-            'data_atualizacao': row['data_atualizacao']
-        }
-        
-        # Deletar percurso
-        cursor.execute('DELETE FROM percursos WHERE id = ?', (percurso_id,))
-        conn.commit()
-        
-        return percurso_removido
+        return conn.execute('SELECT COUNT(*) FROM percursos' + filtros, params).fetchone()[0]
+
+def _remover_lote_percursos(conn, filtros, params, primeiro, ultimo):
+    # Faixa de rowid do lote; os filtros são reaplicados para não remover
+    # percursos alterados depois da seleção
+    sql = f'DELETE FROM percursos{filtros} AND rowid BETWEEN ? AND ?'
+    if not _ganchos_percurso:
+        return conn.execute(sql, (*params, primeiro, ultimo)).rowcount
+    
+    cursor = conn.cursor()
+    cursor.row_factory = _fabrica_percurso
+    cursor.execute(sql + f' RETURNING {_COLUNAS_PERCURSO_SQL}', (*params, primeiro, ultimo))
+    removidos = cursor.fetchall()
+    for percurso in removidos:
+        _notificar_ganchos(conn, percurso, None)
+    return len(removidos)
+
+def remover_percursos_em_lotes(rota_id=None, data_inicio=None, data_fim=None, turno=None, origem=None,
+                               tamanho_lote=500, pausa=0.01):
+    """Remove os percursos filtrados em lotes, cada lote em sua própria transação.
+    
+    Gerador: antes do primeiro lote e depois de cada um produz o progresso
+    (`total`, `removidos`, `lotes`). Os percursos são os selecionados no início;
+    a pausa entre lotes deixa o banco livre para as gravações dos operadores.
+    Triggers (versões, busca) e ganchos (alertas) são atualizados a cada lote.
+    """
+    filtros, params = _filtros_remocao(rota_id, data_inicio, data_fim, turno, origem)
+    with obter_conexao() as conn:
+        rowids = [row[0] for row in conn.execute(f'SELECT rowid FROM percursos{filtros} ORDER BY rowid', params)]
+    
+    progresso = {'total': len(rowids), 'removidos': 0, 'lotes': 0}
+    yield dict(progresso)
+    for inicio in range(0, len(rowids), tamanho_lote):
+        lote = rowids[inicio:inicio + tamanho_lote]
+        progresso['removidos'] += executar_escrita(_remover_lote_percursos, filtros, params, lote[0], lote[-1])
+        progresso['lotes'] += 1
+        yield dict(progresso)
+        if pausa and inicio + tamanho_lote < len(rowids):
+            time.sleep(pausa)
 
 
 # === SENHAS (PBKDF2/SHA256) ===
@@ -1006,21 +1905,24 @@ def _verify_password(stored: str, provided: str) -> bool:
         return False
 
 # === USUÁRIOS ===
+def _inserir_usuario(cursor, username, nome, senha_plana, is_admin=False, ativo=True):
+    user_id = str(uuid.uuid4())
+    agora = datetime.now().isoformat()
+    senha_hash = _hash_password(senha_plana)
+    cursor.execute('''
+        INSERT INTO usuarios (id, username, nome, senha_hash, is_admin, ativo, criado_em)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (user_id, username, nome, senha_hash, 1 if is_admin else 0, 1 if ativo else 0, agora))
+    return {
+        'id': user_id, 'username': username, 'nome': nome,
+        'is_admin': bool(is_admin), 'ativo': bool(ativo), 'criado_em': agora
+    }
+
 def criar_usuario(username: str, nome: str, senha_plana: str, is_admin: bool = False, ativo: bool = True):
     with obter_conexao() as conn:
-        cursor = conn.cursor()
-        user_id = str(uuid.uuid4())
-        agora = datetime.now().isoformat()
-        senha_hash = _hash_password(senha_plana)
-        cursor.execute('''
-            INSERT INTO usuarios (id, username, nome, senha_hash, is_admin, ativo, criado_em)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (user_id, username, nome, senha_hash, 1 if is_admin else 0, 1 if ativo else 0, agora))
+        usuario = _inserir_usuario(conn.cursor(), username, nome, senha_plana, is_admin, ativo)
         conn.commit()
-        return {
-            'id': user_id, 'username': username, 'nome': nome,
-            'is_admin': bool(is_admin), 'ativo': bool(ativo), 'criado_em': agora
-        }
+        return usuario
 
 def obter_usuario_por_username(username: str):
     with obter_conexao() as conn:
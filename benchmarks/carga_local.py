@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Teste de carga local do servidor (servidor.app, sem rede).
+
+Simula `dashboards` usuários consultando `/api/relatorio/atrasos` e
+`/api/percursos` com filtros típicos do dashboard (última semana, último mês
+de uma rota, busca nas observações) e `operadores` registrando viagens
+(`POST /api/percursos`) e depois lançando a chegada real (`PUT`). Cada
+usuário virtual é uma thread com seu próprio cliente de teste e pausas
+aleatórias (exponenciais) entre as ações; os usuários entram aos poucos
+durante a rampa de subida.
+
+Ao final mostra, por operação, a vazão, os percentis de latência, a taxa de
+erros e quantos erros foram "database is locked", medidos só depois da rampa
+(regime estável). Com `--json` grava o resultado junto com a configuração,
+e `--comparar` mostra a diferença em relação a uma execução anterior, para
+avaliar mudanças de capacidade entre execuções.
+
+Uso:
+    python benchmarks/carga_local.py [--dashboards 20] [--operadores 5] [--duracao 60]
+        [--rampa 10] [--dias 90] [--banco dados.db] [--sem-escritor] [--replica]
+        [--json resultado.json] [--comparar anterior.json]
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import banco
+from cobertura import expandir_escala
+
+PERCENTIS = (50, 90, 95, 99)
+OBSERVACOES = ['', '', '', 'Pneu furado', 'Trânsito intenso', 'Acidente na via', 'Chuva forte']
+
+
+def _popular(dias, data_fim):
+    aleatorio = random.Random(42)
+    slots = expandir_escala(banco.carregar_rotas_config()['rotas'])
+    linhas = []
+    for i in range(dias):
+        dia = data_fim - timedelta(days=dias - 1 - i)
+        if dia.weekday() == 6:
+            continue
+        for rota_id, nome, turno, saida, chegada in slots:
+            linhas.append((
+                str(uuid.uuid4()), rota_id, nome, dia.isoformat(), turno, saida, chegada, saida, chegada,
+                aleatorio.randint(-10, 10), aleatorio.randint(-10, 10), aleatorio.choice(OBSERVACOES),
+                '2025-01-01T00:00:00', None
+            ))
+    with banco.obter_conexao() as conn:
+        conn.executemany(f'INSERT INTO percursos VALUES ({", ".join("?" * 14)})', linhas)
+        conn.commit()
+    return len(linhas)
+
+
+def _somar_minutos(horario, minutos):
+    h, m = map(int, horario[:5].split(':'))
+    total = (h * 60 + m + minutos) % (24 * 60)
+    return f'{total // 60:02d}:{total % 60:02d}'
+
+
+class Medicoes:
+    """Latências e erros por operação, de todas as threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.operacoes = {}
+
+    def registrar(self, operacao, segundos, status, corpo):
+        locked = status >= 500 and b'database is locked' in corpo
+        with self._lock:
+            dados = self.operacoes.setdefault(operacao, {'latencias': [], 'erros': 0, 'locked': 0})
+            dados['latencias'].append(segundos)
+            if status >= 400:
+                dados['erros'] += 1
+            if locked:
+                dados['locked'] += 1
+
+
+class UsuarioVirtual(threading.Thread):
+    def __init__(self, cliente, medicoes, inicio, fim, pausa_media, semente):
+        super().__init__(daemon=True)
+        self.cliente = cliente
+        self.medicoes = medicoes
+        self.inicio = inicio          # instante de entrada (rampa)
+        self.fim = fim
+        self.pausa_media = pausa_media
+        self.aleatorio = random.Random(semente)
+        self.medir_desde = None
+
+    def requisicao(self, operacao, metodo, url, **kwargs):
+        comeco = time.perf_counter()
+        resposta = self.cliente.open(url, method=metodo, **kwargs)
+        corpo = resposta.get_data()
+        duracao = time.perf_counter() - comeco
+        if comeco >= self.medir_desde:
+            self.medicoes.registrar(operacao, duracao, resposta.status_code, corpo)
+        return resposta
+
+    def pensar(self):
+        restante = self.fim - time.perf_counter()
+        if restante > 0:
+            time.sleep(min(self.aleatorio.expovariate(1 / self.pausa_media), restante))
+
+    def run(self):
+        time.sleep(max(0.0, self.inicio - time.perf_counter()))
+        while time.perf_counter() < self.fim:
+            self.acao()
+            self.pensar()
+
+
+class Dashboard(UsuarioVirtual):
+    """Atualiza o relatório de atrasos e a lista de percursos com filtros do dashboard"""
+
+    def __init__(self, *args, rotas, data_fim, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rotas = rotas
+        self.data_fim = data_fim
+
+    def _filtros(self):
+        sorteio = self.aleatorio.random()
+        if sorteio < 0.6:    # visão padrão: última semana, todas as rotas
+            dias, rota = 7, None
+        elif sorteio < 0.9:  # uma rota no último mês
+            dias, rota = 30, self.aleatorio.choice(self.rotas)
+        else:                # trimestre inteiro
+            dias, rota = 90, None
+        filtros = {
+            'data_inicio': (self.data_fim - timedelta(days=dias - 1)).isoformat(),
+            'data_fim': self.data_fim.isoformat(),
+        }
+        if rota:
+            filtros['rota'] = rota
+        return filtros
+
+    def acao(self):
+        filtros = self._filtros()
+        self.requisicao('GET /api/relatorio/atrasos', 'GET', '/api/relatorio/atrasos', query_string=filtros)
+        if self.aleatorio.random() < 0.2:
+            filtros['q'] = self.aleatorio.choice(['pneu', 'transito', 'acidente', 'chuva'])
+        self.requisicao('GET /api/percursos', 'GET', '/api/percursos', query_string=filtros)
+
+
+class Operador(UsuarioVirtual):
+    """Registra a saída de uma viagem e, depois de uma pausa, a chegada"""
+
+    def __init__(self, *args, slots, data_operacao, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.slots = slots
+        self.data_operacao = data_operacao
+
+    def acao(self):
+        rota_id, _, turno, saida, chegada = self.aleatorio.choice(self.slots)
+        resposta = self.requisicao('POST /api/percursos', 'POST', '/api/percursos', json={
+            'rota_id': rota_id,
+            'data': self.data_operacao.isoformat(),
+            'turno': turno,
+            'horario_saida_programado': saida,
+            'horario_chegada_programado': chegada,
+            'horario_saida_real': _somar_minutos(saida, self.aleatorio.randint(-3, 12)),
+        })
+        if resposta.status_code not in (200, 201):
+            return
+        self.pensar()
+        if time.perf_counter() >= self.fim:
+            return
+        self.requisicao('PUT /api/percursos/<id>', 'PUT', f'/api/percursos/{resposta.get_json()["id"]}', json={
+            'horario_chegada_real': _somar_minutos(chegada or saida, self.aleatorio.randint(-5, 20)),
+            'observacoes': self.aleatorio.choice(OBSERVACOES),
+        })
+
+
+def _percentil(ordenados, p):
+    """Percentil pelo posto mais próximo"""
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)]
+
+
+def resumir(medicoes, duracao):
+    resultado = {}
+    for operacao, dados in sorted(medicoes.operacoes.items()):
+        latencias = sorted(dados['latencias'])
+        total = len(latencias)
+        resultado[operacao] = {
+            'requisicoes': total,
+            'por_segundo': round(total / duracao, 2),
+            **{f'p{p}_ms': round(_percentil(latencias, p) * 1000, 1) for p in PERCENTIS},
+            'max_ms': round(latencias[-1] * 1000, 1),
+            'erros': dados['erros'],
+            'taxa_erros': round(dados['erros'] / total, 4),
+            'locked': dados['locked'],
+        }
+    total = sum(r['requisicoes'] for r in resultado.values())
+    resultado['TOTAL'] = {
+        'requisicoes': total,
+        'por_segundo': round(total / duracao, 2),
+        'erros': sum(r['erros'] for r in resultado.values()),
+        'taxa_erros': round(sum(r['erros'] for r in resultado.values()) / max(total, 1), 4),
+        'locked': sum(r['locked'] for r in resultado.values()),
+    }
+    return resultado
+
+
+def imprimir(resultado, anterior=None):
+    colunas = ['requisicoes', 'por_segundo', *(f'p{p}_ms' for p in PERCENTIS), 'max_ms', 'taxa_erros', 'locked']
+    print(f'{"operação":<28}' + ''.join(f' {c:>11}' for c in colunas))
+    for operacao, valores in resultado.items():
+        print(f'{operacao:<28}' + ''.join(
+            f' {valores[c]:>11}' if c in valores else f' {"-":>11}' for c in colunas
+        ))
+        base = (anterior or {}).get(operacao)
+        if base:
+            variacoes = []
+            for c in colunas:
+                if c in valores and c in base and base[c]:
+                    variacoes.append(f' {(valores[c] - base[c]) / base[c] * 100:>+10.0f}%')
+                else:
+                    variacoes.append(f' {"-":>11}')
+            print(f'{"  vs. anterior":<28}' + ''.join(variacoes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Teste de carga local do servidor MaxTour')
+    parser.add_argument('--dashboards', type=int, default=20, help='usuários consultando relatórios')
+    parser.add_argument('--operadores', type=int, default=5, help='usuários registrando viagens')
+    parser.add_argument('--duracao', type=float, default=60, help='duração total em segundos (inclui a rampa)')
+    parser.add_argument('--rampa', type=float, default=10, help='segundos até todos os usuários entrarem')
+    parser.add_argument('--pausa-dashboard', type=float, default=3.0, help='pausa média entre atualizações (s)')
+    parser.add_argument('--pausa-operador', type=float, default=1.0, help='pausa média entre ações (s)')
+    parser.add_argument('--dias', type=int, default=90, help='dias de histórico na base gerada')
+    parser.add_argument('--banco', help='usar uma cópia desta base em vez de gerar uma')
+    parser.add_argument('--sem-escritor', action='store_true', help='gravações sem o escritor único')
+    parser.add_argument('--replica', action='store_true', help='leituras pela réplica em memória')
+    parser.add_argument('--semente', type=int, default=1)
+    parser.add_argument('--json', help='grava configuração e resultado neste arquivo')
+    parser.add_argument('--comparar', help='resultado anterior (--json) para comparação')
+    args = parser.parse_args()
+    if args.rampa >= args.duracao:
+        parser.error('--rampa deve ser menor que --duracao')
+
+    anterior = None
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            anterior = json.load(f)['resultado']
+
+    with tempfile.TemporaryDirectory() as pasta:
+        banco.DATABASE_FILE = os.path.join(pasta, 'carga.db')
+        if args.banco:
+            shutil.copyfile(args.banco, banco.DATABASE_FILE)
+        banco.inicializar_banco()
+        if not args.banco:
+            _popular(args.dias, date.today() - timedelta(days=1))
+        with banco.obter_conexao() as conn:
+            total, ultima_data = conn.execute('SELECT COUNT(*), MAX(data) FROM percursos').fetchone()
+        data_fim = date.fromisoformat(ultima_data) if ultima_data else date.today()
+
+        import servidor
+        from alertas import sincronizar_estatisticas
+        sincronizar_estatisticas()
+        if not args.sem_escritor:
+            banco.ativar_escritor_unico()
+        if args.replica:
+            servidor.iniciar_replica()
+
+        rotas = [r['id'] for r in banco.carregar_rotas_config()['rotas'] if r.get('ativa', True)]
+        slots = expandir_escala(banco.carregar_rotas_config()['rotas'])
+        print(f'{total} percursos na base; {args.dashboards} dashboards, {args.operadores} operadores, '
+              f'{args.duracao:.0f} s (rampa {args.rampa:.0f} s)\n')
+
+        medicoes = Medicoes()
+        agora = time.perf_counter()
+        fim = agora + args.duracao
+        medir_desde = agora + args.rampa
+        # Dashboards e operadores intercalados, para entrarem juntos durante a rampa
+        papeis = ['dashboard'] * args.dashboards + ['operador'] * args.operadores
+        random.Random(args.semente).shuffle(papeis)
+        usuarios = []
+        for i, papel in enumerate(papeis):
+            comum = dict(cliente=servidor.app.test_client(), medicoes=medicoes,
+                         inicio=agora + args.rampa * i / len(papeis), fim=fim, semente=args.semente * 1000 + i)
+            if papel == 'dashboard':
+                usuario = Dashboard(pausa_media=args.pausa_dashboard, rotas=rotas, data_fim=data_fim, **comum)
+            else:
+                usuario = Operador(pausa_media=args.pausa_operador, slots=slots,
+                                   data_operacao=data_fim + timedelta(days=1), **comum)
+            usuario.medir_desde = medir_desde
+            usuarios.append(usuario)
+        for usuario in usuarios:
+            usuario.start()
+        for usuario in usuarios:
+            usuario.join()
+
+        resultado = resumir(medicoes, args.duracao - args.rampa)
+        imprimir(resultado, anterior)
+
+        if servidor.replica is not None:
+            servidor.replica.parar()
+        if not args.sem_escritor:
+            banco.desativar_escritor_unico()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'configuracao': vars(args), 'percursos_na_base': total, 'resultado': resultado},
+                      f, ensure_ascii=False, indent=2)
+        print(f'\nResultado gravado em {args.json}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Benchmark da compressão das respostas da API (compressao.CompressaoRespostas).
+
+Popula uma base temporária com `dias` dias de percursos da escala padrão e
+mede, para cada endpoint e codificação, o tamanho transferido, o tempo no
+servidor (gerar + comprimir) e o tempo de descompressão no cliente. Depois
+estima o tempo até o cliente ter a resposta em perfis de rede típicos:
+
+    total = servidor + RTT + bytes / banda + descompressão
+
+(estimativa simples: ignora slow start do TCP e perdas, que favoreceriam
+ainda mais as respostas menores).
+
+Uso:
+    python benchmarks/compressao_respostas.py [dias]   (padrão: 365)
+"""
+
+import gzip
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import banco
+import compressao
+from cobertura import expandir_escala
+
+# (nome, banda em Mbit/s, RTT em ms)
+PERFIS = [
+    ('LAN 100 Mbit/s', 100, 1),
+    ('Wi-Fi 20 Mbit/s', 20, 10),
+    ('Wi-Fi fraco 5 Mbit/s', 5, 30),
+]
+
+ENDPOINTS = [
+    '/api/percursos',
+    '/api/relatorio/atrasos',
+    '/api/percursos/export?formato=csv',
+]
+
+
+def _popular(dias):
+    aleatorio = random.Random(42)
+    slots = expandir_escala(banco.carregar_rotas_config()['rotas'])
+    observacoes = ['', '', '', 'Pneu furado', 'Trânsito intenso', 'Acidente na via']
+    linhas = []
+    for i in range(dias):
+        dia = date(2025, 1, 1) + timedelta(days=i)
+        if dia.weekday() == 6:
+            continue
+        for rota_id, nome, turno, saida, chegada in slots:
+            linhas.append((
+                str(uuid.uuid4()), rota_id, nome, dia.isoformat(), turno, saida, chegada, saida, chegada,
+                aleatorio.randint(-10, 10), aleatorio.randint(-10, 10), aleatorio.choice(observacoes),
+                '2025-01-01T00:00:00', None
+            ))
+    with banco.obter_conexao() as conn:
+        conn.executemany(f'INSERT INTO percursos VALUES ({", ".join("?" * 14)})', linhas)
+        conn.commit()
+    return len(linhas)
+
+
+def _descomprimir(dados, codificacao):
+    if codificacao == 'br':
+        return compressao.brotli.decompress(dados)
+    if codificacao == 'gzip':
+        return gzip.decompress(dados)
+    return dados
+
+
+def medir(cliente, url, codificacao, repeticoes=3):
+    cabecalhos = {'Accept-Encoding': codificacao or 'identity'}
+    cliente.get(url, headers=cabecalhos).close()  # aquecimento
+    tempos, descompressao = [], []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resposta = cliente.get(url, headers=cabecalhos)
+        dados = resposta.get_data()
+        tempos.append(time.perf_counter() - inicio)
+        assert resposta.headers.get('Content-Encoding') == codificacao, resposta.headers
+        inicio = time.perf_counter()
+        _descomprimir(dados, codificacao)
+        descompressao.append(time.perf_counter() - inicio)
+    return len(dados), min(tempos), min(descompressao)
+
+
+def main():
+    dias = int(sys.argv[1]) if len(sys.argv) > 1 else 365
+
+    with tempfile.TemporaryDirectory() as pasta:
+        banco.DATABASE_FILE = os.path.join(pasta, 'bench.db')
+        banco.inicializar_banco()
+        print(f'{_popular(dias)} percursos ({dias} dias)\n')
+
+        import servidor
+        cliente = servidor.app.test_client()
+        codificacoes = [None, *reversed(compressao.codificacoes_suportadas())]
+
+        for url in ENDPOINTS:
+            print(url)
+            print(f'  {"codificação":<10} {"KiB":>9} {"servidor":>10} {"descomp.":>9}'
+                  + ''.join(f' {nome:>22}' for nome, _, _ in PERFIS))
+            for codificacao in codificacoes:
+                tamanho, servidor_s, descompressao_s = medir(cliente, url, codificacao)
+                totais = [
+                    servidor_s + rtt / 1000 + tamanho * 8 / (banda * 1e6) + descompressao_s
+                    for _, banda, rtt in PERFIS
+                ]
+                print(f'  {codificacao or "nenhuma":<10} {tamanho / 1024:>9.0f} {servidor_s * 1000:>8.0f}ms '
+                      f'{descompressao_s * 1000:>7.0f}ms' + ''.join(f' {t * 1000:>20.0f}ms' for t in totais))
+            print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Benchmark de gravações concorrentes de percursos.
+
+Dispara N clientes (threads) chamando `banco.criar_percurso` ao mesmo tempo,
+primeiro com uma conexão + commit por gravação e depois com o escritor único
+(group commit), e compara gravações por segundo e erros "database is locked".
+
+Uso:
+    python benchmarks/escrita_concorrente.py [clientes] [gravacoes_por_cliente] [pasta]
+
+Use `pasta` em um disco real (não tmpfs) para que o custo de fsync apareça.
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import banco
+
+
+def rodar(clientes, gravacoes, usar_escritor):
+    erros = {'locked': 0, 'outros': 0}
+    barreira = threading.Barrier(clientes + 1)
+
+    def cliente(indice):
+        barreira.wait()
+        for i in range(gravacoes):
+            try:
+                banco.criar_percurso({
+                    'rota_id': 'CANAA', 'nome_rota': 'CANAÃ', 'turno': 'primeiro_turno',
+                    'data': f'2025-01-{1 + i % 28:02d}',
+                    'horario_saida_programado': f'{indice:02d}:{i // 28 % 60:02d}:{i}',
+                    'atraso_saida': i % 7
+                })
+            except sqlite3.OperationalError as e:
+                erros['locked' if 'locked' in str(e) else 'outros'] += 1
+            except Exception:
+                erros['outros'] += 1
+
+    if usar_escritor:
+        escritor = banco.ativar_escritor_unico()
+    threads = [threading.Thread(target=cliente, args=(i,)) for i in range(clientes)]
+    for t in threads:
+        t.start()
+    barreira.wait()
+    inicio = time.perf_counter()
+    for t in threads:
+        t.join()
+    duracao = time.perf_counter() - inicio
+    lotes = None
+    if usar_escritor:
+        lotes = escritor.estatisticas['lotes']
+        banco.desativar_escritor_unico()
+    return duracao, erros, lotes
+
+
+def main():
+    clientes = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    gravacoes = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    pasta_base = sys.argv[3] if len(sys.argv) > 3 else None
+
+    print(f'{clientes} clientes x {gravacoes} gravações')
+    print(f'{"modo":<26} {"grav/s":>10} {"tempo (s)":>10} {"locked":>8} {"outros":>8} {"lotes":>7}')
+    for nome, usar_escritor in (('conexão + commit', False), ('escritor único', True)):
+        with tempfile.TemporaryDirectory(dir=pasta_base) as pasta:
+            banco.DATABASE_FILE = os.path.join(pasta, 'bench.db')
+            banco.inicializar_banco()
+            duracao, erros, lotes = rodar(clientes, gravacoes, usar_escritor)
+            with banco.obter_conexao() as conn:
+                gravadas = conn.execute('SELECT COUNT(*) FROM percursos').fetchone()[0]
+            print(f'{nome:<26} {gravadas / duracao:>10.0f} {duracao:>10.2f} '
+                  f'{erros["locked"]:>8} {erros["outros"]:>8} {lotes if lotes is not None else "-":>7}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark de serialização JSON do relatório de atrasos.
+
+Compara o provedor padrão do Flask (json + sort_keys + ensure_ascii) com o
+`json_rapido.JSONRapido` usando orjson (se instalado), o fallback em json da
+biblioteca padrão e o reaproveitamento de um fragmento já serializado.
+
+Uso:
+    python benchmarks/json_relatorio.py [linhas]   (padrão: 30.000 detalhes)
+"""
+
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+import json_rapido
+from json_rapido import JSONRapido
+
+ROTAS = ['CANAÃ', 'PLANALTO', 'GUARANI', 'LAGOINHA', 'ALVORADA', 'SÃO JORGE', 'PEQUIS']
+HORARIOS = ['05:20', '06:55', '13:40', '15:30', '17:00', '23:00', '01:00', '02:55']
+OBSERVACOES = ['', '', '', 'Dados fictícios - No horário', 'Pneu furado', 'Trânsito intenso']
+
+
+def montar_relatorio(linhas):
+    """Relatório no mesmo formato de /api/relatorio/atrasos"""
+    rnd = random.Random(42)
+    detalhes = []
+    for i in range(linhas):
+        saida, chegada = rnd.choice(HORARIOS), rnd.choice(HORARIOS)
+        detalhes.append({
+            'data': (date(2025, 1, 1) + timedelta(days=i // 91)).isoformat(),
+            'rota': ROTAS[i % len(ROTAS)],
+            'turno': 'primeiro_turno' if i % 2 else 'segundo_turno',
+            'saida_programada': saida,
+            'saida_real': saida,
+            'chegada_programada': chegada,
+            'chegada_real': chegada,
+            'atraso_saida': rnd.randint(-10, 10),
+            'atraso_chegada': rnd.randint(-10, 10),
+            'observacoes': rnd.choice(OBSERVACOES)
+        })
+    estatisticas = {
+        'total_percursos': linhas // len(ROTAS), 'media_atraso_saida': 1.2, 'media_atraso_chegada': 4.8,
+        'maior_atraso_saida': 10, 'maior_atraso_chegada': 10,
+        'pontualidade_saida': 71.3, 'pontualidade_chegada': 70.8
+    }
+    return {
+        'resumo': dict(estatisticas, total_percursos=linhas),
+        'por_rota': {rota: dict(estatisticas) for rota in ROTAS},
+        'detalhes': detalhes,
+        'data_geracao': '2025-08-08T12:00:00'
+    }
+
+
+def medir(nome, funcao, repeticoes=5):
+    funcao()  # aquecimento
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        dados = funcao()
+    media = (time.perf_counter() - inicio) / repeticoes
+    print(f'{nome:<28} {media * 1000:>10.1f} ms {len(dados) / 1024:>10.0f} KiB')
+    return media
+
+
+def main():
+    linhas = int(sys.argv[1]) if len(sys.argv) > 1 else 30_000
+    relatorio = montar_relatorio(linhas)
+
+    app = Flask(__name__)
+    padrao = DefaultJSONProvider(app)
+    rapido = JSONRapido(app)
+
+    print(f'Relatório com {linhas:,} detalhes')
+    print(f'{"provedor":<28} {"tempo":>13} {"tamanho":>14}')
+    with app.app_context():
+        base = medir('Flask padrão (json)', lambda: padrao.response(relatorio).get_data())
+        if json_rapido.orjson is not None:
+            medir('JSONRapido (orjson)', lambda: rapido.response(relatorio).get_data())
+        else:
+            print('JSONRapido (orjson)          orjson não instalado')
+
+        orjson = json_rapido.orjson
+        json_rapido.orjson = None
+        medir('JSONRapido (fallback json)', lambda: rapido.response(relatorio).get_data())
+        json_rapido.orjson = orjson
+
+        fragmento = rapido.fragmento(relatorio)
+        reuso = medir('Fragmento em cache', lambda: rapido.response(fragmento).get_data())
+        print(f'Fragmento em cache: {base / reuso:.0f}x mais rápido que o padrão')
+
+
+if __name__ == '__main__':
+    main()
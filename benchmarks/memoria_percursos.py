@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Benchmark de memória: bytes por linha ao carregar percursos como dict (formato
+antigo, uma chave por campo) versus o registro compacto `banco.Percurso`.
+
+Uso:
+    python benchmarks/memoria_percursos.py [linhas]   (padrão: 1.000.000)
+
+Gera uma base SQLite temporária com percursos fictícios e mede, com
+tracemalloc, a memória alocada para manter todas as linhas carregadas.
+"""
+
+import gc
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from banco import CAMPOS_PERCURSO, _COLUNAS_PERCURSO_SQL, _fabrica_percurso
+
+
+def _criar_base(caminho, linhas):
+    conn = sqlite3.connect(caminho)
+    conn.execute(f'CREATE TABLE percursos ({", ".join(CAMPOS_PERCURSO)})')
+    rotas = ['CANAA', 'PLANALTO', 'GUARANI', 'LAGOINHA', 'ALVORADA', 'SAO_JORGE', 'PEQUIS']
+    horarios = ['05:20', '06:55', '13:40', '15:30', '17:00', '23:00', '01:00']
+
+    def gerar():
+        for i in range(linhas):
+            rota = rotas[i % len(rotas)]
+            horario = horarios[i % len(horarios)]
+            data = f'2025-{1 + i % 12:02d}-{1 + i % 28:02d}'
+            yield (
+                str(uuid.UUID(int=i)), rota, rota, data,
+                'primeiro_turno' if i % 2 else 'segundo_turno', horario, horario, horario, horario,
+                i % 11 - 5, i % 13 - 6, 'Dados fictícios', '2025-01-01T00:00:00', None,
+                *[f'{data}T{horario}'] * 4
+            )
+
+    conn.executemany(f'INSERT INTO percursos VALUES ({", ".join("?" * len(CAMPOS_PERCURSO))})', gerar())
+    conn.commit()
+    conn.close()
+
+
+def _carregar_dicts(conn):
+    """Formato anterior: sqlite3.Row convertido em dict (uma chave por campo)"""
+    conn.row_factory = sqlite3.Row
+    rows = conn.execute('SELECT * FROM percursos').fetchall()
+    return [
+        {
+            'id': row['id'],
+            'rota_id': row['rota_id'],
+            'nome_rota': row['nome_rota'],
+            'data': row['data'],
+            'turno': row['turno'],
+            'horario_saida_programado': row['horario_saida_programado'],
+            'horario_chegada_programado': row['horario_chegada_programado'],
+            'horario_saida_real': row['horario_saida_real'],
+            'horario_chegada_real': row['horario_chegada_real'],
+            'atraso_saida': row['atraso_saida'],
+            'atraso_chegada': row['atraso_chegada'],
+            'observacoes': row['observacoes'] or '',
+            'data_criacao': row['data_criacao'],
+            'data_atualizacao': row['data_atualizacao'],
+            'saida_programada_em': row['saida_programada_em'],
+            'chegada_programada_em': row['chegada_programada_em'],
+            'saida_real_em': row['saida_real_em'],
+            'chegada_real_em': row['chegada_real_em']
+        }
+        for row in rows
+    ]
+
+
+def _carregar_percursos(conn):
+    """Formato atual: tuplas Percurso criadas direto pela row_factory"""
+    cursor = conn.cursor()
+    cursor.row_factory = _fabrica_percurso
+    return cursor.execute(f'SELECT {_COLUNAS_PERCURSO_SQL} FROM percursos').fetchall()
+
+
+def _medir(caminho, carregar, linhas):
+    gc.collect()
+    conn = sqlite3.connect(caminho)
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    resultado = carregar(conn)
+    duracao = time.perf_counter() - inicio
+    atual, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(resultado) == linhas
+    estrutura = sys.getsizeof(resultado[0])
+    del resultado
+    conn.close()
+    return atual / linhas, pico / linhas, estrutura, duracao
+
+
+def main():
+    linhas = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    with tempfile.TemporaryDirectory() as pasta:
+        caminho = os.path.join(pasta, 'bench.db')
+        print(f'Gerando {linhas:,} percursos...')
+        _criar_base(caminho, linhas)
+
+        # bytes/linha inclui os valores (strings) de cada linha; "estrutura" é só o container
+        print(f'{"formato":<12} {"bytes/linha":>12} {"pico/linha":>12} {"estrutura":>10} {"tempo (s)":>10}')
+        resultados = {}
+        for nome, carregar in (('dict', _carregar_dicts), ('Percurso', _carregar_percursos)):
+            retido, pico, estrutura, duracao = _medir(caminho, carregar, linhas)
+            resultados[nome] = retido
+            print(f'{nome:<12} {retido:>12.0f} {pico:>12.0f} {estrutura:>10} {duracao:>10.2f}')
+
+        print(f'Redução: {resultados["dict"] / resultados["Percurso"]:.1f}x menos memória por linha')
+
+
+if __name__ == '__main__':
+    main()
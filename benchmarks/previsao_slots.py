@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Benchmark do recálculo de previsões (previsao.py).
+
+Gera uma base temporária com `slots` horários rodando todos os dias (menos
+domingo) ao longo de `dias` dias e mede `gerar_previsoes`: carga do histórico
+nas matrizes NumPy e ajuste vetorizado de todos os slots de uma vez.
+
+Uso:
+    python benchmarks/previsao_slots.py [slots] [dias]   (padrão: 500 slots, 365 dias)
+"""
+
+import os
+import random
+import sys
+import tempfile
+import uuid
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import banco
+import previsao
+
+
+def _popular(slots, dias, data_base):
+    aleatorio = random.Random(42)
+    inicio = data_base - timedelta(days=dias - 1)
+    linhas = []
+    for i in range(dias):
+        dia = inicio + timedelta(days=i)
+        if dia.weekday() == 6:
+            continue
+        for s in range(slots):
+            rota = f'ROTA_{s // 10:03d}'
+            horario = f'{5 + s % 10:02d}:{(s * 7) % 60:02d}'
+            base = (s % 5) + dia.weekday()  # padrão por slot e dia da semana
+            linhas.append((
+                str(uuid.uuid4()), rota, rota, dia.isoformat(), 'primeiro_turno', horario, horario,
+                horario, horario, base + aleatorio.randint(-3, 3), base + aleatorio.randint(-3, 3),
+                '', '2025-01-01T00:00:00', None
+            ))
+    with banco.obter_conexao() as conn:
+        conn.executemany(f'INSERT INTO percursos VALUES ({", ".join("?" * 14)})', linhas)
+        conn.commit()
+    return len(linhas)
+
+
+def main():
+    if not previsao.numpy_disponivel():
+        raise SystemExit('NumPy não está instalado (pip install numpy)')
+
+    slots = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    dias = int(sys.argv[2]) if len(sys.argv) > 2 else 365
+    data_base = date(2025, 12, 31)
+
+    with tempfile.TemporaryDirectory() as pasta:
+        banco.DATABASE_FILE = os.path.join(pasta, 'bench.db')
+        banco.inicializar_banco()
+        linhas = _popular(slots, dias, data_base)
+        print(f'{linhas} percursos, {slots} slots, {dias} dias de histórico')
+
+        for horizonte in (1, 7):
+            resumo = previsao.gerar_previsoes(data_base, dias=horizonte, dias_historico=dias)
+            print(f'horizonte {horizonte:>2} dia(s): {resumo["previsoes"]:>6} previsões em '
+                  f'{resumo["tempo_total_s"]:.3f} s (carga {resumo["tempo_carga_s"]:.3f} s)')
+
+
+if __name__ == '__main__':
+    main()
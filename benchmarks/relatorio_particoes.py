@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Benchmark do relatório de atrasos de períodos longos por partições mensais.
+
+Gera alguns anos de percursos fictícios em um banco temporário (ou usa um
+banco existente) e compara o agregado do período inteiro em uma consulta com
+`particoes.agregar_periodo_longo` usando 2, 4... processos (até o número de
+núcleos), conferindo que o resultado é sempre o mesmo.
+
+Uso:
+    python benchmarks/relatorio_particoes.py [anos] [banco_existente]   (padrão: 4 anos)
+
+O ganho depende dos núcleos livres: com um núcleo só as partições rodam uma
+depois da outra e o custo de distribuí-las aparece inteiro.
+"""
+
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import banco
+import particoes
+from agregados import relatorio_de_agregado
+
+ROTAS = [('CANAA', 'CANAÃ'), ('PLANALTO', 'PLANALTO'), ('GUARANI', 'GUARANI'), ('LAGOINHA', 'LAGOINHA'),
+         ('ALVORADA', 'ALVORADA'), ('SAO_JORGE', 'SÃO JORGE'), ('PEQUIS', 'PEQUIS')]
+HORARIOS = [('05:20', '06:10'), ('06:55', '07:45'), ('13:40', '14:30'), ('17:00', '17:50'), ('23:00', '23:50')]
+
+
+def popular(caminho, anos):
+    rnd = random.Random(42)
+    inicio = date(2025 - anos, 1, 1)
+    linhas = []
+    for i in range((date(2025, 1, 1) - inicio).days):
+        dia = (inicio + timedelta(days=i)).isoformat()
+        for rota_id, nome in ROTAS:
+            for saida, chegada in HORARIOS:
+                turno = 'primeiro_turno' if saida < '12:00' else 'segundo_turno'
+                criacao = f'{dia}T{rnd.randint(0, 23):02d}:{rnd.randint(0, 59):02d}:00'
+                linhas.append((str(uuid.uuid4()), rota_id, nome, dia, turno, saida, chegada, saida, chegada,
+                               rnd.randint(-10, 15), rnd.randint(-10, 15), '', criacao, None))
+    with sqlite3.connect(caminho) as conn:
+        conn.executemany('''
+            INSERT INTO percursos (id, rota_id, nome_rota, data, turno, horario_saida_programado,
+                                   horario_chegada_programado, horario_saida_real, horario_chegada_real,
+                                   atraso_saida, atraso_chegada, observacoes, data_criacao, data_atualizacao)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', linhas)
+    return len(linhas)
+
+
+def medir(funcao, repeticoes=3):
+    melhor = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        duracao = time.perf_counter() - inicio
+        melhor = duracao if melhor is None else min(melhor, duracao)
+    return melhor, resultado
+
+
+def rodar(caminho):
+    banco.DATABASE_FILE = caminho
+    with banco.obter_conexao() as conn:
+        total, primeira, ultima = conn.execute('SELECT COUNT(*), MIN(data), MAX(data) FROM percursos').fetchone()
+    print(f'{total} percursos de {primeira} a {ultima} '
+          f'({len(particoes.particionar_por_mes(primeira, ultima))} meses), {os.cpu_count()} núcleos')
+
+    duracao, referencia = medir(lambda: relatorio_de_agregado(banco.agregar_atrasos_por_rota()))
+    print(f'{"modo":<24} {"tempo (s)":>10} {"igual":>6}')
+    print(f'{"uma consulta":<24} {duracao:>10.3f} {"-":>6}')
+    # Com 1 processo agregar_periodo_longo já faz uma consulta só, como acima
+    processos = 2
+    while True:
+        particoes.encerrar_pool()
+        particoes.PROCESSOS = processos
+        duracao, agregado = medir(lambda: particoes.agregar_periodo_longo(minimo_meses=1))
+        igual = relatorio_de_agregado(agregado) == referencia
+        print(f'{f"partições, {processos} proc.":<24} {duracao:>10.3f} {"sim" if igual else "NÃO":>6}')
+        if processos >= max(os.cpu_count() or 1, 2):
+            break
+        processos *= 2
+    particoes.encerrar_pool()
+
+
+def main():
+    anos = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    if len(sys.argv) > 2:
+        rodar(sys.argv[2])
+        return
+    with tempfile.TemporaryDirectory() as pasta:
+        banco.DATABASE_FILE = os.path.join(pasta, 'bench.db')
+        banco.inicializar_banco()
+        popular(banco.DATABASE_FILE, anos)
+        rodar(banco.DATABASE_FILE)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+"""
+Cobertura da escala: compara as viagens programadas em `rotas.horarios` com os
+percursos registrados, apontando viagens faltantes, duplicadas e não programadas.
+
+A escala de cada rota é expandida para a tabela `escala_slots` (rota × turno ×
+horário) na mesma transação de cada gravação de rota (gancho de banco.py) e na
+inicialização do servidor; as consultas só leem a tabela. Os dias do período são gerados no próprio SQLite e cruzados com os slots
+e com o índice de percursos por (data, rota, turno, horário), então o cálculo
+é feito por conjunto, sem laços em Python por dia/rota/horário.
+"""
+
+import hashlib
+import json
+from datetime import datetime
+
+from banco import executar_escrita, obter_conexao, registrar_gancho_rota
+
+# Calendários disponíveis: dias da semana no formato do strftime('%w') do SQLite
+# (0 = domingo ... 6 = sábado)
+CALENDARIOS = {
+    'padrao': (1, 2, 3, 4, 5, 6),   # segunda a sábado, como em dados_alimentar
+    'uteis': (1, 2, 3, 4, 5),       # segunda a sexta
+    'todos': (0, 1, 2, 3, 4, 5, 6),
+}
+
+
+def extrair_horarios_programados(horario):
+    """Retorna (saída programada, chegada programada) de um item de `horarios`"""
+    if 'chegada_martins' in horario:
+        saida = horario['chegada_martins']
+    elif 'saida_martins' in horario:
+        saida = horario['saida_martins']
+    else:
+        saida = horario.get('saida', '')
+    chegada = horario.get('chegada_maxima', horario.get('chegada', ''))
+    return saida, chegada
+
+
+def expandir_escala(rotas):
+    """Expande a configuração das rotas ativas em slots (rota, nome, turno, saída, chegada)"""
+    slots = []
+    for rota in rotas:
+        if not rota['ativa']:
+            continue
+        for turno, horarios_turno in (rota.get('horarios') or {}).items():
+            if isinstance(horarios_turno, dict):
+                horarios_turno = [horarios_turno]
+            for horario in horarios_turno or []:
+                saida, chegada = extrair_horarios_programados(horario)
+                if saida:
+                    slots.append((rota['id'], rota['nome'], turno, saida, chegada))
+    return slots
+
+
+def reconstruir_escala(conn):
+    """Regrava `escala_slots` a partir de `rotas.horarios`, na transação de `conn`"""
+    rotas = [
+        {'id': row['id'], 'nome': row['nome'], 'ativa': bool(row['ativa']),
+         'horarios': json.loads(row['horarios'])}
+        for row in conn.execute('SELECT id, nome, ativa, horarios FROM rotas ORDER BY id')
+    ]
+    slots = expandir_escala(rotas)
+    conn.execute('DELETE FROM escala_slots')
+    conn.executemany('''
+        INSERT OR IGNORE INTO escala_slots (rota_id, nome_rota, turno, horario_saida, horario_chegada)
+        VALUES (?, ?, ?, ?, ?)
+    ''', slots)
+    return len(slots)
+
+
+def _ao_gravar_rota(conn, rota_id):
+    """Gancho de banco.py: a escala expandida muda junto com a rota"""
+    reconstruir_escala(conn)
+
+
+registrar_gancho_rota(_ao_gravar_rota)
+
+
+def sincronizar_escala():
+    """Reconstrói a escala expandida do banco atual (na inicialização, para rotas gravadas fora do servidor).
+
+    Retorna a quantidade de viagens programadas expandidas.
+    """
+    return executar_escrita(reconstruir_escala)
+
+
+def assinatura_escala(conn):
+    """Assinatura da escala expandida lida em `conn` (muda sempre que a escala muda)"""
+    cursor = conn.execute('''
+        SELECT rota_id, nome_rota, turno, horario_saida, horario_chegada
+        FROM escala_slots ORDER BY rota_id, turno, horario_saida
+    ''')
+    return hashlib.sha1(repr([tuple(row) for row in cursor]).encode('utf-8')).hexdigest()
+
+
+def _validar_data(valor, campo):
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').strftime('%Y-%m-%d')
+    except (TypeError, ValueError):
+        raise ValueError(f'{campo} deve estar no formato AAAA-MM-DD')
+
+
+def calcular_cobertura(data_inicio, data_fim, rota_id=None, calendario='padrao', feriados=()):
+    """Calcula viagens esperadas x realizadas no período.
+
+    Retorna as viagens faltantes (programadas sem percurso), duplicadas (mais de
+    um percurso no mesmo slot e dia) e não programadas (percursos sem slot
+    correspondente na escala/calendário).
+    """
+    data_inicio = _validar_data(data_inicio, 'data_inicio')
+    data_fim = _validar_data(data_fim, 'data_fim')
+    if data_inicio > data_fim:
+        raise ValueError('data_inicio deve ser anterior ou igual a data_fim')
+    if calendario not in CALENDARIOS:
+        raise ValueError(f'Calendário inválido. Opções: {", ".join(CALENDARIOS)}')
+    feriados = [_validar_data(f, 'feriados') for f in feriados]
+
+    dias_semana = CALENDARIOS[calendario]
+    marcadores_dias = ', '.join('?' * len(dias_semana))
+    filtro_feriados = f' AND dia NOT IN ({", ".join("?" * len(feriados))})' if feriados else ''
+    filtro_rota = ' AND s.rota_id = ?' if rota_id else ''
+    filtro_rota_percursos = ' AND p.rota_id = ?' if rota_id else ''
+    params_rota = [rota_id] if rota_id else []
+
+    # Dias do calendário no período, gerados no SQLite
+    cte_esperadas = f'''
+        WITH RECURSIVE dias(dia) AS (
+            SELECT date(?)
+            UNION ALL
+            SELECT date(dia, '+1 day') FROM dias WHERE dia < date(?)
+        ),
+        calendario AS (
+            SELECT dia FROM dias
+            WHERE CAST(strftime('%w', dia) AS INTEGER) IN ({marcadores_dias}){filtro_feriados}
+        )
+    '''
+    params_calendario = [data_inicio, data_fim, *dias_semana, *feriados]
+
+    with obter_conexao() as conn:
+        cursor = conn.cursor()
+
+        cursor.execute(cte_esperadas + f'''
+            SELECT COUNT(*) FROM calendario c CROSS JOIN escala_slots s
+            WHERE 1=1{filtro_rota}
+        ''', params_calendario + params_rota)
+        total_esperadas = cursor.fetchone()[0]
+
+        # Viagens esperadas sem percurso: cada slot × dia é uma busca no índice do slot
+        cursor.execute(cte_esperadas + f'''
+            SELECT c.dia AS data, s.rota_id, s.nome_rota, s.turno, s.horario_saida, s.horario_chegada
+            FROM calendario c CROSS JOIN escala_slots s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM percursos p
+                WHERE p.data = c.dia AND p.rota_id = s.rota_id
+                  AND p.turno = s.turno AND p.horario_saida_programado = s.horario_saida
+            ){filtro_rota}
+            ORDER BY c.dia, s.nome_rota, s.turno, s.horario_saida
+        ''', params_calendario + params_rota)
+        faltantes = [dict(row) for row in cursor.fetchall()]
+
+        # Slots com mais de um percurso no mesmo dia
+        cursor.execute(f'''
+            SELECT p.data, p.rota_id, MAX(p.nome_rota) AS nome_rota, p.turno,
+                   p.horario_saida_programado AS horario_saida, COUNT(*) AS quantidade
+            FROM percursos p
+            WHERE p.data BETWEEN ? AND ?{filtro_rota_percursos}
+            GROUP BY p.data, p.rota_id, p.turno, p.horario_saida_programado
+            HAVING COUNT(*) > 1
+            ORDER BY p.data, nome_rota, p.turno, horario_saida
+        ''', [data_inicio, data_fim] + params_rota)
+        duplicadas = [dict(row) for row in cursor.fetchall()]
+
+        # Percursos fora da escala (horário inexistente) ou fora do calendário
+        cursor.execute(cte_esperadas + f'''
+            SELECT p.data, p.rota_id, MAX(p.nome_rota) AS nome_rota, p.turno,
+                   p.horario_saida_programado AS horario_saida, COUNT(*) AS quantidade
+            FROM percursos p
+            WHERE p.data BETWEEN ? AND ?{filtro_rota_percursos}
+              AND (
+                  p.data NOT IN (SELECT dia FROM calendario)
+                  OR NOT EXISTS (
+                      SELECT 1 FROM escala_slots s
+                      WHERE s.rota_id = p.rota_id AND s.turno = p.turno
+                        AND s.horario_saida = p.horario_saida_programado
+                  )
+              )
+            GROUP BY p.data, p.rota_id, p.turno, p.horario_saida_programado
+            ORDER BY p.data, nome_rota, p.turno, horario_saida
+        ''', params_calendario + [data_inicio, data_fim] + params_rota)
+        nao_programadas = [dict(row) for row in cursor.fetchall()]
+
+        cursor.execute(
+            f'SELECT COUNT(*) FROM percursos p WHERE p.data BETWEEN ? AND ?{filtro_rota_percursos}',
+            [data_inicio, data_fim] + params_rota
+        )
+        total_percursos = cursor.fetchone()[0]
+
+    realizadas = total_esperadas - len(faltantes)
+    return {
+        'periodo': {'data_inicio': data_inicio, 'data_fim': data_fim},
+        'calendario': calendario,
+        'feriados': feriados,
+        'resumo': {
+            'viagens_esperadas': total_esperadas,
+            'viagens_realizadas': realizadas,
+            'total_percursos': total_percursos,
+            'faltantes': len(faltantes),
+            'duplicadas': len(duplicadas),
+            'nao_programadas': len(nao_programadas),
+            'cobertura': round(realizadas / total_esperadas * 100, 1) if total_esperadas else 0
+        },
+        'faltantes': faltantes,
+        'duplicadas': duplicadas,
+        'nao_programadas': nao_programadas,
+        'data_geracao': datetime.now().isoformat()
+    }
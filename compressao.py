@@ -0,0 +1,151 @@
+"""
+Compressão HTTP: gzip (biblioteca padrão) e brotli, quando instalado
+(opcional: `pip install brotli`), com negociação pelo cabeçalho Accept-Encoding.
+"""
+
+import gzip
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depende do ambiente
+    brotli = None
+
+# Níveis usados nos arquivos pré-comprimidos (custo pago uma vez, na carga)
+NIVEL_MAXIMO = {'br': 11, 'gzip': 9}
+
+
+def codificacoes_suportadas():
+    """Codificações disponíveis, em ordem de preferência do servidor"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def escolher_codificacao(accept_encoding, disponiveis=None):
+    """Escolhe a codificação para a resposta (None = sem compressão).
+
+    Respeita os pesos `q` do cliente (q=0 recusa) e, em caso de empate, a ordem
+    de `disponiveis` (None = todas as suportadas; lista vazia = nenhuma).
+    """
+    if not accept_encoding:
+        return None
+    if disponiveis is None:
+        disponiveis = codificacoes_suportadas()
+
+    pesos = {}
+    for item in accept_encoding.split(','):
+        nome, _, parametros = item.strip().partition(';')
+        peso = 1.0
+        parametros = parametros.strip()
+        if parametros.startswith('q='):
+            try:
+                peso = float(parametros[2:])
+            except ValueError:
+                peso = 0.0
+        pesos[nome.strip().lower()] = peso
+
+    melhor, melhor_peso = None, 0.0
+    for codificacao in disponiveis:
+        peso = pesos.get(codificacao, pesos.get('*', 0.0))
+        if peso > melhor_peso:
+            melhor, melhor_peso = codificacao, peso
+    return melhor
+
+
+def comprimir(dados, codificacao, nivel=None):
+    """Comprime `dados` (bytes) de uma vez"""
+    if codificacao == 'br':
+        return brotli.compress(dados, quality=NIVEL_MAXIMO['br'] if nivel is None else nivel)
+    if codificacao == 'gzip':
+        # mtime fixo: o mesmo conteúdo gera sempre os mesmos bytes
+        return gzip.compress(dados, compresslevel=NIVEL_MAXIMO['gzip'] if nivel is None else nivel, mtime=0)
+    raise ValueError(f'Codificação não suportada: {codificacao}')
+
+
+# === Compressão das respostas da API ===
+
+class _CompressorIncremental:
+    """Compressor em blocos com flush a cada bloco (cada pedaço chega ao cliente na hora)"""
+
+    def __init__(self, codificacao, nivel):
+        self.codificacao = codificacao
+        if codificacao == 'br':
+            self._compressor = brotli.Compressor(quality=nivel)
+        else:
+            self._compressor = zlib.compressobj(nivel, zlib.DEFLATED, 31)  # 31 = cabeçalho gzip
+
+    def comprimir(self, dados):
+        if self.codificacao == 'br':
+            return self._compressor.process(dados) + self._compressor.flush()
+        return self._compressor.compress(dados) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finalizar(self):
+        if self.codificacao == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+def _comprimir_stream(blocos, codificacao, nivel):
+    compressor = _CompressorIncremental(codificacao, nivel)
+    try:
+        for bloco in blocos:
+            if isinstance(bloco, str):
+                bloco = bloco.encode('utf-8')
+            if bloco:
+                yield compressor.comprimir(bloco)
+        yield compressor.finalizar()
+    finally:
+        if hasattr(blocos, 'close'):
+            blocos.close()
+
+
+class CompressaoRespostas:
+    """Comprime (gzip/brotli) as respostas da API conforme o Accept-Encoding.
+
+    Respostas prontas só são comprimidas a partir de `tamanho_minimo` bytes;
+    respostas em streaming (geradores, ex.: exportação CSV) são comprimidas
+    bloco a bloco, sem acumular o corpo. Respostas que já têm Content-Encoding
+    (ex.: arquivos pré-comprimidos de estaticos.py) passam intactas.
+    """
+
+    def __init__(self, app=None, tamanho_minimo=1024, niveis=None,
+                 tipos=('application/json', 'text/csv')):
+        self.tamanho_minimo = tamanho_minimo
+        # Níveis de CPU baixo/médio: bom ganho de tamanho sem pesar na latência
+        self.niveis = {'br': 4, 'gzip': 6, **(niveis or {})}
+        self.tipos = frozenset(tipos)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.after_request(self._apos_requisicao)
+
+    def _apos_requisicao(self, resposta):
+        if (resposta.mimetype not in self.tipos
+                or resposta.direct_passthrough
+                or 'Content-Encoding' in resposta.headers
+                or 'no-transform' in resposta.headers.get('Cache-Control', '')
+                or resposta.status_code < 200 or resposta.status_code in (204, 304)):
+            return resposta
+
+        codificacao = escolher_codificacao(request.headers.get('Accept-Encoding'))
+        resposta.vary.add('Accept-Encoding')
+        if codificacao is None:
+            return resposta
+
+        nivel = self.niveis[codificacao]
+        if resposta.is_streamed:
+            resposta.response = _comprimir_stream(resposta.response, codificacao, nivel)
+            resposta.headers.pop('Content-Length', None)
+        else:
+            dados = resposta.get_data()
+            if len(dados) < self.tamanho_minimo:
+                return resposta
+            resposta.set_data(comprimir(dados, codificacao, nivel))
+
+        resposta.headers['Content-Encoding'] = codificacao
+        if resposta.headers.get('ETag'):
+            # O corpo mudou: a ETag forte original não vale para a versão comprimida
+            resposta.set_etag(resposta.get_etag()[0] + f'-{codificacao}', weak=True)
+        return resposta
@@ -5,11 +5,10 @@ Período: 01/07/2025 a 08/07/2025 (exceto domingos)
 Todas as rotas, todos os horários, com atrasos aleatórios de 1-10min ou no horário
 """
 
-import sqlite3
 import uuid
 import random
 from datetime import datetime, timedelta
-from banco import carregar_rotas_config, inicializar_banco
+from banco import carregar_rotas_config, inicializar_banco, criar_percursos_em_lote, remover_percursos_em_lotes
 
 def calcular_horario_real(horario_programado, atraso_minutos):
     """Calcula o horário real baseado no programado + atraso"""
@@ -43,9 +42,8 @@ def gerar_dados_ficticios():
         print("❌ Nenhuma rota encontrada! Certifique-se de que há rotas configuradas.")
         return
     
-    # Conectar ao banco
-    conn = sqlite3.connect('dados.db')
-    cursor = conn.cursor()
+    # Percursos gerados, gravados ao final em uma única transação
+    percursos = []
     
     # Período: 01/07/2025 a 08/07/2025
     data_inicio = datetime(2025, 1, 1)
@@ -138,32 +136,15 @@ def gerar_dados_ficticios():
                         'data_atualizacao': None
                     }
                     
-                    # Inserir no banco
-                    cursor.execute('''
-                        INSERT INTO percursos (
-                            id, rota_id, nome_rota, data, turno,
-                            horario_saida_programado, horario_chegada_programado,
-                            horario_saida_real, horario_chegada_real,
-                            atraso_saida, atraso_chegada, observacoes,
-                            data_criacao, data_atualizacao
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        percurso['id'], percurso['rota_id'], percurso['nome_rota'],
-                        percurso['data'], percurso['turno'],
-                        percurso['horario_saida_programado'], percurso['horario_chegada_programado'],
-                        percurso['horario_saida_real'], percurso['horario_chegada_real'],
-                        percurso['atraso_saida'], percurso['atraso_chegada'],
-                        percurso['observacoes'], percurso['data_criacao'], percurso['data_atualizacao']
-                    ))
+                    percursos.append(percurso)
                     
                     total_percursos += 1
                     print(f"      ✅ {horario_saida_prog} - {status_desc}")
         
         data_atual += timedelta(days=1)
     
-    # Confirmar transação
-    conn.commit()
-    conn.close()
+    # Gravar (upsert pela chave natural: reexecutar não duplica percursos)
+    criar_percursos_em_lote(percursos)
     
     print(f"\n🎉 Dados fictícios gerados com sucesso!")
     print(f"📊 Total de percursos criados: {total_percursos}")
@@ -172,20 +153,12 @@ def gerar_dados_ficticios():
 
 def limpar_dados_periodo():
     """Remove dados do período especificado antes de gerar novos"""
-    conn = sqlite3.connect('dados.db')
-    cursor = conn.cursor()
-    
-    # Deletar dados do período
-    cursor.execute('''
-        DELETE FROM percursos 
-        WHERE data BETWEEN '2025-07-01' AND '2025-07-08'
-        AND observacoes LIKE '%Dados fictícios%'
-    ''')
-    
-    removidos = cursor.rowcount
-    conn.commit()
-    conn.close()
+    # Em lotes curtos (mesma rotina de DELETE /api/percursos), sem travar o banco
+    progresso = {'removidos': 0}
+    for progresso in remover_percursos_em_lotes(data_inicio='2025-07-01', data_fim='2025-07-08', origem='ficticio'):
+        pass
     
+    removidos = progresso['removidos']
     if removidos > 0:
         print(f"🗑️  Removidos {removidos} registros fictícios anteriores")
 
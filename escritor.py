@@ -0,0 +1,139 @@
+"""
+Escritor único com group commit para o SQLite.
+
+Uma thread dona da única conexão de escrita consome uma fila de operações e as
+agrupa em uma só transação (a cada `intervalo` segundos ou `max_lote`
+operações). Cada operação roda dentro de um SAVEPOINT próprio, então a falha de
+uma não desfaz as demais; o Future de quem chamou só é resolvido depois do
+COMMIT do lote. Com isso há um fsync por lote em vez de um por gravação e os
+escritores deixam de disputar o lock do banco. `ao_concluir(conn, confirmada)`,
+se informado, é chamado ao fim de cada lote, depois do COMMIT ou do ROLLBACK.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+_PARAR = object()
+
+
+class EscritorUnico:
+    """Thread de escrita com fila e commit em grupo"""
+
+    def __init__(self, fabrica_conexao, intervalo=0.005, max_lote=256, ao_concluir=None):
+        self._fabrica_conexao = fabrica_conexao
+        self.intervalo = intervalo
+        self.max_lote = max_lote
+        self._ao_concluir = ao_concluir
+        self._fila = queue.SimpleQueue()
+        self._thread = None
+        self.estatisticas = {'lotes': 0, 'operacoes': 0, 'falhas': 0}
+
+    @property
+    def ativo(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def iniciar(self):
+        if self.ativo:
+            return self
+        self._thread = threading.Thread(target=self._loop, name='escritor-sqlite', daemon=True)
+        self._thread.start()
+        return self
+
+    def parar(self, timeout=None):
+        """Processa o que já está na fila e encerra a thread"""
+        if not self.ativo:
+            return
+        self._fila.put(_PARAR)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def na_thread_do_escritor(self):
+        return threading.current_thread() is self._thread
+
+    def enviar(self, funcao, *args):
+        """Enfileira `funcao(conn, *args)` e retorna um Future com o resultado"""
+        if not self.ativo:
+            raise RuntimeError('Escritor único não está ativo')
+        futuro = Future()
+        self._fila.put((futuro, funcao, args))
+        return futuro
+
+    def executar(self, funcao, *args, timeout=None):
+        """Enfileira e aguarda o resultado (já gravado em disco)"""
+        return self.enviar(funcao, *args).result(timeout)
+
+    # === Thread de escrita ===
+
+    def _loop(self):
+        conn = self._fabrica_conexao()
+        conn.isolation_level = None  # transações controladas manualmente
+        conn.execute('PRAGMA journal_mode = WAL')  # leitores não bloqueiam o escritor
+        try:
+            while True:
+                item = self._fila.get()
+                if item is _PARAR:
+                    break
+                lote, parar = self._coletar_lote(item)
+                self._processar(conn, lote)
+                if parar:
+                    break
+        finally:
+            conn.close()
+
+    def _coletar_lote(self, primeiro):
+        lote = [primeiro]
+        limite = time.monotonic() + self.intervalo
+        while len(lote) < self.max_lote:
+            restante = limite - time.monotonic()
+            try:
+                item = self._fila.get(timeout=restante) if restante > 0 else self._fila.get_nowait()
+            except queue.Empty:
+                break
+            if item is _PARAR:
+                return lote, True
+            lote.append(item)
+        return lote, False
+
+    def _processar(self, conn, lote):
+        concluidos = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for futuro, funcao, args in lote:
+                if not futuro.set_running_or_notify_cancel():
+                    continue
+                conn.execute('SAVEPOINT operacao')
+                try:
+                    resultado = funcao(conn, *args)
+                except Exception as e:
+                    conn.execute('ROLLBACK TO operacao')
+                    conn.execute('RELEASE operacao')
+                    concluidos.append((futuro, e, False))
+                else:
+                    conn.execute('RELEASE operacao')
+                    concluidos.append((futuro, resultado, True))
+            conn.execute('COMMIT')
+        except Exception as e:
+            # Falha do lote inteiro (ex.: banco bloqueado por outro processo)
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            if self._ao_concluir is not None:
+                self._ao_concluir(conn, False)
+            self.estatisticas['falhas'] += 1
+            for futuro, _, _ in lote:
+                if futuro.done():
+                    continue
+                if futuro.running() or futuro.set_running_or_notify_cancel():
+                    futuro.set_exception(e)
+            return
+
+        if self._ao_concluir is not None:
+            self._ao_concluir(conn, True)
+        self.estatisticas['lotes'] += 1
+        self.estatisticas['operacoes'] += len(concluidos)
+        for futuro, valor, ok in concluidos:
+            if ok:
+                futuro.set_result(valor)
+            else:
+                futuro.set_exception(valor)
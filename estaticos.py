@@ -0,0 +1,125 @@
+"""
+Arquivos estáticos do dashboard servidos da memória, com fingerprint e
+variantes pré-comprimidas.
+
+Na carga, cada arquivo recebe um hash do conteúdo: CSS/JS ganham uma URL com
+o hash no nome (`/assets/style.<hash>.css`), servida com cache imutável de um
+ano; as páginas HTML têm as referências a esses arquivos reescritas para as
+URLs com hash e são servidas com revalidação (ETag), sem passar pelo Jinja.
+As versões gzip/brotli são geradas uma única vez e escolhidas pelo
+Accept-Encoding do cliente.
+"""
+
+import hashlib
+import mimetypes
+import os
+import re
+import time
+
+from flask import Response
+
+from compressao import codificacoes_suportadas, comprimir, escolher_codificacao
+
+CACHE_IMUTAVEL = 'public, max-age=31536000, immutable'
+CACHE_REVALIDAR = 'no-cache'
+
+# Abaixo disso a compressão não compensa o cabeçalho extra
+TAMANHO_MINIMO_COMPRESSAO = 1024
+
+
+class _Arquivo:
+    """Conteúdo de um arquivo e suas variantes comprimidas"""
+    __slots__ = ('nome', 'tipo', 'hash', 'variantes')
+
+    def __init__(self, nome, conteudo):
+        self.nome = nome
+        tipo = mimetypes.guess_type(nome)[0] or 'application/octet-stream'
+        self.tipo = f'{tipo}; charset=utf-8' if tipo.startswith('text/') or tipo.endswith('javascript') else tipo
+        self.hash = hashlib.sha256(conteudo).hexdigest()[:12]
+        self.variantes = {None: conteudo}
+        if len(conteudo) >= TAMANHO_MINIMO_COMPRESSAO:
+            for codificacao in codificacoes_suportadas():
+                comprimido = comprimir(conteudo, codificacao)
+                if len(comprimido) < len(conteudo):
+                    self.variantes[codificacao] = comprimido
+
+    @property
+    def nome_com_hash(self):
+        base, extensao = os.path.splitext(self.nome)
+        return f'{base}.{self.hash}{extensao}'
+
+
+class Estaticos:
+    """Conjunto de arquivos (CSS/JS) e páginas HTML carregados de `pasta`"""
+
+    def __init__(self, pasta, arquivos, paginas, prefixo='/assets/'):
+        self.pasta = pasta
+        self.nomes_arquivos = tuple(arquivos)
+        self.nomes_paginas = tuple(paginas)
+        self.prefixo = prefixo
+        self.carregar()
+
+    def carregar(self):
+        """(Re)lê os arquivos do disco, recalculando hashes e variantes"""
+        inicio = time.perf_counter()
+        arquivos = {}
+        for nome in self.nomes_arquivos:
+            with open(os.path.join(self.pasta, nome), 'rb') as f:
+                arquivos[nome] = _Arquivo(nome, f.read())
+
+        # Referências src="style.css"/href="dashboard.js" -> URL com hash
+        referencias = re.compile(
+            r'''(\b(?:src|href)=["'])(%s)(["'])''' % '|'.join(re.escape(n) for n in arquivos)
+        )
+        paginas = {}
+        for nome in self.nomes_paginas:
+            with open(os.path.join(self.pasta, nome), encoding='utf-8') as f:
+                html = f.read()
+            html = referencias.sub(lambda m: m[1] + self.url(arquivos[m[2]]) + m[3], html)
+            paginas[nome] = _Arquivo(nome, html.encode('utf-8'))
+
+        self._arquivos = arquivos
+        self._paginas = paginas
+        self._por_hash = {arquivo.nome_com_hash: arquivo for arquivo in arquivos.values()}
+        self.tempo_carga_ms = round((time.perf_counter() - inicio) * 1000, 1)
+
+    def url(self, arquivo):
+        return f'{self.prefixo}{arquivo.nome_com_hash}'
+
+    def urls(self):
+        """Nome original -> URL com hash (para uso em outras páginas)"""
+        return {nome: self.url(arquivo) for nome, arquivo in self._arquivos.items()}
+
+    def possui_pagina(self, nome):
+        return nome in self._paginas
+
+    def resposta_pagina(self, nome, requisicao):
+        return self._responder(self._paginas[nome], requisicao, CACHE_REVALIDAR)
+
+    def resposta_arquivo(self, nome, requisicao):
+        """Arquivo pelo nome original (URL antiga, sem hash): sempre revalidado"""
+        return self._responder(self._arquivos[nome], requisicao, CACHE_REVALIDAR)
+
+    def resposta_com_hash(self, nome_com_hash, requisicao):
+        """Arquivo pela URL com hash; None se o hash não corresponde ao conteúdo atual"""
+        arquivo = self._por_hash.get(nome_com_hash)
+        if arquivo is None:
+            return None
+        return self._responder(arquivo, requisicao, CACHE_IMUTAVEL)
+
+    def _responder(self, arquivo, requisicao, cache_control):
+        codificacao = escolher_codificacao(
+            requisicao.headers.get('Accept-Encoding'), [c for c in arquivo.variantes if c]
+        )
+        etag = f'{arquivo.hash}-{codificacao or "identity"}'
+
+        if etag in requisicao.if_none_match:
+            resposta = Response(status=304)
+        else:
+            resposta = Response(arquivo.variantes[codificacao], content_type=arquivo.tipo)
+            if codificacao:
+                resposta.headers['Content-Encoding'] = codificacao
+        resposta.set_etag(etag)
+        resposta.headers['Cache-Control'] = cache_control
+        resposta.headers['Vary'] = 'Accept-Encoding'
+        return resposta
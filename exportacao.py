@@ -0,0 +1,252 @@
+"""
+Exportação em streaming (CSV e XLSX) de percursos e relatórios.
+
+Os geradores recebem um iterável de linhas (tuplas vindas direto do cursor do
+SQLite) e produzem blocos de bytes conforme avançam, então o download começa
+imediatamente e a memória usada não cresce com o número de linhas.
+"""
+
+import csv
+import io
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+# Tamanho aproximado de cada bloco enviado ao cliente
+TAMANHO_BLOCO = 64 * 1024
+
+# (coluna no banco, título na planilha)
+COLUNAS_PERCURSOS = [
+    ('id', 'ID'),
+    ('rota_id', 'Rota ID'),
+    ('nome_rota', 'Rota'),
+    ('data', 'Data'),
+    ('turno', 'Turno'),
+    ('horario_saida_programado', 'Saída Programada'),
+    ('horario_chegada_programado', 'Chegada Programada'),
+    ('horario_saida_real', 'Saída Real'),
+    ('horario_chegada_real', 'Chegada Real'),
+    ('atraso_saida', 'Atraso Saída (min)'),
+    ('atraso_chegada', 'Atraso Chegada (min)'),
+    ('observacoes', 'Observações'),
+    ('data_criacao', 'Criado em'),
+    ('data_atualizacao', 'Atualizado em'),
+]
+
+# Colunas lidas do banco para a planilha do relatório de atrasos
+CAMPOS_RELATORIO = [
+    'data', 'nome_rota', 'turno', 'rota_id', 'horario_saida_programado', 'horario_chegada_programado',
+    'horario_saida_real', 'horario_chegada_real', 'atraso_saida', 'atraso_chegada', 'observacoes',
+]
+
+# Layout da planilha do relatório (o mesmo da antiga exportação do dashboard)
+COLUNAS_RELATORIO = [
+    ('data', 'Data'),
+    ('nome_rota', 'Rota'),
+    ('turno', 'Turno'),
+    ('tipo_movimento', 'Tipo Movimento'),
+    ('horario_programado', 'Horário Programado'),
+    ('horario_real', 'Horário Retorno/Destino'),
+    ('tolerancia_minima', 'Tolerância Mínima'),
+    ('tolerancia_maxima', 'Tolerância Máxima'),
+    ('atraso', 'Status'),
+    ('observacoes', 'Observações'),
+]
+
+TURNOS_EXIBICAO = {'primeiro_turno': '1º Turno', 'segundo_turno': '2º Turno'}
+
+FORMATOS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def _movimentos_da_escala(rotas):
+    """(rota, turno, horário na Martins) -> (tipo de movimento, tolerância mínima, tolerância máxima)"""
+    movimentos = {}
+    for rota in rotas:
+        for turno, horarios in rota.get('horarios', {}).items():
+            if not isinstance(horarios, list):
+                horarios = [horarios]  # estrutura antiga: um horário por turno
+            for horario in horarios:
+                if horario.get('chegada_martins'):
+                    tipo, martins = 'Chegada', horario['chegada_martins']
+                elif horario.get('saida_martins'):
+                    tipo, martins = 'Saída', horario['saida_martins']
+                else:
+                    continue
+                movimentos[(rota['id'], turno, martins)] = (
+                    tipo, horario.get('chegada_minima'), horario.get('chegada_maxima'))
+    return movimentos
+
+
+def formatar_linhas_relatorio(linhas, rotas=()):
+    """Linhas de CAMPOS_RELATORIO no layout de COLUNAS_RELATORIO.
+
+    Data em dd/mm/aaaa e turno como no dashboard. O tipo de movimento e as
+    tolerâncias vêm do horário da escala (`rotas`) igual ao horário programado
+    do percurso; fora da escala, a linha usa a chegada programada, como fazia a
+    exportação antiga. Status é o atraso do movimento (saída ou chegada).
+    """
+    movimentos = _movimentos_da_escala(rotas)
+    for (data, rota, turno, rota_id, saida_programada, chegada_programada,
+         saida_real, chegada_real, atraso_saida, atraso_chegada, observacoes) in linhas:
+        if data and len(data) == 10:
+            data = f'{data[8:10]}/{data[5:7]}/{data[0:4]}'
+        movimento = movimentos.get((rota_id, turno, saida_programada))
+        if movimento is None:
+            tipo, programado, minima, maxima = 'Chegada', chegada_programada, chegada_programada, chegada_programada
+        else:
+            (tipo, minima, maxima), programado = movimento, saida_programada
+        real, atraso = (saida_real, atraso_saida) if tipo == 'Saída' else (chegada_real, atraso_chegada)
+        yield (data or 'N/A', rota or 'N/A', TURNOS_EXIBICAO.get(turno, turno), tipo, programado or 'N/A',
+               real or 'N/A', minima or 'N/A', maxima or 'N/A', atraso or 0, observacoes or '')
+
+
+def gerar_csv(cabecalho, linhas):
+    """Gera o CSV em blocos de bytes (UTF-8 com BOM para abrir certo no Excel)"""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    buffer.write('\ufeff')
+    escritor.writerow(cabecalho)
+
+    for linha in linhas:
+        escritor.writerow(linha)
+        if buffer.tell() >= TAMANHO_BLOCO:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate(0)
+
+    yield buffer.getvalue().encode('utf-8')
+
+
+# === XLSX ===
+
+class _SaidaStream(io.RawIOBase):
+    """Destino não-posicionável para o ZipFile: acumula bytes até serem coletados"""
+
+    def __init__(self):
+        super().__init__()
+        self._partes = []
+
+    def writable(self):
+        return True
+
+    def write(self, dados):
+        self._partes.append(bytes(dados))
+        return len(dados)
+
+    def coletar(self):
+        dados = b''.join(self._partes)
+        self._partes.clear()
+        return dados
+
+
+# Caracteres de controle não são permitidos em XML 1.0
+_CARACTERES_INVALIDOS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+
+_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{nome}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+
+_PLANILHA_INICIO = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheetData>'
+)
+
+_PLANILHA_FIM = '</sheetData></worksheet>'
+
+
+def _celula(valor):
+    if valor is None or valor == '':
+        return '<c/>'
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return f'<c><v>{valor}</v></c>'
+    texto = escape(_CARACTERES_INVALIDOS.sub('', str(valor)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def _linha_xml(valores):
+    return '<row>' + ''.join(_celula(v) for v in valores) + '</row>'
+
+
+def gerar_xlsx(cabecalho, linhas, nome_planilha='Dados'):
+    """Gera um XLSX em modo somente-escrita, em blocos de bytes.
+
+    A planilha usa strings inline (sem sharedStrings) e o ZIP é escrito com
+    descritores de dados, o que permite emitir o arquivo sem conhecer seu
+    tamanho final nem manter as linhas em memória.
+    """
+    saida = _SaidaStream()
+    nome_planilha = escape(nome_planilha[:31], {'"': '&quot;'})
+
+    with zipfile.ZipFile(saida, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        zf.writestr('_rels/.rels', _RELS)
+        zf.writestr('xl/workbook.xml', _WORKBOOK.format(nome=nome_planilha))
+        zf.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+        yield saida.coletar()
+
+        with zf.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as planilha:
+            planilha.write((_PLANILHA_INICIO + _linha_xml(cabecalho)).encode('utf-8'))
+
+            pendente = []
+            tamanho = 0
+            for linha in linhas:
+                xml = _linha_xml(linha)
+                pendente.append(xml)
+                tamanho += len(xml)
+                if tamanho >= TAMANHO_BLOCO:
+                    planilha.write(''.join(pendente).encode('utf-8'))
+                    pendente.clear()
+                    tamanho = 0
+                    dados = saida.coletar()
+                    if dados:
+                        yield dados
+
+            planilha.write((''.join(pendente) + _PLANILHA_FIM).encode('utf-8'))
+
+    yield saida.coletar()
+
+
+def gerar_exportacao(formato, colunas, linhas, nome_planilha='Dados'):
+    """Escolhe o gerador adequado ao formato ('csv' ou 'xlsx')"""
+    cabecalho = [titulo for _, titulo in colunas]
+    if formato == 'xlsx':
+        return gerar_xlsx(cabecalho, linhas, nome_planilha)
+    return gerar_csv(cabecalho, linhas)
@@ -0,0 +1,57 @@
+"""
+Várias garagens, cada uma com seu próprio arquivo SQLite.
+
+Cada requisição escolhe a garagem pelo parâmetro `garagem` (ou cabeçalho
+`X-Garagem`) e todas as conexões abertas nela vão para o banco daquela
+garagem (`banco.usar_banco`). As garagens não disputam o mesmo lock de
+escrita, e os dados de uma não aparecem nas consultas de outra. Relatórios de
+todas as garagens rodam em paralelo, um por banco, em um pool de threads: o
+SQLite libera o GIL durante a consulta. Cada garagem devolve só agregados
+parciais, que são combinados aqui.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from banco import restaurar_banco, usar_banco
+
+# Valor de `garagem` que pede o relatório combinado de todas
+TODAS = 'todas'
+
+
+class Garagens:
+    """Registro garagem -> arquivo de banco, com execução em todas em paralelo"""
+
+    def __init__(self, arquivos, padrao=None, max_paralelo=8):
+        if not arquivos:
+            raise ValueError('Informe ao menos uma garagem')
+        if TODAS in arquivos:
+            raise ValueError(f'"{TODAS}" é reservado e não pode ser nome de garagem')
+        self.arquivos = dict(arquivos)
+        self.padrao = padrao if padrao is not None else next(iter(self.arquivos))
+        if self.padrao not in self.arquivos:
+            raise ValueError(f'Garagem padrão desconhecida: {self.padrao}')
+        self.max_paralelo = max_paralelo
+
+    def caminho(self, garagem=None):
+        """Arquivo de banco da garagem (None = padrão); KeyError se não existir"""
+        return self.arquivos[self.padrao if garagem is None else garagem]
+
+    def executar(self, garagem, funcao, *args, **kwargs):
+        """`funcao(*args, **kwargs)` com as conexões apontando para o banco da garagem"""
+        token = usar_banco(self.caminho(garagem))
+        try:
+            return funcao(*args, **kwargs)
+        finally:
+            restaurar_banco(token)
+
+    def em_todas(self, funcao, *args, **kwargs):
+        """Executa `funcao` em cada garagem ao mesmo tempo: {garagem: resultado}"""
+        if len(self.arquivos) == 1:
+            return {garagem: self.executar(garagem, funcao, *args, **kwargs) for garagem in self.arquivos}
+        with ThreadPoolExecutor(max_workers=min(self.max_paralelo, len(self.arquivos)),
+                                thread_name_prefix='garagens') as executor:
+            futuros = {
+                garagem: executor.submit(self.executar, garagem, funcao, *args, **kwargs)
+                for garagem in self.arquivos
+            }
+            return {garagem: futuro.result() for garagem, futuro in futuros.items()}
@@ -0,0 +1,231 @@
+"""
+Indicadores agregados de pontualidade calculados no próprio SQLite.
+
+Os agrupamentos e métricas são resolvidos com GROUP BY e funções de janela,
+de modo que só as linhas pedidas (ex.: as 10 piores rotas) saem do banco, em
+vez de carregar todos os percursos e ordenar em Python.
+"""
+
+from datetime import datetime
+
+from banco import montar_filtros_percursos, obter_conexao
+
+# Métrica -> (expressão SQL, ordenação que indica o pior resultado)
+METRICAS = {
+    'media_atraso_saida': ('AVG(atraso_saida)', 'DESC'),
+    # Como no relatório de atrasos: média só dos atrasos reais (positivos)
+    'media_atraso_chegada': ('COALESCE(AVG(CASE WHEN atraso_chegada > 0 THEN atraso_chegada END), 0)', 'DESC'),
+    'maior_atraso_saida': ('MAX(atraso_saida)', 'DESC'),
+    'maior_atraso_chegada': ('MAX(atraso_chegada)', 'DESC'),
+    'pontualidade_saida': ('100.0 * SUM(atraso_saida <= 0) / COUNT(*)', 'ASC'),
+    'pontualidade_chegada': ('100.0 * SUM(atraso_chegada <= 0) / COUNT(*)', 'ASC'),
+    'viagens_atrasadas': ('SUM(atraso_chegada > 0)', 'DESC'),
+}
+
+# Agrupamento -> [(chave na resposta, expressão SQL, entra no GROUP BY)]
+_NOME_ROTA = ('nome_rota', 'MAX(nome_rota)', False)
+AGRUPAMENTOS = {
+    'rota': [('rota_id', 'rota_id', True), _NOME_ROTA],
+    'turno': [('turno', 'turno', True)],
+    'horario': [('horario_saida_programado', 'horario_saida_programado', True)],
+    'slot': [('rota_id', 'rota_id', True), _NOME_ROTA, ('turno', 'turno', True),
+             ('horario_saida_programado', 'horario_saida_programado', True)],
+    'dia_semana': [('dia_semana', "CAST(strftime('%w', data) AS INTEGER)", True)],
+}
+
+DIAS_SEMANA = ('domingo', 'segunda', 'terça', 'quarta', 'quinta', 'sexta', 'sábado')
+
+LIMITE_MAXIMO = 500
+
+
+def calcular_ranking(metrica, agrupamento='rota', limite=10, ordem='pior', minimo_percursos=1,
+                     rota_id=None, data_inicio=None, data_fim=None, turno=None, desde=None, ate=None):
+    """Retorna os `limite` grupos com pior (ou melhor) valor da métrica no período"""
+    if metrica not in METRICAS:
+        raise ValueError(f'Métrica inválida. Opções: {", ".join(METRICAS)}')
+    if agrupamento not in AGRUPAMENTOS:
+        raise ValueError(f'Agrupamento inválido. Opções: {", ".join(AGRUPAMENTOS)}')
+    if ordem not in ('pior', 'melhor'):
+        raise ValueError('Ordem deve ser "pior" ou "melhor"')
+    if not 1 <= limite <= LIMITE_MAXIMO:
+        raise ValueError(f'Limite deve estar entre 1 e {LIMITE_MAXIMO}')
+
+    expressao, direcao = METRICAS[metrica]
+    if ordem == 'melhor':
+        direcao = 'ASC' if direcao == 'DESC' else 'DESC'
+
+    chaves = AGRUPAMENTOS[agrupamento]
+    selecao = ', '.join(f'{sql} AS {chave}' for chave, sql, _ in chaves)
+    grupo = ', '.join(sql for _, sql, agrupa in chaves if agrupa)
+    desempate = ', '.join(chave for chave, _, _ in chaves)
+    filtros, params = montar_filtros_percursos(rota_id, data_inicio, data_fim, turno, desde, ate)
+
+    with obter_conexao() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT *,
+                   RANK() OVER (ORDER BY valor {direcao}) AS posicao,
+                   COUNT(*) OVER () AS total_grupos
+            FROM (
+                SELECT {selecao}, {expressao} AS valor, COUNT(*) AS total_percursos
+                FROM percursos{filtros}
+                GROUP BY {grupo}
+                HAVING COUNT(*) >= ?
+            )
+            ORDER BY valor {direcao}, {desempate}
+            LIMIT ?
+        ''', params + [minimo_percursos, limite])
+        rows = cursor.fetchall()
+
+    ranking = []
+    for row in rows:
+        item = {'posicao': row['posicao']}
+        item.update((chave, row[chave]) for chave, _, _ in chaves)
+        if agrupamento == 'dia_semana':
+            item['nome_dia'] = DIAS_SEMANA[row['dia_semana']]
+        item['valor'] = round(row['valor'] or 0, 1)
+        item['total_percursos'] = row['total_percursos']
+        ranking.append(item)
+
+    return {
+        'metrica': metrica,
+        'agrupamento': agrupamento,
+        'ordem': ordem,
+        'total_grupos': rows[0]['total_grupos'] if rows else 0,
+        'ranking': ranking,
+        'data_geracao': datetime.now().isoformat()
+    }
+
+
+# Agrupamento da série temporal de cada slot -> expressão SQL do início do período
+PERIODOS_TENDENCIA = {
+    'dia': 'data',
+    'semana': "date(data, '-6 days', 'weekday 1')",  # segunda-feira da semana
+    'mes': "strftime('%Y-%m-01', data)",
+}
+
+# Variação mínima (pontos percentuais por período) para considerar tendência
+LIMIAR_TENDENCIA = 1.0
+
+
+def _inclinacao(valores):
+    """Inclinação da reta de mínimos quadrados de uma série igualmente espaçada"""
+    n = len(valores)
+    if n < 2:
+        return 0.0
+    media_x = (n - 1) / 2
+    media_y = sum(valores) / n
+    numerador = sum((i - media_x) * (y - media_y) for i, y in enumerate(valores))
+    denominador = sum((i - media_x) ** 2 for i in range(n))
+    return numerador / denominador
+
+
+def calcular_pontualidade_por_slot(data_inicio=None, data_fim=None, rota_id=None, turno=None, periodo='semana',
+                                   desde=None, ate=None):
+    """Estatísticas de atraso e tendência de pontualidade por slot da escala.
+
+    Slot é a combinação (rota, turno, horário de saída programado). Para cada
+    um retorna médias, máximo, percentil 90 do atraso de chegada, pontualidade
+    e a série por `periodo` (dia, semana ou mês) com a inclinação da
+    pontualidade de chegada ao longo do intervalo. `desde`/`ate` restringem à
+    janela de saída programada, como nos demais relatórios.
+    """
+    if periodo not in PERIODOS_TENDENCIA:
+        raise ValueError(f'Período inválido. Opções: {", ".join(PERIODOS_TENDENCIA)}')
+
+    filtros, params = montar_filtros_percursos(rota_id, data_inicio, data_fim, turno, desde, ate)
+    filtros += ' AND horario_saida_programado IS NOT NULL'  # percursos sem horário não têm slot
+    slot = 'rota_id, turno, horario_saida_programado'
+
+    with obter_conexao() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+
+        # Estatísticas por slot: sem período, lidas só do índice idx_percursos_slot_atrasos
+        # (já na ordem do GROUP BY); com data_inicio/data_fim, a faixa de datas vem de
+        # idx_percursos_data_slot e o agrupamento usa uma B-tree temporária
+        cursor.execute(f'''
+            SELECT s.*, COALESCE(r.nome, s.rota_id)
+            FROM (
+                SELECT {slot}, COUNT(*),
+                       {METRICAS['media_atraso_saida'][0]},
+                       {METRICAS['media_atraso_chegada'][0]},
+                       {METRICAS['maior_atraso_chegada'][0]},
+                       {METRICAS['pontualidade_saida'][0]},
+                       {METRICAS['pontualidade_chegada'][0]}
+                FROM percursos{filtros}
+                GROUP BY {slot}
+            ) s
+            LEFT JOIN rotas r ON r.id = s.rota_id
+        ''', params)
+        estatisticas = cursor.fetchall()
+
+        # Percentil 90 (posição mais próxima) do atraso de chegada por slot
+        cursor.execute(f'''
+            SELECT {slot}, MIN(atraso_chegada)
+            FROM (
+                SELECT {slot}, atraso_chegada,
+                       ROW_NUMBER() OVER (PARTITION BY {slot} ORDER BY atraso_chegada) AS posicao,
+                       COUNT(*) OVER (PARTITION BY {slot}) AS total
+                FROM percursos{filtros}
+            )
+            WHERE posicao >= 0.9 * total
+            GROUP BY {slot}
+        ''', params)
+        p90 = {linha[:3]: linha[3] for linha in cursor}
+
+        # Série de pontualidade por período dentro de cada slot
+        cursor.execute(f'''
+            SELECT {slot}, {PERIODOS_TENDENCIA[periodo]} AS inicio, COUNT(*),
+                   {METRICAS['pontualidade_chegada'][0]},
+                   {METRICAS['media_atraso_chegada'][0]}
+            FROM percursos{filtros}
+            GROUP BY {slot}, inicio
+            ORDER BY {slot}, inicio
+        ''', params)
+        series = {}
+        for *chave, inicio, total, pontualidade, media in cursor:
+            series.setdefault(tuple(chave), []).append({
+                'periodo': inicio,
+                'total_percursos': total,
+                'pontualidade_chegada': round(pontualidade, 1),
+                'media_atraso_chegada': round(media, 1)
+            })
+
+    slots = []
+    for (rota, turno_slot, horario, total, media_saida, media_chegada, maior_chegada,
+         pontualidade_saida, pontualidade_chegada, nome_rota) in estatisticas:
+        chave = (rota, turno_slot, horario)
+        serie = series.get(chave, [])
+        inclinacao = _inclinacao([ponto['pontualidade_chegada'] for ponto in serie])
+        if inclinacao >= LIMIAR_TENDENCIA:
+            situacao = 'melhorando'
+        elif inclinacao <= -LIMIAR_TENDENCIA:
+            situacao = 'piorando'
+        else:
+            situacao = 'estavel'
+
+        slots.append({
+            'rota_id': rota,
+            'nome_rota': nome_rota,
+            'turno': turno_slot,
+            'horario_saida_programado': horario,
+            'total_percursos': total,
+            'media_atraso_saida': round(media_saida or 0, 1),
+            'media_atraso_chegada': round(media_chegada, 1),
+            'maior_atraso_chegada': maior_chegada,
+            'p90_atraso_chegada': p90.get(chave),
+            'pontualidade_saida': round(pontualidade_saida, 1),
+            'pontualidade_chegada': round(pontualidade_chegada, 1),
+            'tendencia': {'pontos_por_periodo': round(inclinacao, 2), 'situacao': situacao},
+            'serie': serie
+        })
+    slots.sort(key=lambda s: (s['nome_rota'], s['turno'], s['horario_saida_programado']))
+
+    return {
+        'periodo': {'data_inicio': data_inicio, 'data_fim': data_fim},
+        'agrupamento_tendencia': periodo,
+        'total_slots': len(slots),
+        'slots': slots,
+        'data_geracao': datetime.now().isoformat()
+    }
@@ -0,0 +1,102 @@
+"""
+Provedor JSON do Flask com serializador rápido.
+
+Usa `orjson` quando instalado (opcional: `pip install orjson`) e cai para o
+módulo `json` da biblioteca padrão caso contrário. Também aceita fragmentos já
+serializados (`FragmentoJSON`), que são embutidos na resposta como bytes, sem
+nova codificação — útil para payloads mantidos em cache.
+"""
+
+import json
+import secrets
+
+from flask.json.provider import DefaultJSONProvider, _default
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende do ambiente
+    orjson = None
+
+
+class FragmentoJSON:
+    """Trecho de JSON já serializado (bytes UTF-8), embutido como está na saída"""
+    __slots__ = ('dados',)
+
+    def __init__(self, dados):
+        self.dados = dados.encode('utf-8') if isinstance(dados, str) else bytes(dados)
+
+    def __len__(self):
+        return len(self.dados)
+
+
+class JSONRapido(DefaultJSONProvider):
+    """DefaultJSONProvider com orjson (se disponível) e suporte a FragmentoJSON"""
+
+    # Chaves na ordem de inserção e UTF-8 direto: menos trabalho e payload menor
+    sort_keys = False
+    ensure_ascii = False
+
+    def __init__(self, app):
+        super().__init__(app)
+        # Marcador para fragmentos aninhados; o nonce impede colisão com dados reais
+        self._marcador = f'fragmento-json-{secrets.token_hex(8)}-'
+
+    @property
+    def backend(self):
+        return 'orjson' if orjson is not None else 'json'
+
+    def fragmento(self, obj):
+        """Serializa `obj` uma única vez, para reutilização em respostas futuras"""
+        return FragmentoJSON(self.dumps_bytes(obj))
+
+    def dumps_bytes(self, obj, indent=False):
+        """Serializa para bytes UTF-8 (caminho usado nas respostas)"""
+        if isinstance(obj, FragmentoJSON):
+            return obj.dados
+
+        fragmentos = []
+
+        def padrao(valor):
+            if isinstance(valor, FragmentoJSON):
+                fragmentos.append(valor.dados)
+                return f'{self._marcador}{len(fragmentos) - 1}'
+            return _default(valor)
+
+        if orjson is not None:
+            opcoes = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+            if self.sort_keys:
+                opcoes |= orjson.OPT_SORT_KEYS
+            if indent:
+                opcoes |= orjson.OPT_INDENT_2
+            dados = orjson.dumps(obj, default=padrao, option=opcoes)
+        else:
+            argumentos = {'indent': 2} if indent else {'separators': (',', ':')}
+            dados = json.dumps(
+                obj, default=padrao, ensure_ascii=self.ensure_ascii,
+                sort_keys=self.sort_keys, **argumentos
+            ).encode('utf-8')
+
+        for indice, fragmento in enumerate(fragmentos):
+            dados = dados.replace(f'"{self._marcador}{indice}"'.encode('utf-8'), fragmento, 1)
+        return dados
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # Opções específicas do json da biblioteca padrão
+            kwargs.setdefault('default', _default)
+            kwargs.setdefault('ensure_ascii', self.ensure_ascii)
+            kwargs.setdefault('sort_keys', self.sort_keys)
+            return json.dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(
+            self.dumps_bytes(obj, indent=indent) + b'\n', mimetype=self.mimetype
+        )
@@ -0,0 +1,253 @@
+"""
+Quadro da operação do dia: cada viagem da escala (rota × turno × horário) com
+o horário programado e o realizado, ou a situação de quem ainda não saiu.
+
+O quadro do dia corrente fica em memória. Ele é montado uma vez cruzando
+`escala_slots` com os percursos do dia pelo índice da chave natural
+(data, rota, turno, horário). Depois disso, cada consulta só lê o que foi
+gravado desde a última versão vista (`percursos_versoes`, alimentada por
+triggers em toda gravação) e aplica essas alterações no lugar. Gravações
+desfeitas (rollback) nunca chegam ao quadro, e gravações feitas fora do
+servidor entram do mesmo jeito. Mudanças na configuração das rotas refazem o
+quadro inteiro.
+"""
+
+import threading
+from datetime import date, datetime, timedelta
+
+from banco import banco_atual, obter_conexao
+from cobertura import CALENDARIOS, assinatura_escala
+
+# Campos do percurso (realizado) copiados para cada viagem do quadro
+CAMPOS_REALIZADO = (
+    'id', 'horario_saida_real', 'horario_chegada_real', 'atraso_saida', 'atraso_chegada',
+    'observacoes', 'saida_real_em', 'chegada_real_em',
+)
+
+SITUACOES = ('realizada', 'em_andamento', 'aguardando', 'sem_registro')
+
+_COLUNAS_REALIZADO_SQL = ', '.join(f'p.{campo}' for campo in CAMPOS_REALIZADO)
+
+
+def _minutos(horario):
+    try:
+        horas, minutos = horario.split(':')
+        if len(horario) == 5 and int(horas) < 24 and int(minutos) < 60:
+            return int(horas) * 60 + int(minutos)
+    except (AttributeError, ValueError):
+        pass
+    return None
+
+
+def momento_programado(data, turno, horario):
+    """Data e hora absolutas de um horário da escala ('AAAA-MM-DDTHH:MM').
+
+    Mesma regra da coluna `saida_programada_em`: no segundo turno, horários
+    antes de 12:00 são da madrugada seguinte ao dia de operação.
+    """
+    minutos = _minutos(horario)
+    if minutos is None:
+        return None
+    if turno == 'segundo_turno' and minutos < 720:
+        minutos += 1440
+    dia = date.fromisoformat(data) + timedelta(days=minutos // 1440)
+    return f'{dia:%Y-%m-%d}T{minutos % 1440 // 60:02d}:{minutos % 60:02d}'
+
+
+def _situacao(viagem, agora):
+    if viagem['horario_chegada_real']:
+        return 'realizada'
+    if viagem['horario_saida_real']:
+        return 'em_andamento'
+    programada = viagem['saida_programada_em']
+    if programada is None or programada > agora:
+        return 'aguardando'
+    return 'sem_registro'
+
+
+class QuadroOperacao:
+    """Viagens programadas e realizadas de um dia de operação, mantidas em memória"""
+
+    def __init__(self, data):
+        self.data = data
+        self.versao = None
+        self.assinatura_escala = None
+        self.montado_em = None
+        self.montagens = 0
+        self.alteracoes_aplicadas = 0
+        self._lock = threading.Lock()
+        self._viagens = {}          # (rota_id, turno, horário[, id fora da escala]) -> viagem
+        self._chave_percurso = {}   # id do percurso -> chave da viagem
+        self._ordenadas = None      # cache da lista ordenada (None = refazer)
+
+    # === Montagem ===
+
+    def _montar(self, conn, assinatura, versao):
+        programa_hoje = (int(datetime.strptime(self.data, '%Y-%m-%d').strftime('%w'))
+                         in CALENDARIOS['padrao'])
+        viagens = {}
+        if programa_hoje:
+            # Um slot da escala por linha; o percurso vem da busca no índice da chave natural
+            cursor = conn.execute(f'''
+                SELECT s.rota_id, s.nome_rota, s.turno, s.horario_saida, s.horario_chegada,
+                       {_COLUNAS_REALIZADO_SQL}
+                FROM escala_slots s
+                LEFT JOIN percursos p
+                       ON p.data = ? AND p.rota_id = s.rota_id
+                      AND p.turno = s.turno AND p.horario_saida_programado = s.horario_saida
+            ''', (self.data,))
+            for row in cursor:
+                viagem = self._nova_viagem(row['rota_id'], row['nome_rota'], row['turno'],
+                                           row['horario_saida'], row['horario_chegada'], True)
+                if row['id'] is not None:
+                    viagem.update((campo, row[campo]) for campo in CAMPOS_REALIZADO)
+                viagens[(row['rota_id'], row['turno'], row['horario_saida'])] = viagem
+
+        # Percursos do dia fora da escala (horário não programado, rota inativa ou dia sem escala)
+        cursor = conn.execute(f'''
+            SELECT p.rota_id, p.nome_rota, p.turno, p.horario_saida_programado,
+                   p.horario_chegada_programado, {_COLUNAS_REALIZADO_SQL}
+            FROM percursos p
+            WHERE p.data = ?
+        ''', (self.data,))
+        for row in cursor:
+            chave = (row['rota_id'], row['turno'], row['horario_saida_programado'])
+            if chave not in viagens:
+                self._colocar(viagens, row)
+
+        self._viagens = viagens
+        self._chave_percurso = {
+            viagem['id']: chave for chave, viagem in viagens.items() if viagem['id'] is not None
+        }
+        self._ordenadas = None
+        self.assinatura_escala = assinatura
+        self.versao = versao
+        self.montado_em = datetime.now().isoformat(timespec='seconds')
+        self.montagens += 1
+
+    def _nova_viagem(self, rota_id, nome_rota, turno, saida, chegada, programada):
+        viagem = {
+            'rota_id': rota_id,
+            'nome_rota': nome_rota,
+            'turno': turno,
+            'horario_saida_programado': saida,
+            'horario_chegada_programado': chegada,
+            'saida_programada_em': momento_programado(self.data, turno, saida),
+            'programada': programada,
+        }
+        viagem.update(dict.fromkeys(CAMPOS_REALIZADO))
+        return viagem
+
+    def _colocar(self, viagens, percurso):
+        """Percurso do dia no slot correspondente (ou como viagem fora da escala)"""
+        chave = (percurso['rota_id'], percurso['turno'], percurso['horario_saida_programado'])
+        viagem = viagens.get(chave)
+        if viagem is None or not viagem['programada']:
+            # Fora da escala a chave inclui o id: sem horário programado ela não é única
+            chave += (percurso['id'],)
+            viagem = viagens[chave] = self._nova_viagem(
+                percurso['rota_id'], percurso['nome_rota'], percurso['turno'],
+                percurso['horario_saida_programado'], percurso['horario_chegada_programado'], False
+            )
+        viagem.update((campo, percurso[campo]) for campo in CAMPOS_REALIZADO)
+        return chave
+
+    def _retirar(self, percurso_id):
+        """Tira o percurso do quadro (a viagem programada volta a ficar sem registro)"""
+        chave = self._chave_percurso.pop(percurso_id, None)
+        if chave is None:
+            return
+        viagem = self._viagens[chave]
+        if viagem['programada']:
+            viagem.update(dict.fromkeys(CAMPOS_REALIZADO))
+        else:
+            del self._viagens[chave]
+
+    # === Alterações incrementais ===
+
+    def _aplicar_alteracoes(self, conn, versao):
+        """Aplica os percursos gravados desde a versão do quadro até `versao`"""
+        cursor = conn.execute(f'''
+            SELECT v.percurso_id, p.data, p.rota_id, p.nome_rota, p.turno,
+                   p.horario_saida_programado, p.horario_chegada_programado, {_COLUNAS_REALIZADO_SQL}
+            FROM percursos_versoes v LEFT JOIN percursos p ON p.id = v.percurso_id
+            WHERE v.versao > ? AND v.versao <= ?
+        ''', (self.versao, versao))
+        for row in cursor:
+            self._retirar(row['percurso_id'])
+            if row['data'] == self.data:
+                self._chave_percurso[row['id']] = self._colocar(self._viagens, row)
+            self.alteracoes_aplicadas += 1
+        self._ordenadas = None
+        self.versao = versao
+
+    def atualizar(self):
+        """Deixa o quadro em dia com o banco (incremental; refaz só se a escala mudou)"""
+        with obter_conexao() as conn:
+            # Escala, versão e alterações lidas no mesmo snapshot
+            conn.execute('BEGIN')
+            assinatura = assinatura_escala(conn)
+            versao, horizonte = conn.execute('''
+                SELECT COALESCE(MAX(versao), 0), (SELECT versao FROM percursos_versoes_horizonte WHERE id = 1)
+                FROM percursos_versoes
+            ''').fetchone()
+            with self._lock:
+                # Antes do horizonte, remoções podem ter perdido a lápide: refaz
+                if (assinatura != self.assinatura_escala or self.versao is None
+                        or versao < self.versao or self.versao < horizonte):
+                    self._montar(conn, assinatura, versao)
+                elif versao > self.versao:
+                    self._aplicar_alteracoes(conn, versao)
+            conn.commit()
+
+    # === Consulta ===
+
+    def _em_ordem(self):
+        """Viagens em ordem de saída programada (lista mantida até a próxima alteração)"""
+        if self._ordenadas is None:
+            self._ordenadas = sorted(
+                self._viagens.values(),
+                key=lambda v: (v['saida_programada_em'] or '~', v['nome_rota'], v['turno'])
+            )
+        return self._ordenadas
+
+    def resumo(self, rota_id=None, turno=None, agora=None):
+        """Quadro com a situação de cada viagem no instante `agora` (padrão: agora)"""
+        agora = agora or datetime.now().strftime('%Y-%m-%dT%H:%M')
+        viagens = []
+        contagem = dict.fromkeys(SITUACOES, 0)
+        fora_da_escala = 0
+        with self._lock:
+            for viagem in self._em_ordem():
+                if (rota_id and viagem['rota_id'] != rota_id) or (turno and viagem['turno'] != turno):
+                    continue
+                situacao = _situacao(viagem, agora)
+                contagem[situacao] += 1
+                fora_da_escala += not viagem['programada']
+                viagens.append({**viagem, 'situacao': situacao})
+        return {
+            'data': self.data,
+            'agora': agora,
+            'versao': self.versao,
+            'resumo': {'total_viagens': len(viagens), **contagem, 'fora_da_escala': fora_da_escala},
+            'viagens': viagens,
+        }
+
+
+_quadros_do_dia = {}   # arquivo de banco (garagem) -> quadro de hoje
+_lock_quadro = threading.Lock()
+
+
+def obter_quadro(data=None):
+    """Quadro em dia do dia `data` (padrão: hoje). O de hoje é mantido em memória."""
+    hoje = datetime.now().strftime('%Y-%m-%d')
+    if data is not None and data != hoje:
+        quadro = QuadroOperacao(datetime.strptime(data, '%Y-%m-%d').strftime('%Y-%m-%d'))
+    else:
+        caminho = banco_atual()
+        with _lock_quadro:
+            quadro = _quadros_do_dia.get(caminho)
+            if quadro is None or quadro.data != hoje:
+                quadro = _quadros_do_dia[caminho] = QuadroOperacao(hoje)
+    quadro.atualizar()
+    return quadro
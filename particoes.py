@@ -0,0 +1,163 @@
+"""
+Relatório de atrasos de períodos longos calculado em paralelo, mês a mês.
+
+O período é dividido em meses. Cada mês é agregado por um processo do pool,
+com sua própria conexão de leitura ao mesmo arquivo que a requisição lê (o
+banco da garagem ou o snapshot da réplica, ver banco.arquivo_leitura), então
+as partições não disputam GIL nem conexão. Cada processo devolve só os agregados parciais de
+agregados.py (contagens, somas, máximos e contagens de pontuais por rota), que
+são combinados no processo do servidor. Como os parciais são somas inteiras e
+máximos, o resultado é idêntico ao do cálculo serial, qualquer que seja a
+divisão. O ganho cresce com o número de núcleos.
+"""
+
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, timedelta
+
+import banco
+from agregados import combinar_parciais
+
+# Processos do pool (criado na primeira partição e reaproveitado)
+PROCESSOS = os.cpu_count() or 1
+
+_pool = None
+_lock_pool = threading.Lock()
+
+
+def particionar_por_mes(data_inicio, data_fim):
+    """Intervalos (início, fim) de cada mês entre as datas, inclusive"""
+    inicio, fim = date.fromisoformat(data_inicio), date.fromisoformat(data_fim)
+    particoes = []
+    while inicio <= fim:
+        proximo_mes = (inicio.replace(day=1) + timedelta(days=32)).replace(day=1)
+        particoes.append((inicio.isoformat(), min(fim, proximo_mes - timedelta(days=1)).isoformat()))
+        inicio = proximo_mes
+    return particoes
+
+
+def _limitar_janela(data_inicio, data_fim, desde, ate):
+    """Janela de horário restrita ao que os percursos da partição podem ter.
+
+    A saída programada de um percurso cai no dia dele ou, no segundo turno, na
+    madrugada seguinte, então o corte não muda o resultado; só evita que cada
+    partição percorra o índice de `saida_programada_em` da janela inteira.
+    """
+    limite_inicio = f'{data_inicio}T00:00'
+    limite_fim = f'{date.fromisoformat(data_fim) + timedelta(days=1)}T23:59'
+    desde = max(banco.normalizar_momento(desde), limite_inicio) if desde else limite_inicio
+    ate = min(banco.normalizar_momento(ate), limite_fim) if ate else limite_fim
+    return desde, ate
+
+
+def _agregar_particao(caminho, data_inicio, data_fim, filtros):
+    """Roda em um processo do pool: agregados de uma partição do banco `caminho`"""
+    if filtros['desde'] or filtros['ate']:
+        filtros = {**filtros, **dict(zip(('desde', 'ate'), _limitar_janela(
+            data_inicio, data_fim, filtros['desde'], filtros['ate'])))}
+    token = banco.usar_banco(caminho)
+    try:
+        return banco.agregar_atrasos_por_rota(data_inicio=data_inicio, data_fim=data_fim, **filtros)
+    finally:
+        banco.restaurar_banco(token)
+
+
+@contextmanager
+def _sem_script_principal():
+    """Processos criados no bloco não reimportam o script principal.
+
+    Com spawn (Windows, macOS), cada processo novo do pool importa de novo o
+    `__main__` de quem o criou; para servidor.py isso é Flask, tkinter e a
+    compressão dos estáticos (~1 s) em cada processo. Eles só precisam deste
+    módulo, de banco.py e de agregados.py, que não têm efeitos na importação,
+    então o script fica oculto enquanto os processos são criados. Chamar com
+    `_lock_pool`.
+    """
+    principal = sys.modules['__main__']
+    if multiprocessing.get_start_method() == 'fork':
+        yield  # o processo filho já nasce com tudo carregado
+        return
+    spec, arquivo = principal.__spec__, principal.__dict__.pop('__file__', None)
+    principal.__spec__ = None
+    try:
+        yield
+    finally:
+        principal.__spec__ = spec
+        if arquivo is not None:
+            principal.__file__ = arquivo
+
+
+def _obter_pool():
+    global _pool
+    with _lock_pool:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PROCESSOS)
+        return _pool
+
+
+def _enviar_particoes(pool, caminho, particoes, filtros):
+    # Os processos do pool são criados sob demanda, a cada envio
+    with _lock_pool, _sem_script_principal():
+        return [pool.submit(_agregar_particao, caminho, inicio, fim, filtros) for inicio, fim in particoes]
+
+
+def _descartar_pool(pool):
+    global _pool
+    with _lock_pool:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def encerrar_pool():
+    """Encerra os processos do pool (um novo é criado se houver outra partição)"""
+    global _pool
+    with _lock_pool:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
+
+
+def _periodo(data_inicio, data_fim):
+    """Completa as pontas abertas do período com a primeira/última data com percursos"""
+    if data_inicio and data_fim:
+        return data_inicio, data_fim
+    with banco.obter_conexao() as conn:
+        primeira, ultima = conn.execute('SELECT MIN(data), MAX(data) FROM percursos').fetchone()
+    return data_inicio or primeira, data_fim or ultima
+
+
+def agregar_periodo_longo(rota_id=None, data_inicio=None, data_fim=None, minimo_meses=3, desde=None, ate=None):
+    """Agregado de atrasos por rota calculado mês a mês em paralelo.
+
+    Retorna None se o período tem menos de `minimo_meses` meses (ou datas fora
+    do formato AAAA-MM-DD): nesse caso o cálculo serial compensa mais. Se a
+    leitura atual não pode ser aberta por outro processo (réplica em memória),
+    o período inteiro é agregado aqui mesmo, na réplica.
+    """
+    data_inicio, data_fim = _periodo(data_inicio, data_fim)
+    try:
+        particoes = particionar_por_mes(data_inicio, data_fim)
+    except (TypeError, ValueError):
+        return None
+    if len(particoes) < minimo_meses:
+        return None
+
+    caminho = banco.arquivo_leitura()
+    filtros = {'rota_id': rota_id, 'desde': desde, 'ate': ate}
+    if PROCESSOS < 2 or caminho is None:
+        # Um núcleo só (dividir não ganha nada) ou leitura só deste processo: agrega aqui mesmo
+        return banco.agregar_atrasos_por_rota(data_inicio=data_inicio, data_fim=data_fim, **filtros)
+    pool = _obter_pool()
+    try:
+        parciais = [futuro.result() for futuro in _enviar_particoes(pool, caminho, particoes, filtros)]
+    except BrokenProcessPool:
+        # Processo do pool encerrado (ex.: falta de memória): refaz aqui mesmo e recria o pool depois
+        _descartar_pool(pool)
+        parciais = [_agregar_particao(caminho, inicio, fim, filtros) for inicio, fim in particoes]
+    return combinar_parciais(parciais)
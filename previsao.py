@@ -0,0 +1,202 @@
+"""
+Previsão de atraso por slot da escala (rota × turno × horário programado).
+
+O histórico de `atraso_saida`/`atraso_chegada` é carregado em matrizes NumPy
+slot × dia e todos os slots são ajustados de uma vez, com operações vetoriais:
+
+- sazonalidade semanal: média do slot em cada dia da semana;
+- suavização exponencial do resíduo (atraso - média do dia da semana), que
+  acompanha mudanças recentes de nível.
+
+A previsão de um dia é `média do dia da semana + nível do resíduo`. O erro
+médio absoluto das previsões um passo à frente no histórico acompanha cada
+valor. As previsões são gravadas na tabela `previsoes` e lidas de lá pela API,
+então só o recálculo depende do NumPy (opcional: `pip install numpy`).
+"""
+
+import time
+from datetime import date, datetime, timedelta
+
+from banco import obter_conexao
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - depende do ambiente
+    np = None
+
+MODELO = 'sazonal_semanal+suavizacao_exponencial'
+
+# Métrica -> horário real que precisa estar preenchido para o atraso valer
+METRICAS = {
+    'atraso_saida': 'horario_saida_real',
+    'atraso_chegada': 'horario_chegada_real',
+}
+
+
+def numpy_disponivel():
+    return np is not None
+
+
+def _carregar_historico(conn, inicio, fim):
+    """Matrizes slot × dia (NaN onde não há viagem) de cada métrica, mais os slots"""
+    valores = ', '.join(
+        f"CASE WHEN COALESCE({real}, '') <> '' THEN {metrica} END"
+        for metrica, real in METRICAS.items()
+    )
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(f'''
+        SELECT rota_id, turno, horario_saida_programado, data, {valores}
+        FROM percursos
+        WHERE data BETWEEN ? AND ? AND horario_saida_programado IS NOT NULL
+    ''', (inicio.isoformat(), fim.isoformat()))
+    rows = cursor.fetchall()
+
+    total_dias = (fim - inicio).days + 1
+    if not rows:
+        return [], {m: np.empty((0, total_dias)) for m in METRICAS}
+
+    rota, turno, horario, datas, *colunas = zip(*rows)
+    chaves = np.char.add(np.char.add(np.char.add(np.array(rota, dtype=str), '\x1f'),
+                                     np.char.add(np.array(turno, dtype=str), '\x1f')),
+                         np.array(horario, dtype=str))
+    unicas, linha = np.unique(chaves, return_inverse=True)
+    coluna = (np.array(datas, dtype='datetime64[D]') - np.datetime64(inicio.isoformat(), 'D')).astype(int)
+
+    matrizes = {}
+    for metrica, valores_metrica in zip(METRICAS, colunas):
+        matriz = np.full((len(unicas), total_dias), np.nan)
+        matriz[linha, coluna] = np.array(valores_metrica, dtype=float)  # None -> NaN
+        matrizes[metrica] = matriz
+
+    slots = [tuple(chave.split('\x1f')) for chave in unicas.tolist()]
+    return slots, matrizes
+
+
+def _ajustar(matriz, dias_semana, alfa):
+    """Ajusta o modelo para todos os slots (linhas) de uma vez.
+
+    Retorna (sazonal slot × 7, nível do resíduo, erro médio absoluto, amostras).
+    """
+    observado = ~np.isnan(matriz)
+    amostras = observado.sum(axis=1)
+
+    # Média por dia da semana; sem histórico naquele dia, usa a média do slot
+    soma = np.where(observado, matriz, 0.0)
+    media_geral = soma.sum(axis=1) / np.maximum(amostras, 1)
+    sazonal = np.empty((matriz.shape[0], 7))
+    for dia in range(7):
+        colunas = dias_semana == dia
+        n = observado[:, colunas].sum(axis=1)
+        sazonal[:, dia] = np.where(n > 0, soma[:, colunas].sum(axis=1) / np.maximum(n, 1), media_geral)
+
+    # Suavização exponencial do resíduo, dia a dia, vetorizada entre os slots
+    residuo = matriz - sazonal[:, dias_semana]
+    nivel = np.zeros(matriz.shape[0])
+    soma_erros = np.zeros(matriz.shape[0])
+    for dia in range(matriz.shape[1]):
+        presente = observado[:, dia]
+        erro = np.where(presente, residuo[:, dia] - nivel, 0.0)
+        soma_erros += np.abs(erro)
+        nivel += alfa * erro
+
+    erro_medio = np.where(amostras > 0, soma_erros / np.maximum(amostras, 1), np.nan)
+    return sazonal, nivel, erro_medio, amostras
+
+
+def gerar_previsoes(data_base=None, dias=1, dias_historico=365, alfa=0.2):
+    """Recalcula as previsões dos `dias` seguintes a `data_base` (padrão: hoje).
+
+    Usa o histórico de `dias_historico` dias até `data_base` e substitui as
+    previsões já gravadas para as datas previstas.
+    """
+    if np is None:
+        raise RuntimeError('NumPy não está instalado (pip install numpy)')
+    if not 1 <= dias <= 60:
+        raise ValueError('dias deve estar entre 1 e 60')
+    if not 7 <= dias_historico <= 3660:
+        raise ValueError('dias_historico deve estar entre 7 e 3660')
+    if not 0 < alfa <= 1:
+        raise ValueError('alfa deve estar entre 0 e 1')
+
+    inicio_execucao = time.perf_counter()
+    data_base = date.fromisoformat(data_base) if isinstance(data_base, str) else (data_base or date.today())
+    inicio = data_base - timedelta(days=dias_historico - 1)
+    # Dia da semana de cada coluna (0 = segunda, como date.weekday)
+    dias_semana = (np.arange(dias_historico) + inicio.weekday()) % 7
+    datas_previstas = [data_base + timedelta(days=i) for i in range(1, dias + 1)]
+
+    with obter_conexao() as conn:
+        slots, matrizes = _carregar_historico(conn, inicio, data_base)
+        tempo_carga = time.perf_counter() - inicio_execucao
+
+        previsto, erros, amostras = {}, {}, None
+        for metrica, matriz in matrizes.items():
+            sazonal, nivel, erros[metrica], n = _ajustar(matriz, dias_semana, alfa)
+            previsto[metrica] = np.round(sazonal + nivel[:, None], 1)  # slot × dia da semana
+            amostras = n if amostras is None else np.maximum(amostras, n)
+
+        gerado_em = datetime.now().isoformat()
+        linhas = []
+        for dia in datas_previstas:
+            semana = dia.weekday()
+            # Só prevê slots que já rodaram naquele dia da semana
+            rodou = np.zeros(len(slots), dtype=bool)
+            for matriz in matrizes.values():
+                rodou |= ~np.isnan(matriz[:, dias_semana == semana]).all(axis=1)
+            for i in np.flatnonzero(rodou).tolist():
+                linhas.append((
+                    *slots[i], dia.isoformat(),
+                    *(_numero(previsto[m][i, semana]) for m in METRICAS),
+                    *(_numero(erros[m][i], 2) for m in METRICAS),
+                    int(amostras[i]), MODELO, gerado_em
+                ))
+
+        conn.execute(
+            f'DELETE FROM previsoes WHERE data IN ({", ".join("?" * len(datas_previstas))})',
+            [d.isoformat() for d in datas_previstas]
+        )
+        conn.executemany('''
+            INSERT INTO previsoes (
+                rota_id, turno, horario_saida_programado, data,
+                atraso_saida_previsto, atraso_chegada_previsto,
+                erro_medio_saida, erro_medio_chegada, amostras, modelo, gerado_em
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', linhas)
+        conn.commit()
+
+    return {
+        'data_base': data_base.isoformat(),
+        'datas': [d.isoformat() for d in datas_previstas],
+        'slots': len(slots),
+        'previsoes': len(linhas),
+        'modelo': MODELO,
+        'tempo_carga_s': round(tempo_carga, 3),
+        'tempo_total_s': round(time.perf_counter() - inicio_execucao, 3),
+    }
+
+
+def _numero(valor, casas=1):
+    """float do NumPy -> float Python (NaN vira None)"""
+    return None if np.isnan(valor) else round(float(valor), casas)
+
+
+def obter_previsoes(data=None, rota_id=None, turno=None):
+    """Previsões gravadas para o dia (padrão: amanhã)"""
+    data = data or (date.today() + timedelta(days=1)).isoformat()
+    condicoes, params = ['p.data = ?'], [data]
+    if rota_id:
+        condicoes.append('p.rota_id = ?')
+        params.append(rota_id)
+    if turno:
+        condicoes.append('p.turno = ?')
+        params.append(turno)
+
+    with obter_conexao() as conn:
+        rows = conn.execute(f'''
+            SELECT p.*, COALESCE(r.nome, p.rota_id) AS nome_rota
+            FROM previsoes p LEFT JOIN rotas r ON r.id = p.rota_id
+            WHERE {' AND '.join(condicoes)}
+            ORDER BY nome_rota, p.turno, p.horario_saida_programado
+        ''', params).fetchall()
+    return [dict(row) for row in rows]
@@ -0,0 +1,231 @@
+"""
+Réplica de leitura do banco para relatórios e listagens pesadas.
+
+Um snapshot completo de `dados.db` é copiado com a API de backup do SQLite
+(`sqlite3.Connection.backup`) em passos de algumas páginas, com uma pausa
+entre eles para não segurar o banco principal. O destino é a memória ou um
+arquivo em tmpfs (ex.: `/dev/shm`). Uma thread verifica periodicamente se o
+principal mudou (`PRAGMA data_version`) e, nesse caso, gera um novo snapshot
+e o publica no lugar do anterior; consultas já abertas terminam no snapshot
+antigo. O snapshot nunca é alterado depois de publicado, então as leituras não
+disputam lock com as gravações dos operadores.
+
+O atraso da réplica é o tempo desde a primeira gravação ainda não incluída no
+snapshot (gravações deste processo são vistas na hora, pelo gancho de
+banco.py; as feitas por fora, na próxima verificação). Cada endpoint define o
+atraso máximo aceito; acima dele a leitura vai ao banco principal.
+"""
+
+import itertools
+import os
+import sqlite3
+import threading
+import time
+
+import banco
+
+_geracoes = itertools.count(1)
+
+MAXIMO_REINICIOS_COM_PAUSA = 3
+
+
+class Replica:
+    """Snapshot de leitura do banco, atualizado em segundo plano"""
+
+    def __init__(self, destino=':memory:', intervalo=2.0, paginas_por_passo=256, pausa=0.002):
+        self.destino = destino
+        self.origem = None          # arquivo do banco principal copiado
+        self.intervalo = intervalo
+        self.paginas_por_passo = paginas_por_passo
+        self.pausa = pausa
+
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._thread = None
+        self._fonte = None          # conexão ao principal, usada só pela thread de atualização
+        self._ancora = None         # mantém o snapshot em memória vivo
+        self._uri = None            # snapshot publicado
+        self._versao_dados = None   # PRAGMA data_version do principal no último snapshot
+        self._pendente_desde = None     # primeira gravação fora do snapshot (monotonic)
+        self._ultima_gravacao = None
+        self._restantes = None
+        self._reinicios = 0
+
+        self.versao = None          # MAX(versao) de percursos_versoes no snapshot
+        self.atualizada_em = None
+        self.duracao_ultima_s = None
+        self.reinicios_ultima = 0
+        self.atualizacoes = 0
+        self.ultimo_erro = None
+
+    # === Ciclo de vida ===
+
+    def iniciar(self):
+        """Gera o primeiro snapshot (síncrono) e inicia a thread de atualização"""
+        banco.registrar_gancho_percurso(self._ao_gravar_percurso)
+        banco.registrar_gancho_rota(self._ao_gravar_rota)
+        self.origem = banco.DATABASE_FILE
+        self._fonte = sqlite3.connect(self.origem, check_same_thread=False)
+        self._atualizar()
+        self._thread = threading.Thread(target=self._executar, name='replica-leitura', daemon=True)
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._lock:
+            if self._ancora is not None:
+                self._ancora.close()
+                self._ancora = None
+            self._uri = None
+        if self._fonte is not None:
+            self._fonte.close()
+            self._fonte = None
+
+    def _executar(self):
+        while not self._parar.wait(self.intervalo):
+            try:
+                versao_dados = self._fonte.execute('PRAGMA data_version').fetchone()[0]
+                if versao_dados != self._versao_dados:
+                    self._marcar_pendente()  # alteração feita por fora deste processo
+                    self._atualizar()
+                elif self._pendente_desde is not None and self._versao_principal() == self.versao:
+                    self._pendente_desde = None  # gravação desfeita (rollback)
+            except sqlite3.Error as e:
+                self.ultimo_erro = str(e)
+
+    # === Snapshot ===
+
+    def _atualizar(self):
+        inicio = time.monotonic()
+        versao_dados = self._fonte.execute('PRAGMA data_version').fetchone()[0]
+
+        geracao = next(_geracoes)
+        if self.destino == ':memory:':
+            uri = f'file:replica_{id(self)}_{geracao}?mode=memory&cache=shared'
+            destino = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        else:
+            temporario = f'{self.destino}.{geracao}.tmp'
+            destino = sqlite3.connect(temporario)
+
+        self._restantes, self._reinicios = None, 0
+        try:
+            self._fonte.backup(destino, pages=self.paginas_por_passo, progress=self._pausar)
+            if self.destino != ':memory:':
+                destino.execute('PRAGMA journal_mode = DELETE')  # leitores abrem como imutável
+            versao = destino.execute('SELECT COALESCE(MAX(versao), 0) FROM percursos_versoes').fetchone()[0]
+        except BaseException:
+            destino.close()
+            if self.destino != ':memory:':
+                os.remove(temporario)
+            raise
+
+        if self.destino != ':memory:':
+            destino.close()
+            os.replace(temporario, self.destino)  # leitores abertos seguem no arquivo antigo
+            uri, destino = f'file:{self.destino}?mode=ro&immutable=1', None
+
+        with self._lock:
+            anterior, self._ancora, self._uri = self._ancora, destino, uri
+            self._versao_dados = versao_dados
+            self.versao = versao
+            self.atualizada_em = time.time()
+            self.duracao_ultima_s = round(time.monotonic() - inicio, 3)
+            self.reinicios_ultima = self._reinicios
+            self.atualizacoes += 1
+            # Gravações anteriores ao início da cópia estão no snapshot
+            if self._ultima_gravacao is None or self._ultima_gravacao < inicio:
+                self._pendente_desde = None
+            elif self._pendente_desde is not None:
+                self._pendente_desde = max(self._pendente_desde, inicio)
+        if anterior is not None:
+            anterior.close()  # a memória é liberada quando o último leitor fechar
+        self.ultimo_erro = None
+
+    def _pausar(self, status, restantes, total):
+        # Uma gravação no principal durante a cópia reinicia o backup; depois de
+        # alguns reinícios a cópia segue sem pausas para não ficar presa atrás
+        # de um fluxo contínuo de gravações (em WAL, não bloqueia os escritores)
+        if self._restantes is not None and restantes > self._restantes:
+            self._reinicios += 1
+        self._restantes = restantes
+        if restantes and self.pausa and self._reinicios < MAXIMO_REINICIOS_COM_PAUSA:
+            time.sleep(self.pausa)
+
+    def _versao_principal(self):
+        return self._fonte.execute('SELECT COALESCE(MAX(versao), 0) FROM percursos_versoes').fetchone()[0]
+
+    # === Atraso ===
+
+    def _marcar_pendente(self):
+        agora = time.monotonic()
+        with self._lock:
+            self._ultima_gravacao = agora
+            if self._pendente_desde is None:
+                self._pendente_desde = agora
+
+    def _ao_gravar_percurso(self, conn, anterior, atual):
+        """Gancho de banco.py: a réplica passa a estar atrasada a partir desta gravação"""
+        if banco.banco_atual() == self.origem:  # gravações em outras garagens não contam
+            self._marcar_pendente()
+
+    def _ao_gravar_rota(self, conn, rota_id):
+        """Gancho de banco.py: nomes e escalas das rotas também são lidos da réplica"""
+        if banco.banco_atual() == self.origem:
+            self._marcar_pendente()
+
+    def atraso_s(self):
+        """Segundos desde a primeira gravação que ainda não está no snapshot (0 se em dia)"""
+        pendente_desde = self._pendente_desde
+        return 0.0 if pendente_desde is None else time.monotonic() - pendente_desde
+
+    def estado(self):
+        """Resumo para monitoramento (inclui o atraso em versões, que consulta o principal)"""
+        with banco.obter_conexao() as conn:
+            versao_principal = conn.execute(
+                'SELECT COALESCE(MAX(versao), 0) FROM percursos_versoes'
+            ).fetchone()[0]
+        return {
+            'ativa': self._uri is not None,
+            'destino': self.destino,
+            'versao': self.versao,
+            'versao_principal': versao_principal,
+            'atraso_versoes': versao_principal - (self.versao or 0),
+            'atraso_s': round(self.atraso_s(), 3),
+            'atualizada_em': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.atualizada_em))
+                             if self.atualizada_em else None,
+            'duracao_ultima_atualizacao_s': self.duracao_ultima_s,
+            'reinicios_ultima_atualizacao': self.reinicios_ultima,
+            'atualizacoes': self.atualizacoes,
+            'intervalo_s': self.intervalo,
+            'ultimo_erro': self.ultimo_erro,
+        }
+
+    # === Leitura ===
+
+    def conectar(self):
+        """Nova conexão somente leitura ao snapshot publicado"""
+        with self._lock:
+            uri = self._uri
+        if uri is None:
+            raise sqlite3.OperationalError('Réplica de leitura não iniciada')
+        conn = sqlite3.connect(uri, uri=True)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA query_only = 1')
+        return conn
+
+    # Como fonte de leitura de banco.py, a réplica abre conexões quando chamada
+    __call__ = conectar
+
+    @property
+    def arquivo(self):
+        """Arquivo do snapshot, que outros processos podem abrir (None se está em memória)"""
+        return None if self.destino == ':memory:' else self.destino
+
+    def fonte_se_atualizada(self, atraso_maximo_s):
+        """A própria réplica (fonte de leitura) se o atraso está dentro do limite; senão None (usar o principal)"""
+        if self._uri is None or self.atraso_s() > atraso_maximo_s:
+            return None
+        return self
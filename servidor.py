@@ -1,15 +1,20 @@
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory
 from flask_cors import CORS
 from datetime import datetime, time, timedelta
+import os
+import sqlite3
 import uuid
 import tkinter as tk
 from tkinter import ttk
 import webbrowser
 import threading
+from time import perf_counter
+from operator import attrgetter
 
 # Importar todas as funções do banco de dados
 from banco import (
     inicializar_banco,
+    ativar_escritor_unico,
     verificar_credenciais,
     contar_usuarios,
     criar_usuario,
@@ -20,14 +25,194 @@ from banco import (
     deletar_rota,
     carregar_percursos,
     obter_percursos_filtrados,
+    obter_alteracoes_percursos,
+    purgar_lapides,
+    buscar_percursos,
+    iterar_percursos_filtrados,
     criar_percurso,
-    obter_percurso_por_id,
     atualizar_percurso,
-    deletar_percurso
+    deletar_percurso,
+    contar_percursos_filtrados,
+    remover_percursos_em_lotes,
+    ORIGENS_PERCURSO,
+    percursos_para_json,
+    CAMPOS_PERCURSO_EDITAVEIS,
+    usar_fonte_leitura,
+    restaurar_fonte_leitura,
+    normalizar_momento,
+    usar_banco,
+    restaurar_banco,
+    banco_atual,
+    agregar_atrasos_por_rota,
+    CAMPOS_PERCURSO
 )
+from exportacao import (
+    CAMPOS_RELATORIO,
+    COLUNAS_PERCURSOS,
+    COLUNAS_RELATORIO,
+    FORMATOS,
+    formatar_linhas_relatorio,
+    gerar_exportacao
+)
+from cobertura import calcular_cobertura, sincronizar_escala
+from indicadores import calcular_ranking, calcular_pontualidade_por_slot
+from alertas import listar_alertas, aguardar_alertas, obter_estatisticas, sincronizar_estatisticas
+from previsao import gerar_previsoes, obter_previsoes, numpy_disponivel
+from operacao import obter_quadro
+from json_rapido import JSONRapido
+from estaticos import Estaticos
+from compressao import CompressaoRespostas
+from replica import Replica
+from garagens import Garagens, TODAS
+from agregados import combinar_parciais, relatorio_de_agregado
+from particoes import PROCESSOS, agregar_periodo_longo
+from amostragem import intervalos_exatos, relatorio_aproximado
+
+# Gravações de percursos por uma única thread com commit em grupo (ver escritor.py),
+# desativado por padrão. Ao ativar, o escritor passa o banco para o modo WAL, o
+# que fica gravado no arquivo: os arquivos -wal/-shm acompanham o dados.db e
+# voltar atrás exige `PRAGMA journal_mode = DELETE` com o servidor parado
+USAR_ESCRITOR_UNICO = False
+
+# Garagens (ver garagens.py): id -> arquivo de banco, a primeira é a padrão.
+# Vazio = uma garagem só, em banco.DATABASE_FILE.
+# Ex.: {'centro': 'dados.db', 'norte': 'dados_norte.db'}
+GARAGENS = {}
+
+# Endpoints que aceitam garagem=todas (agregam os bancos de todas as garagens)
+ENDPOINTS_TODAS_GARAGENS = {'relatorio_atrasos'}
+
+# Relatório de atrasos com período de pelo menos estes meses: resumo e por rota
+# calculados mês a mês em paralelo, em processos (ver particoes.py). None desativa.
+MESES_RELATORIO_PARALELO = 3
+
+# Relatório de atrasos com modo=aproximado (ver amostragem.py): percursos
+# sorteados por consulta e tamanho do período até o qual o resultado é exato
+AMOSTRA_RELATORIO_APROXIMADO = 10000
+LIMITE_RELATORIO_EXATO = 50000
+
+# Compressão gzip/brotli das respostas JSON/CSV da API (ver compressao.py):
+# tamanho mínimo em bytes e nível por codificação
+TAMANHO_MINIMO_COMPRESSAO = 1024
+NIVEIS_COMPRESSAO = {'br': 4, 'gzip': 6}
+
+# Lápides de percursos removidos mantidas para a sincronização incremental
+# (/api/percursos/changes), em versões; as mais antigas são descartadas na
+# inicialização e clientes com `since` anterior a elas recebem a lista completa
+RETENCAO_LAPIDES = 50000
+
+# Réplica de leitura para relatórios e listagens (ver replica.py), desativada
+# (None) por padrão. Para ativar, use ':memory:' ou um arquivo em tmpfs (ex.:
+# '/dev/shm/maxtour_replica.db'); o snapshot ocupa a memória de uma cópia do banco
+REPLICA_LEITURA = None
+INTERVALO_REPLICA = 2.0
+
+# Atraso máximo (s) aceito da réplica por endpoint; acima dele, ou para
+# endpoints fora desta lista, a leitura vai ao banco principal
+FRESCOR_REPLICA = {
+    'obter_percursos': 5,
+    'exportar_percursos': 30,
+    'relatorio_atrasos': 30,
+    'exportar_relatorio_atrasos': 30,
+    'relatorio_ranking': 60,
+    'relatorio_slots': 60,
+    'relatorio_cobertura': 60,
+}
 
 app = Flask(__name__, template_folder='utils', static_folder='utils')
+app.json = JSONRapido(app)
 CORS(app)
+CompressaoRespostas(app, tamanho_minimo=TAMANHO_MINIMO_COMPRESSAO, niveis=NIVEIS_COMPRESSAO)
+
+replica = None
+garagens = Garagens(GARAGENS) if GARAGENS else None
+
+def _garagem_pedida():
+    return request.args.get('garagem') or request.headers.get('X-Garagem')
+
+def _iterar_no_banco(caminho, blocos):
+    """Consome uma resposta em streaming com as conexões apontando para `caminho`"""
+    iterador = iter(blocos)
+    try:
+        while True:
+            token = usar_banco(caminho)
+            try:
+                bloco = next(iterador)
+            except StopIteration:
+                return
+            finally:
+                restaurar_banco(token)
+            yield bloco
+    finally:
+        if hasattr(blocos, 'close'):
+            blocos.close()
+
+@app.before_request
+def _selecionar_garagem():
+    """Conexões da requisição vão para o banco da garagem pedida (ou da padrão)"""
+    garagem = _garagem_pedida()
+    if garagem == TODAS:
+        if request.endpoint not in ENDPOINTS_TODAS_GARAGENS:
+            return jsonify({'erro': f'garagem={TODAS} só é aceito em: '
+                                    f'{", ".join(sorted(ENDPOINTS_TODAS_GARAGENS))}'}), 400
+        if garagens is None:
+            return jsonify({'erro': 'Nenhuma garagem configurada (GARAGENS em servidor.py)'}), 400
+        return
+    if garagens is None:
+        if garagem:
+            return jsonify({'erro': 'Nenhuma garagem configurada (GARAGENS em servidor.py)'}), 400
+        return
+    try:
+        caminho = garagens.caminho(garagem)
+    except KeyError:
+        return jsonify({'erro': f'Garagem não encontrada: {garagem}'}), 404
+    request.environ['maxtour.garagem'] = caminho
+    request.environ['maxtour.token_garagem'] = usar_banco(caminho)
+
+@app.after_request
+def _manter_garagem_no_streaming(resposta):
+    # O corpo em streaming é gerado depois do fim da requisição
+    caminho = request.environ.get('maxtour.garagem')
+    if caminho is not None and resposta.is_streamed:
+        resposta.response = _iterar_no_banco(caminho, resposta.response)
+    return resposta
+
+@app.teardown_request
+def _restaurar_garagem(_erro=None):
+    token = request.environ.pop('maxtour.token_garagem', None)
+    if token is not None:
+        restaurar_banco(token)
+
+@app.before_request
+def _desviar_leitura_para_replica():
+    """Leituras dos endpoints em FRESCOR_REPLICA usam a réplica, se estiver em dia o bastante"""
+    limite = FRESCOR_REPLICA.get(request.endpoint)
+    if replica is None or limite is None or request.method != 'GET':
+        return
+    if _garagem_pedida() == TODAS or banco_atual() != replica.origem:
+        return  # a réplica é só do banco principal
+    fonte = replica.fonte_se_atualizada(limite)
+    if fonte is not None:
+        request.environ['maxtour.token_replica'] = usar_fonte_leitura(fonte)
+
+@app.after_request
+def _marcar_fonte_leitura(resposta):
+    if 'maxtour.token_replica' in request.environ:
+        resposta.headers['X-Replica-Atraso'] = f'{replica.atraso_s():.3f}'
+    return resposta
+
+@app.teardown_request
+def _restaurar_fonte_leitura(_erro=None):
+    token = request.environ.pop('maxtour.token_replica', None)
+    if token is not None:
+        restaurar_fonte_leitura(token)
+
+# Dashboard servido da memória, com fingerprint e variantes gzip/brotli (ver estaticos.py)
+estaticos = Estaticos(
+    os.path.join(app.root_path, 'utils'),
+    arquivos=['style.css', 'dashboard.js'],
+    paginas=['dashboard.html']
+)
 
 def solicitar_login():
     """Login modal via SQLite. Se não houver usuários, cria admin no banco e orienta o usuário."""
@@ -346,29 +531,36 @@ def calcular_atraso(horario_previsto, horario_real):
 @app.route('/')
 def index():
     """Página principal - Dashboard"""
-    return render_template('dashboard.html')
+    return estaticos.resposta_pagina('dashboard.html', request)
 
 @app.route('/dashboard')
 def dashboard():
     """Dashboard principal"""
-    return render_template('dashboard.html')
+    return estaticos.resposta_pagina('dashboard.html', request)
 
 @app.route('/style.css')
 def serve_css():
-    """Serve o arquivo CSS"""
-    from flask import send_from_directory
-    return send_from_directory('utils', 'style.css')
+    """Serve o arquivo CSS (URL sem hash, mantida para compatibilidade)"""
+    return estaticos.resposta_arquivo('style.css', request)
 
 @app.route('/dashboard.js')
 def serve_js():
-    """Serve o arquivo JavaScript"""
-    from flask import send_from_directory
-    return send_from_directory('utils', 'dashboard.js')
+    """Serve o arquivo JavaScript (URL sem hash, mantida para compatibilidade)"""
+    return estaticos.resposta_arquivo('dashboard.js', request)
+
+@app.route('/assets/<nome>')
+def serve_asset(nome):
+    """Serve CSS/JS pela URL com hash do conteúdo (cache imutável)"""
+    resposta = estaticos.resposta_com_hash(nome, request)
+    if resposta is None:
+        return jsonify({'erro': 'Arquivo não encontrado'}), 404
+    return resposta
 
 @app.route('/<filename>.html')
 def serve_html_files(filename):
     """Serve arquivos HTML da pasta utils"""
-    from flask import send_from_directory
+    if estaticos.possui_pagina(f'{filename}.html'):
+        return estaticos.resposta_pagina(f'{filename}.html', request)
     return send_from_directory('utils', f'{filename}.html')
 
 # === ROTAS DE CONFIGURAÇÃO ===
@@ -438,6 +630,29 @@ def deletar_config_rota(rota_id):
     
 # === ROTAS DE PERCURSO ===
 
+def _ler_campos(valor, permitidos):
+    """Lê o parâmetro fields= (nomes separados por vírgula) validando contra a lista permitida"""
+    if not valor:
+        return None
+    campos = list(dict.fromkeys(c.strip() for c in valor.split(',') if c.strip()))
+    invalidos = [c for c in campos if c not in permitidos]
+    if invalidos or not campos:
+        raise ValueError(f'Campos inválidos: {", ".join(invalidos) or "(vazio)"}. '
+                         f'Permitidos: {", ".join(permitidos)}')
+    return campos
+
+def _ler_janela():
+    """Filtros `desde`/`ate` (saída programada, ex.: 2025-07-01T22:00), normalizados"""
+    janela = {}
+    for chave in ('desde', 'ate'):
+        valor = request.args.get(chave)
+        if valor:
+            try:
+                janela[chave] = normalizar_momento(valor)
+            except ValueError:
+                raise ValueError(f'{chave} deve ser data e hora ISO (ex.: 2025-07-01T22:00)') from None
+    return janela
+
 @app.route('/api/percursos', methods=['GET'])
 def obter_percursos():
     """Obtém todos os percursos com filtros opcionais"""
@@ -447,10 +662,72 @@ def obter_percursos():
     data_fim = request.args.get('data_fim')
     turno = request.args.get('turno')
     
+    # Projeção opcional (ex.: fields=data,rota_id,atraso_chegada) e janela de horário
+    try:
+        campos = _ler_campos(request.args.get('fields'), CAMPOS_PERCURSO)
+        janela = _ler_janela()
+    except ValueError as e:
+        return jsonify({'erro': str(e)}), 400
+    
+    # Busca textual nas observações (ex.: q=pneu furado), ordenada por relevância
+    texto = request.args.get('q', '').strip()
+    if texto:
+        try:
+            resultados = buscar_percursos(texto, rota_id, data_inicio, data_fim, turno, campos=campos, **janela)
+        except ValueError as e:
+            return jsonify({'erro': str(e)}), 400
+        return jsonify([
+            {**percurso.para_dict(), 'trecho': trecho} for percurso, trecho in resultados
+        ])
+    
     # Obter percursos filtrados
-    percursos = obter_percursos_filtrados(rota_id, data_inicio, data_fim, turno)
+    percursos = obter_percursos_filtrados(rota_id, data_inicio, data_fim, turno, campos=campos, **janela)
+    
+    return jsonify(percursos_para_json(percursos))
+
+@app.route('/api/percursos/changes', methods=['GET'])
+def obter_alteracoes():
+    """Sincronização incremental: percursos alterados depois da versão `since`"""
+    try:
+        desde = int(request.args.get('since', 0))
+    except ValueError:
+        return jsonify({'erro': 'since deve ser um número inteiro (versão retornada na última sincronização)'}), 400
     
-    return jsonify(percursos)
+    alteracoes = obter_alteracoes_percursos(desde)
+    for chave in ('inseridos', 'atualizados'):
+        alteracoes[chave] = percursos_para_json(alteracoes[chave])
+    
+    return jsonify(alteracoes)
+
+def _resposta_exportacao(formato, colunas, linhas, nome_base):
+    """Monta a resposta em streaming de uma exportação CSV/XLSX"""
+    nome_arquivo = f"{nome_base}_{datetime.now().strftime('%Y-%m-%d')}.{formato}"
+    return Response(
+        gerar_exportacao(formato, colunas, linhas, nome_planilha=nome_base.replace('_', ' ').title()),
+        mimetype=FORMATOS[formato],
+        headers={'Content-Disposition': f'attachment; filename="{nome_arquivo}"'}
+    )
+
+@app.route('/api/percursos/export', methods=['GET'])
+def exportar_percursos():
+    """Exporta percursos filtrados em CSV ou XLSX (streaming direto do banco)"""
+    formato = request.args.get('formato', 'csv').lower()
+    if formato not in FORMATOS:
+        return jsonify({'erro': 'Formato deve ser "csv" ou "xlsx"'}), 400
+    try:
+        janela = _ler_janela()
+    except ValueError as e:
+        return jsonify({'erro': str(e)}), 400
+    
+    linhas = iterar_percursos_filtrados(
+        [coluna for coluna, _ in COLUNAS_PERCURSOS],
+        request.args.get('rota'),
+        request.args.get('data_inicio'),
+        request.args.get('data_fim'),
+        request.args.get('turno'),
+        **janela
+    )
+    return _resposta_exportacao(formato, COLUNAS_PERCURSOS, linhas, 'percursos')
 
 @app.route('/api/percursos', methods=['POST'])
 def registrar_percurso():
@@ -474,7 +751,8 @@ def registrar_percurso():
             return jsonify({'erro': 'Turno deve ser "primeiro_turno" ou "segundo_turno"'}), 400
         
         # Adiciona ID único e dados calculados
-        novo_percurso['id'] = str(uuid.uuid4())
+        novo_id = str(uuid.uuid4())
+        novo_percurso['id'] = novo_id
         novo_percurso['data_criacao'] = datetime.now().isoformat()
         novo_percurso['nome_rota'] = rota['nome']
         
@@ -519,10 +797,10 @@ def registrar_percurso():
                 novo_percurso['horario_chegada_real']
             )
         
-        # Cria o percurso no banco
+        # Cria o percurso no banco (reenvios do mesmo rota/data/turno/horário atualizam o existente)
         percurso_criado = criar_percurso(novo_percurso)
         
-        return jsonify(percurso_criado), 201
+        return jsonify(percurso_criado.para_dict()), 201 if percurso_criado.id == novo_id else 200
     
     except Exception as e:
         return jsonify({'erro': str(e)}), 500
@@ -533,51 +811,57 @@ def atualizar_percurso_api(percurso_id):
     try:
         dados_atualizacao = request.get_json()
         
-        # Obter percurso atual
-        percurso_atual = obter_percurso_por_id(percurso_id)
-        if not percurso_atual:
-            return jsonify({'erro': 'Percurso não encontrado'}), 404
+        # Atraso de horário real alterado é sempre recalculado no próprio UPDATE,
+        # a partir dos horários programados gravados
+        if 'horario_saida_real' in dados_atualizacao:
+            dados_atualizacao.pop('atraso_saida', None)
+        if 'horario_chegada_real' in dados_atualizacao:
+            dados_atualizacao.pop('atraso_chegada', None)
         
-        # Se horários reais foram atualizados, recalcula atrasos
-        if 'horario_saida_real' in dados_atualizacao or 'horario_chegada_real' in dados_atualizacao:
-            rota = obter_rota_por_id(percurso_atual['rota_id'])
-            if rota:
-                horarios_programados = rota['horarios'][percurso_atual['turno']]
-                
-                # Determina horários programados baseados na estrutura
-                if isinstance(horarios_programados, list):
-                    horario_saida_prog = percurso_atual.get('horario_saida_programado')
-                    horario_chegada_prog = percurso_atual.get('horario_chegada_programado')
-                else:
-                    # Estrutura única - verificar se tem campos novos ou antigos
-                    if 'chegada_martins' in horarios_programados:
-                        horario_saida_prog = horarios_programados['chegada_martins']
-                    elif 'saida_martins' in horarios_programados:
-                        horario_saida_prog = horarios_programados['saida_martins']
-                    else:
-                        horario_saida_prog = horarios_programados.get('saida', '')
-                    
-                    horario_chegada_prog = horarios_programados.get('chegada_maxima', horarios_programados.get('chegada', ''))
-                
-                if 'horario_saida_real' in dados_atualizacao and horario_saida_prog:
-                    dados_atualizacao['atraso_saida'] = calcular_atraso(
-                        horario_saida_prog,
-                        dados_atualizacao['horario_saida_real']
-                    )
-                
-                if 'horario_chegada_real' in dados_atualizacao and horario_chegada_prog:
-                    dados_atualizacao['atraso_chegada'] = calcular_atraso(
-                        horario_chegada_prog,
-                        dados_atualizacao['horario_chegada_real']
-                    )
-        
-        # Atualizar no banco
+        # Atualizar no banco (a rota é validada no mesmo UPDATE)
         percurso_atualizado = atualizar_percurso(percurso_id, dados_atualizacao)
+        if percurso_atualizado is None:
+            return jsonify({'erro': 'Percurso não encontrado'}), 404
         
-        return jsonify(percurso_atualizado)
+        return jsonify(percurso_atualizado.para_dict())
+    
+    except ValueError as e:
+        return jsonify({'erro': str(e)}), 400
+    except sqlite3.IntegrityError:
+        return jsonify({'erro': 'Já existe um percurso para esta rota, data, turno e horário'}), 409
+    except Exception as e:
+        return jsonify({'erro': str(e)}), 500
+
+@app.route('/api/percursos/<percurso_id>', methods=['PATCH'])
+def atualizar_percurso_parcial_api(percurso_id):
+    """Altera só os campos enviados em um único UPDATE ... RETURNING.
+    
+    Atrasos não enviados são recalculados no banco a partir dos horários
+    programados gravados quando um horário real (ou programado) muda.
+    """
+    dados_atualizacao = request.get_json(silent=True)
+    if not isinstance(dados_atualizacao, dict) or not dados_atualizacao:
+        return jsonify({'erro': 'Envie um objeto JSON com os campos a alterar'}), 400
     
+    invalidos = sorted(set(dados_atualizacao) - CAMPOS_PERCURSO_EDITAVEIS)
+    if invalidos:
+        return jsonify({'erro': f'Campos não editáveis: {", ".join(invalidos)}'}), 400
+    if 'turno' in dados_atualizacao and dados_atualizacao['turno'] not in ['primeiro_turno', 'segundo_turno']:
+        return jsonify({'erro': 'Turno deve ser "primeiro_turno" ou "segundo_turno"'}), 400
+    
+    try:
+        # Rota inexistente é recusada pelo próprio UPDATE (ValueError), que copia o nome dela
+        percurso_atualizado = atualizar_percurso(percurso_id, dados_atualizacao)
+    except ValueError as e:
+        return jsonify({'erro': str(e)}), 400
+    except sqlite3.IntegrityError:
+        return jsonify({'erro': 'Já existe um percurso para esta rota, data, turno e horário'}), 409
     except Exception as e:
         return jsonify({'erro': str(e)}), 500
+    
+    if percurso_atualizado is None:
+        return jsonify({'erro': 'Percurso não encontrado'}), 404
+    return jsonify(percurso_atualizado.para_dict())
 
 @app.route('/api/percursos/<percurso_id>', methods=['DELETE'])
 def deletar_percurso_api(percurso_id):
@@ -588,13 +872,122 @@ def deletar_percurso_api(percurso_id):
         if percurso_removido is None:
             return jsonify({'erro': 'Percurso não encontrado'}), 404
         
-        return jsonify({'mensagem': 'Percurso removido com sucesso', 'percurso': percurso_removido})
+        return jsonify({'mensagem': 'Percurso removido com sucesso', 'percurso': percurso_removido.para_dict()})
     
     except Exception as e:
         return jsonify({'erro': str(e)}), 500
 
+# Remoção em massa: percursos por lote (cada lote é uma transação curta)
+TAMANHO_LOTE_REMOCAO = 500
+
+def _usuario_admin():
+    """Administrador autenticado por HTTP Basic na requisição (None se ausente ou inválido)"""
+    credenciais = request.authorization
+    if not credenciais or not credenciais.username:
+        return None
+    usuario = verificar_credenciais(credenciais.username, credenciais.password or '')
+    return usuario if usuario and usuario['is_admin'] else None
+
+@app.route('/api/percursos', methods=['DELETE'])
+def remover_percursos_api():
+    """Remove percursos por filtro, em lotes, informando o progresso (somente administradores).
+    
+    Com `simulacao=1` só conta os percursos que seriam removidos. A remoção
+    responde em NDJSON: uma linha de progresso por lote e a linha final com
+    `concluido`.
+    """
+    if _usuario_admin() is None:
+        return (jsonify({'erro': 'Requer credenciais de administrador'}), 401,
+                {'WWW-Authenticate': 'Basic realm="MaxTour"'})
+    
+    filtros = {
+        'rota_id': request.args.get('rota'),
+        'data_inicio': request.args.get('data_inicio'),
+        'data_fim': request.args.get('data_fim'),
+        'turno': request.args.get('turno'),
+        'origem': request.args.get('origem'),
+    }
+    if not any(filtros.values()):
+        return jsonify({'erro': 'Informe ao menos um filtro (data_inicio, data_fim, rota, turno ou origem)'}), 400
+    if filtros['origem'] and filtros['origem'] not in ORIGENS_PERCURSO:
+        return jsonify({'erro': f'origem deve ser um de: {", ".join(ORIGENS_PERCURSO)}'}), 400
+    
+    if request.args.get('simulacao', '').lower() in ('1', 'true', 'sim'):
+        return jsonify({'simulacao': True, 'total': contar_percursos_filtrados(**filtros), 'filtros': filtros})
+    
+    try:
+        tamanho_lote = int(request.args.get('lote', TAMANHO_LOTE_REMOCAO))
+    except ValueError:
+        return jsonify({'erro': 'lote deve ser um número inteiro'}), 400
+    if not 1 <= tamanho_lote <= 10000:
+        return jsonify({'erro': 'lote deve estar entre 1 e 10000'}), 400
+    
+    def progresso():
+        etapa = {'total': 0, 'removidos': 0, 'lotes': 0}
+        try:
+            for etapa in remover_percursos_em_lotes(**filtros, tamanho_lote=tamanho_lote):
+                yield app.json.dumps(etapa) + '\n'
+        except Exception as e:
+            yield app.json.dumps({**etapa, 'erro': str(e)}) + '\n'
+            return
+        yield app.json.dumps({**etapa, 'concluido': True}) + '\n'
+    
+    return Response(progresso(), mimetype='application/x-ndjson')
+
 # === RELATÓRIOS ===
 
+# Campos de `detalhes` no relatório de atrasos -> coluna de percursos
+CAMPOS_DETALHE = {
+    'data': 'data',
+    'rota': 'nome_rota',
+    'turno': 'turno',
+    'saida_programada': 'horario_saida_programado',
+    'saida_real': 'horario_saida_real',
+    'chegada_programada': 'horario_chegada_programado',
+    'chegada_real': 'horario_chegada_real',
+    'atraso_saida': 'atraso_saida',
+    'atraso_chegada': 'atraso_chegada',
+    'observacoes': 'observacoes'
+}
+
+def _formatar_detalhes(percursos, campos_detalhe):
+    """Detalhes dos percursos por data e rota (um único dict por linha, direto da tupla)"""
+    extrair = attrgetter(*[CAMPOS_DETALHE[c] for c in campos_detalhe])
+    ordenados = sorted(percursos, key=attrgetter('data', 'nome_rota'))
+    if len(campos_detalhe) == 1:
+        return [{campos_detalhe[0]: extrair(p)} for p in ordenados]
+    return [dict(zip(campos_detalhe, extrair(p))) for p in ordenados]
+
+def _relatorio_atrasos_garagens(rota_id, data_inicio, data_fim, janela):
+    """Relatório de todas as garagens: cada uma agrega no seu banco, em paralelo, e os parciais são somados"""
+    parciais = garagens.em_todas(
+        agregar_atrasos_por_rota, rota_id=rota_id, data_inicio=data_inicio, data_fim=data_fim, **janela
+    )
+    relatorio = relatorio_de_agregado(combinar_parciais(parciais.values()))
+    relatorio['por_garagem'] = {
+        garagem: relatorio_de_agregado(parcial)['resumo'] for garagem, parcial in parciais.items()
+    }
+    relatorio['data_geracao'] = datetime.now().isoformat()
+    return relatorio
+
+def _relatorio_atrasos_aproximado(rota_id, data_inicio, data_fim, janela):
+    """Resumo e por rota estimados por amostragem, com intervalos de confiança (sem detalhes).
+    
+    Em períodos pequenos o cálculo é exato, no mesmo formato, com `modo` "exato"
+    e intervalos de largura zero.
+    """
+    estimado = relatorio_aproximado(rota_id, data_inicio, data_fim, amostra=AMOSTRA_RELATORIO_APROXIMADO,
+                                    limite_exato=LIMITE_RELATORIO_EXATO, **janela)
+    if estimado is None:
+        relatorio = {'modo': 'exato', **relatorio_de_agregado(
+            agregar_atrasos_por_rota(rota_id=rota_id, data_inicio=data_inicio, data_fim=data_fim, **janela))}
+        relatorio['intervalos'] = intervalos_exatos(relatorio)
+    else:
+        relatorio = {'modo': 'aproximado', **estimado}
+    relatorio['detalhes'] = []
+    relatorio['data_geracao'] = datetime.now().isoformat()
+    return relatorio
+
 @app.route('/api/relatorio/atrasos', methods=['GET'])
 def relatorio_atrasos():
     """Gera relatório completo de atrasos"""
@@ -603,111 +996,294 @@ def relatorio_atrasos():
     data_inicio = request.args.get('data_inicio')
     data_fim = request.args.get('data_fim')
     
-    # Obter percursos filtrados diretamente do banco
-    percursos_filtrados = obter_percursos_filtrados(rota_id, data_inicio, data_fim, None)
-    config_rotas = carregar_rotas_config()
-    rotas_config = config_rotas['rotas']
-    
-    # Calcular estatísticas gerais
-    total_percursos = len(percursos_filtrados)
-    
-    if total_percursos == 0:
-        return jsonify({
-            'resumo': {
-                'total_percursos': 0,
-                'media_atraso_saida': 0,
-                'media_atraso_chegada': 0,
-                'maior_atraso_saida': 0,
-                'maior_atraso_chegada': 0,
-                'pontualidade_saida': 0,
-                'pontualidade_chegada': 0
-            },
-            'por_rota': {},
-            'detalhes': [],
-            'data_geracao': datetime.now().isoformat()
-        })
-    
-    # Calcular métricas gerais
-    atrasos_saida = [p.get('atraso_saida', 0) for p in percursos_filtrados]
-    atrasos_chegada = [p.get('atraso_chegada', 0) for p in percursos_filtrados]
-    
-    media_atraso_saida = round(sum(atrasos_saida) / len(atrasos_saida), 1) if atrasos_saida else 0
-    # Para média de atraso de chegada, considerar apenas valores positivos (atrasos reais)
-    atrasos_chegada_positivos = [a for a in atrasos_chegada if a > 0]
-    media_atraso_chegada = round(sum(atrasos_chegada_positivos) / len(atrasos_chegada_positivos), 1) if atrasos_chegada_positivos else 0
-    
-    pontualidade_saida = round((len([a for a in atrasos_saida if a <= 0]) / len(atrasos_saida)) * 100, 1) if atrasos_saida else 0
-    pontualidade_chegada = round((len([a for a in atrasos_chegada if a <= 0]) / len(atrasos_chegada)) * 100, 1) if atrasos_chegada else 0
-    
-    # Agrupar por rota
-    por_rota = {}
-    for percurso in percursos_filtrados:
-        rota_nome = percurso['nome_rota']
-        if rota_nome not in por_rota:
-            por_rota[rota_nome] = []
-        por_rota[rota_nome].append(percurso)
-    
-    # Calcular estatísticas por rota
-    estatisticas_por_rota = {}
-    for rota_nome, percursos_rota in por_rota.items():
-        atrasos_saida_rota = [p.get('atraso_saida', 0) for p in percursos_rota]
-        atrasos_chegada_rota = [p.get('atraso_chegada', 0) for p in percursos_rota]
-        
-        # Para média de atraso de chegada por rota, considerar apenas valores positivos
-        atrasos_chegada_rota_positivos = [a for a in atrasos_chegada_rota if a > 0]
-        
-        estatisticas_por_rota[rota_nome] = {
-            'total_percursos': len(percursos_rota),
-            'media_atraso_saida': round(sum(atrasos_saida_rota) / len(atrasos_saida_rota), 1) if atrasos_saida_rota else 0,
-            'media_atraso_chegada': round(sum(atrasos_chegada_rota_positivos) / len(atrasos_chegada_rota_positivos), 1) if atrasos_chegada_rota_positivos else 0,
-            'maior_atraso_saida': max(atrasos_saida_rota) if atrasos_saida_rota else 0,
-            'maior_atraso_chegada': max(atrasos_chegada_rota) if atrasos_chegada_rota else 0,
-            'pontualidade_saida': round((len([a for a in atrasos_saida_rota if a <= 0]) / len(atrasos_saida_rota)) * 100, 1) if atrasos_saida_rota else 0,
-            'pontualidade_chegada': round((len([a for a in atrasos_chegada_rota if a <= 0]) / len(atrasos_chegada_rota)) * 100, 1) if atrasos_chegada_rota else 0
-        }
-    
-    # Preparar detalhes dos percursos
-    detalhes_formatados = []
-    for percurso in sorted(percursos_filtrados, key=lambda x: (x.get('data', ''), x.get('nome_rota', ''))):
-        detalhes_formatados.append({
-            'data': percurso.get('data', ''),
-            'rota': percurso.get('nome_rota', ''),
-            'turno': percurso.get('turno', ''),
-            'saida_programada': percurso.get('horario_saida_programado', ''),
-            'saida_real': percurso.get('horario_saida_real', ''),
-            'chegada_programada': percurso.get('horario_chegada_programado', ''),
-            'chegada_real': percurso.get('horario_chegada_real', ''),
-            'atraso_saida': percurso.get('atraso_saida', 0),
-            'atraso_chegada': percurso.get('atraso_chegada', 0),
-            'observacoes': percurso.get('observacoes', '')
-        })
-    
-    relatorio = {
-        'resumo': {
-            'total_percursos': total_percursos,
-            'media_atraso_saida': media_atraso_saida,
-            'media_atraso_chegada': media_atraso_chegada,
-            'maior_atraso_saida': max(atrasos_saida) if atrasos_saida else 0,
-            'maior_atraso_chegada': max(atrasos_chegada) if atrasos_chegada else 0,
-            'pontualidade_saida': pontualidade_saida,
-            'pontualidade_chegada': pontualidade_chegada
-        },
-        'por_rota': estatisticas_por_rota,
-        'detalhes': detalhes_formatados,
-        'data_geracao': datetime.now().isoformat()
-    }
+    # Campos de cada item de `detalhes` (padrão: todos) e janela de horário
+    try:
+        campos_detalhe = _ler_campos(request.args.get('fields'), CAMPOS_DETALHE) or list(CAMPOS_DETALHE)
+        janela = _ler_janela()
+    except ValueError as e:
+        return jsonify({'erro': str(e)}), 400
+    
+    modo = request.args.get('modo', 'exato')
+    if modo not in ('exato', 'aproximado'):
+        return jsonify({'erro': 'modo deve ser "exato" ou "aproximado"'}), 400
+    
+    # Todas as garagens: só resumo e por rota (os detalhes ficam no relatório de cada uma)
+    if _garagem_pedida() == TODAS:
+        return jsonify(_relatorio_atrasos_garagens(rota_id, data_inicio, data_fim, janela))
+    
+    if modo == 'aproximado':
+        return jsonify(_relatorio_atrasos_aproximado(rota_id, data_inicio, data_fim, janela))
+    
+    # Resumo e por rota agregados no SQLite (períodos longos em paralelo, mês a
+    # mês); as linhas só são lidas para os detalhes (detalhes=0 dispensa)
+    agregado = None
+    if MESES_RELATORIO_PARALELO:
+        agregado = agregar_periodo_longo(rota_id, data_inicio, data_fim, MESES_RELATORIO_PARALELO, **janela)
+    if agregado is None:
+        agregado = agregar_atrasos_por_rota(rota_id, data_inicio, data_fim, None, **janela)
+    relatorio = relatorio_de_agregado(agregado)
+    
+    detalhes = []
+    if request.args.get('detalhes') != '0':
+        colunas = list(dict.fromkeys(['data', 'nome_rota'] + [CAMPOS_DETALHE[c] for c in campos_detalhe]))
+        detalhes = _formatar_detalhes(
+            obter_percursos_filtrados(rota_id, data_inicio, data_fim, None, campos=colunas, **janela),
+            campos_detalhe
+        )
+    relatorio['detalhes'] = detalhes
+    relatorio['data_geracao'] = datetime.now().isoformat()
+    return jsonify(relatorio)
+
+@app.route('/api/relatorio/cobertura', methods=['GET'])
+def relatorio_cobertura():
+    """Compara a escala programada das rotas com os percursos registrados"""
+    data_inicio = request.args.get('data_inicio')
+    data_fim = request.args.get('data_fim')
+    if not data_inicio or not data_fim:
+        return jsonify({'erro': 'Informe data_inicio e data_fim'}), 400
+    
+    feriados = [f for f in request.args.get('feriados', '').split(',') if f.strip()]
+    
+    try:
+        relatorio = calcular_cobertura(
+            data_inicio,
+            data_fim,
+            rota_id=request.args.get('rota'),
+            calendario=request.args.get('calendario', 'padrao'),
+            feriados=[f.strip() for f in feriados]
+        )
+    except ValueError as e:
+        return jsonify({'erro': str(e)}), 400
     
     return jsonify(relatorio)
 
+@app.route('/api/relatorio/ranking', methods=['GET'])
+def relatorio_ranking():
+    """Top-N piores (ou melhores) rotas, turnos, horários ou dias da semana por uma métrica"""
+    try:
+        limite = int(request.args.get('limit', 10))
+        minimo_percursos = int(request.args.get('min_percursos', 1))
+    except ValueError:
+        return jsonify({'erro': 'limit e min_percursos devem ser números inteiros'}), 400
+    
+    try:
+        janela = _ler_janela()
+        relatorio = calcular_ranking(
+            request.args.get('metric', 'media_atraso_chegada'),
+            agrupamento=request.args.get('group_by', 'rota'),
+            limite=limite,
+            ordem=request.args.get('ordem', 'pior'),
+            minimo_percursos=minimo_percursos,
+            rota_id=request.args.get('rota'),
+            data_inicio=request.args.get('data_inicio'),
+            data_fim=request.args.get('data_fim'),
+            turno=request.args.get('turno'),
+            **janela
+        )
+    except ValueError as e:
+        return jsonify({'erro': str(e)}), 400
+    
+    return jsonify(relatorio)
+
+@app.route('/api/relatorio/slots', methods=['GET'])
+def relatorio_slots():
+    """Pontualidade por slot da escala (rota, turno e horário programado) com tendência"""
+    try:
+        janela = _ler_janela()
+        relatorio = calcular_pontualidade_por_slot(
+            data_inicio=request.args.get('data_inicio'),
+            data_fim=request.args.get('data_fim'),
+            rota_id=request.args.get('rota'),
+            turno=request.args.get('turno'),
+            periodo=request.args.get('periodo', 'semana'),
+            **janela
+        )
+    except ValueError as e:
+        return jsonify({'erro': str(e)}), 400
+    
+    return jsonify(relatorio)
+
+@app.route('/api/relatorio/atrasos/export', methods=['GET'])
+def exportar_relatorio_atrasos():
+    """Exporta os detalhes do relatório de atrasos em CSV ou XLSX (streaming)"""
+    formato = request.args.get('formato', 'csv').lower()
+    if formato not in FORMATOS:
+        return jsonify({'erro': 'Formato deve ser "csv" ou "xlsx"'}), 400
+    try:
+        janela = _ler_janela()
+    except ValueError as e:
+        return jsonify({'erro': str(e)}), 400
+    
+    # Mesmos filtros e ordenação dos detalhes de /api/relatorio/atrasos
+    linhas = iterar_percursos_filtrados(
+        CAMPOS_RELATORIO,
+        request.args.get('rota'),
+        request.args.get('data_inicio'),
+        request.args.get('data_fim'),
+        ordenacao='data, nome_rota',
+        **janela
+    )
+    linhas = formatar_linhas_relatorio(linhas, carregar_rotas_config()['rotas'])
+    return _resposta_exportacao(formato, COLUNAS_RELATORIO, linhas, 'relatorio_atrasos')
+
+# === ALERTAS ===
+
+# Intervalo máximo sem eventos no feed SSE antes de enviar um comentário de keep-alive
+INTERVALO_KEEPALIVE_SSE = 15
+
+@app.route('/api/alertas', methods=['GET'])
+def obter_alertas():
+    """Alertas de atraso (mais recentes primeiro; com desde_id, só os novos)"""
+    try:
+        desde_id = request.args.get('desde_id', type=int)
+        limite = min(int(request.args.get('limit', 100)), 1000)
+    except ValueError:
+        return jsonify({'erro': 'limit deve ser um número inteiro'}), 400
+    
+    return jsonify(listar_alertas(
+        desde_id, rota_id=request.args.get('rota'), tipo=request.args.get('tipo'), limite=limite
+    ))
+
+@app.route('/api/alertas/stream', methods=['GET'])
+def stream_alertas():
+    """Feed de alertas em Server-Sent Events (retoma a partir do Last-Event-ID)"""
+    try:
+        desde_id = int(request.headers.get('Last-Event-ID') or request.args.get('desde_id', 0))
+    except ValueError:
+        return jsonify({'erro': 'desde_id deve ser um número inteiro'}), 400
+    rota_id = request.args.get('rota')
+    tipo = request.args.get('tipo')
+    
+    def eventos(ultimo_id):
+        yield 'retry: 3000\n\n'
+        ociosidade = 0.0
+        while True:
+            alertas = aguardar_alertas(ultimo_id, timeout=1.0, rota_id=rota_id, tipo=tipo)
+            if not alertas:
+                ociosidade += 1.0
+                if ociosidade >= INTERVALO_KEEPALIVE_SSE:
+                    ociosidade = 0.0
+                    yield ': keep-alive\n\n'
+                continue
+            ociosidade = 0.0
+            for alerta in alertas:
+                ultimo_id = alerta['id']
+                yield f"id: {ultimo_id}\nevent: alerta\ndata: {app.json.dumps(alerta)}\n\n"
+    
+    return Response(eventos(desde_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/alertas/estatisticas', methods=['GET'])
+def obter_estatisticas_alertas():
+    """Estatísticas acumuladas (n, média, desvio, EWMA) por slot e por rota"""
+    return jsonify(obter_estatisticas(request.args.get('rota')))
+
+# === OPERAÇÃO DO DIA ===
+
+@app.route('/api/operacao/hoje', methods=['GET'])
+def operacao_hoje():
+    """Quadro do dia: viagens da escala com horário programado, realizado e situação"""
+    try:
+        quadro = obter_quadro(request.args.get('data'))
+    except ValueError:
+        return jsonify({'erro': 'data deve estar no formato AAAA-MM-DD'}), 400
+    
+    return jsonify(quadro.resumo(request.args.get('rota'), request.args.get('turno')))
+
+# === PREVISÃO ===
+
+@app.route('/api/previsao', methods=['GET'])
+def obter_previsao():
+    """Atraso previsto por slot para um dia (padrão: amanhã), lido da tabela de previsões"""
+    return jsonify(obter_previsoes(
+        request.args.get('data'), rota_id=request.args.get('rota'), turno=request.args.get('turno')
+    ))
+
+@app.route('/api/previsao/recalcular', methods=['POST'])
+def recalcular_previsao():
+    """Reajusta os modelos de todos os slots e grava as previsões dos próximos dias"""
+    if not numpy_disponivel():
+        return jsonify({'erro': 'Previsão indisponível: instale o NumPy (pip install numpy)'}), 503
+    
+    dados = request.get_json(silent=True) or {}
+    try:
+        resumo = gerar_previsoes(
+            data_base=dados.get('data_base'),
+            dias=int(dados.get('dias', 1)),
+            dias_historico=int(dados.get('dias_historico', 365)),
+            alfa=float(dados.get('alfa', 0.2))
+        )
+    except ValueError as e:
+        return jsonify({'erro': str(e)}), 400
+    
+    return jsonify(resumo)
+
+# === RÉPLICA DE LEITURA ===
 
+@app.route('/api/replica', methods=['GET'])
+def obter_estado_replica():
+    """Atraso e última atualização da réplica de leitura, com o limite de cada endpoint"""
+    estado = replica.estado() if replica is not None else {'ativa': False}
+    estado['frescor_por_endpoint_s'] = FRESCOR_REPLICA
+    return jsonify(estado)
+
+def iniciar_replica():
+    """Gera o primeiro snapshot e passa a desviar as leituras configuradas para a réplica"""
+    global replica
+    inicio = perf_counter()
+    replica = Replica(REPLICA_LEITURA, intervalo=INTERVALO_REPLICA).iniciar()
+    print(f"🪞 Réplica de leitura ({REPLICA_LEITURA}) pronta em {(perf_counter() - inicio) * 1000:.1f} ms")
+
+
+def _preparar_banco():
+    """Migrações pendentes, escala expandida, lápides antigas e estatísticas de alertas do banco atual"""
+    esquema = inicializar_banco()          # aplica migrações pendentes
+    if esquema['migracoes']:
+        print(f"🗄️  Esquema v{esquema['versao_inicial']} → v{esquema['versao']} "
+              f"({len(esquema['migracoes'])} migração(ões)) em {esquema['tempo_ms']:.1f} ms")
+        for migracao in esquema['migracoes']:
+            print(f"   • v{migracao['versao']} {migracao['descricao']}: {migracao['duracao_ms']:.1f} ms")
+    else:
+        print(f"🗄️  Esquema v{esquema['versao']} em dia ({esquema['tempo_ms']:.1f} ms)")
+
+    etapa = perf_counter()
+    viagens = sincronizar_escala()   # rotas podem ter sido gravadas fora do servidor
+    print(f"📅 Escala expandida: {viagens} viagens programadas ({(perf_counter() - etapa) * 1000:.1f} ms)")
+
+    etapa = perf_counter()
+    lapides = purgar_lapides(RETENCAO_LAPIDES)
+    print(f"🪦 Lápides de percursos descartadas: {lapides} ({(perf_counter() - etapa) * 1000:.1f} ms)")
+
+    etapa = perf_counter()
+    reconstruiu = sincronizar_estatisticas()   # só reprocessa se o banco mudou por fora
+    print(f"📈 Estatísticas de alertas {'reconstruídas' if reconstruiu else 'em dia'} "
+          f"({(perf_counter() - etapa) * 1000:.1f} ms)")
+
+def relatorio_inicializacao():
+    """Prepara banco(s) e estado dos alertas, imprimindo quanto tempo cada etapa levou"""
+    inicio = perf_counter()
+    if garagens is None:
+        _preparar_banco()
+    else:
+        for garagem, caminho in garagens.arquivos.items():
+            print(f"🏢 Garagem {garagem} ({caminho})")
+            garagens.executar(garagem, _preparar_banco)
+    print(f"🎨 Arquivos estáticos carregados ({estaticos.tempo_carga_ms:.1f} ms)")
+    print(f"⏱️  Inicialização: {(perf_counter() - inicio) * 1000 + estaticos.tempo_carga_ms:.1f} ms")
 
 if __name__ == '__main__':
-    inicializar_banco()          # garante tabelas
-    if not solicitar_login():    # valida no SQLite
+    relatorio_inicializacao()
+    # Usuários da garagem padrão
+    if not (garagens.executar(None, solicitar_login) if garagens else solicitar_login()):
         raise SystemExit(0)
 
     root = criar_interface_servidor()
 
+    if USAR_ESCRITOR_UNICO:
+        ativar_escritor_unico()
+    if REPLICA_LEITURA:
+        iniciar_replica()
+
     def rodar_flask():
         app.run(debug=False, host='0.0.0.0', port=5000, use_reloader=False)
 
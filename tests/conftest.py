@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import banco
+import cobertura
+
+
+@pytest.fixture
+def banco_teste(tmp_path, monkeypatch):
+    """Banco novo em um arquivo temporário, com o esquema, as rotas padrão e a escala expandida"""
+    caminho = str(tmp_path / 'dados.db')
+    monkeypatch.setattr(banco, 'DATABASE_FILE', caminho)
+    banco.inicializar_banco()
+    cobertura.sincronizar_escala()
+    return caminho
+
+
+@pytest.fixture
+def cliente(banco_teste):
+    import servidor
+    servidor.app.config['TESTING'] = True
+    return servidor.app.test_client()
+
+
+@pytest.fixture
+def gravar_percursos(banco_teste):
+    """Grava percursos a partir de dicionários parciais (rota CANAA no primeiro turno por padrão)"""
+    def gravar(*percursos):
+        completos = [{
+            'rota_id': 'CANAA', 'nome_rota': 'CANAÃ', 'data': '2025-07-01', 'turno': 'primeiro_turno',
+            'horario_saida_programado': '06:00', 'horario_chegada_programado': '06:50',
+            **percurso,
+        } for percurso in percursos]
+        banco.criar_percursos_em_lote(completos)
+        return completos
+    return gravar
@@ -0,0 +1,47 @@
+import threading
+
+import pytest
+
+import alertas
+import banco
+
+
+@pytest.fixture(params=['conexao_propria', 'escritor_unico'])
+def modo_escrita(request, banco_teste):
+    if request.param == 'escritor_unico':
+        banco.ativar_escritor_unico()
+        yield request.param
+        banco.desativar_escritor_unico()
+    else:
+        yield request.param
+
+
+def test_aviso_de_novos_alertas_so_depois_do_commit(modo_escrita, gravar_percursos, monkeypatch):
+    alertas_visiveis = []
+
+    class Condicao(threading.Condition):
+        def notify_all(self):
+            # Lido por outra conexão: só enxerga o que já foi confirmado
+            alertas_visiveis.append(len(alertas.listar_alertas()))
+            super().notify_all()
+
+    monkeypatch.setattr(alertas, '_novos_alertas', Condicao())
+
+    gravar_percursos({'horario_chegada_real': '07:40', 'atraso_chegada': alertas.LIMITE_ATRASO + 20})
+
+    assert alertas_visiveis == [1]
+
+
+def test_escrita_desfeita_nao_avisa(banco_teste, monkeypatch):
+    avisos = []
+    monkeypatch.setattr(alertas, '_avisar_novos_alertas', lambda: avisos.append(1))
+
+    def falhar(conn):
+        banco.apos_commit(conn, alertas._avisar_novos_alertas)
+        raise RuntimeError('falha na gravação')
+
+    with pytest.raises(RuntimeError):
+        banco.executar_escrita(falhar)
+
+    assert avisos == []
+    assert banco._apos_commit == {}
@@ -0,0 +1,83 @@
+import random
+import sqlite3
+import uuid
+from datetime import date, timedelta
+
+import pytest
+
+import amostragem
+import banco
+from agregados import relatorio_de_agregado
+
+ROTAS = [('CANAA', 'CANAÃ'), ('PLANALTO', 'PLANALTO'), ('GUARANI', 'GUARANI')]
+HORARIOS = ['05:20', '06:55', '13:40', '17:00']
+DIAS = 500
+
+
+@pytest.fixture
+def historico(banco_teste):
+    """~6 mil percursos em 500 dias, gravados direto (sem os ganchos, como uma carga)"""
+    rnd = random.Random(7)
+    linhas = []
+    for i in range(DIAS):
+        dia = (date(2024, 1, 1) + timedelta(days=i)).isoformat()
+        for (rota_id, nome), peso in zip(ROTAS, (0, 3, 8)):
+            for horario in HORARIOS:
+                linhas.append((str(uuid.uuid4()), rota_id, nome, dia, 'primeiro_turno', horario,
+                               rnd.randint(-10, 10 + peso), rnd.randint(-10, 5 + peso), f'{dia}T{horario}'))
+    with sqlite3.connect(banco_teste) as conn:
+        conn.executemany('''
+            INSERT INTO percursos (id, rota_id, nome_rota, data, turno, horario_saida_programado,
+                                   atraso_saida, atraso_chegada, data_criacao)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', linhas)
+    conn.close()
+    return len(linhas)
+
+
+def _exato(**filtros):
+    return relatorio_de_agregado(banco.agregar_atrasos_por_rota(**filtros))
+
+
+def _dentro(valor, intervalo):
+    inferior, superior = intervalo
+    return inferior <= valor and (superior is None or valor <= superior)
+
+
+def test_periodo_pequeno_fica_exato(historico):
+    assert amostragem.relatorio_aproximado(limite_exato=historico) is None
+
+
+def test_modo_aproximado_em_periodo_pequeno_responde_exato_com_intervalos_de_largura_zero(cliente, historico):
+    filtros = {'data_inicio': '2024-01-01', 'data_fim': '2024-01-31'}
+
+    relatorio = cliente.get('/api/relatorio/atrasos', query_string={**filtros, 'modo': 'aproximado'}).get_json()
+
+    exato = _exato(**filtros)
+    assert relatorio['modo'] == 'exato'
+    assert relatorio['resumo'] == exato['resumo']
+    assert relatorio['intervalos'] == amostragem.intervalos_exatos(exato)
+
+
+def test_modo_invalido_retorna_400(cliente):
+    assert cliente.get('/api/relatorio/atrasos', query_string={'modo': 'rapido'}).status_code == 400
+
+
+@pytest.mark.parametrize('janela', [{}, {'desde': '2024-03-10T12:00', 'ate': '2025-02-20T06:00'}],
+                         ids=['periodo', 'janela'])
+def test_intervalos_do_aproximado_cobrem_o_valor_exato(historico, janela):
+    exato = _exato(**janela)
+    execucoes, cobertos = 40, {metrica: 0 for metrica in amostragem.METRICAS}
+    for semente in range(execucoes):
+        random.seed(semente)
+        estimado = amostragem.relatorio_aproximado(amostra=600, limite_exato=1000, **janela)
+
+        assert estimado['amostra']['percursos'] < estimado['amostra']['populacao']
+        # Totais por rota vêm da contagem no índice, não da amostra
+        assert estimado['resumo']['total_percursos'] == exato['resumo']['total_percursos']
+        assert set(estimado['por_rota']) == set(exato['por_rota'])
+        for metrica in amostragem.METRICAS:
+            cobertos[metrica] += _dentro(exato['resumo'][metrica], estimado['intervalos']['resumo'][metrica])
+
+    # 95% de confiança: admite algumas execuções fora, não um viés sistemático
+    assert {metrica: cobertos[metrica] / execucoes >= 0.85 for metrica in cobertos} == dict.fromkeys(cobertos, True)
@@ -0,0 +1,20 @@
+import banco
+
+
+def test_chave_natural_transforma_reenvio_em_atualizacao(banco_teste, gravar_percursos):
+    gravar_percursos({'atraso_chegada': 1})
+    gravar_percursos({'atraso_chegada': 7})
+
+    percursos = banco.obter_percursos_filtrados()
+
+    assert [p['atraso_chegada'] for p in percursos] == [7]
+
+
+def test_reenvio_mantem_id_e_criacao_do_percurso_gravado(banco_teste, gravar_percursos):
+    original, = gravar_percursos({'id': 'original', 'data_criacao': '2025-07-01T06:00'})
+    gravar_percursos({'id': 'reenvio', 'data_criacao': '2025-07-01T06:10', 'horario_chegada_real': '06:55'})
+
+    percurso, = banco.obter_percursos_filtrados()
+
+    assert (percurso.id, percurso.data_criacao) == ('original', '2025-07-01T06:00')
+    assert (percurso.horario_chegada_real, percurso.data_atualizacao) == ('06:55', '2025-07-01T06:10')
@@ -0,0 +1,28 @@
+import banco
+from cobertura import calcular_cobertura
+
+
+def test_faltantes_sao_so_os_slots_sem_percurso(gravar_percursos):
+    gravar_percursos(
+        {'horario_saida_programado': '05:20', 'horario_chegada_programado': '05:20'},
+        {'data': '2025-07-02', 'horario_saida_programado': '06:55', 'horario_chegada_programado': '07:00'},
+    )
+
+    cobertura = calcular_cobertura('2025-07-01', '2025-07-02', rota_id='CANAA')
+
+    resumo = cobertura['resumo']
+    assert resumo['viagens_esperadas'] == 26
+    assert resumo['viagens_realizadas'] == 2
+    assert resumo['faltantes'] == len(cobertura['faltantes']) == 24
+    faltantes = {(f['data'], f['horario_saida']) for f in cobertura['faltantes']}
+    assert ('2025-07-01', '05:20') not in faltantes
+    assert ('2025-07-02', '06:55') not in faltantes
+    assert ('2025-07-01', '06:55') in faltantes
+
+
+def test_gravacao_de_rota_refaz_a_escala(banco_teste):
+    banco.atualizar_rota('CANAA', {'horarios': {'primeiro_turno': [{'saida': '07:00', 'chegada': '07:40'}]}})
+
+    cobertura = calcular_cobertura('2025-07-01', '2025-07-01', rota_id='CANAA')
+
+    assert [(f['turno'], f['horario_saida']) for f in cobertura['faltantes']] == [('primeiro_turno', '07:00')]
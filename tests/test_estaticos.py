@@ -0,0 +1,39 @@
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request
+
+from compressao import escolher_codificacao
+from estaticos import TAMANHO_MINIMO_COMPRESSAO, Estaticos
+
+
+def _requisicao(**cabecalhos):
+    return Request(EnvironBuilder(headers=cabecalhos).get_environ())
+
+
+def _estaticos(pasta):
+    (pasta / 'pequeno.css').write_text('body { margin: 0; }')
+    (pasta / 'grande.js').write_text('console.log("maxtour");\n' * TAMANHO_MINIMO_COMPRESSAO)
+    (pasta / 'index.html').write_text('<link href="pequeno.css"><script src="grande.js"></script>')
+    return Estaticos(str(pasta), ['pequeno.css', 'grande.js'], ['index.html'])
+
+
+def test_arquivo_pequeno_sem_variantes_sai_sem_compressao(tmp_path):
+    estaticos = _estaticos(tmp_path)
+
+    resposta = estaticos.resposta_arquivo('pequeno.css', _requisicao(**{'Accept-Encoding': 'gzip, br'}))
+
+    assert resposta.status_code == 200
+    assert 'Content-Encoding' not in resposta.headers
+    assert resposta.get_data(as_text=True) == 'body { margin: 0; }'
+
+
+def test_arquivo_grande_sai_comprimido(tmp_path):
+    estaticos = _estaticos(tmp_path)
+
+    resposta = estaticos.resposta_arquivo('grande.js', _requisicao(**{'Accept-Encoding': 'gzip'}))
+
+    assert resposta.headers['Content-Encoding'] == 'gzip'
+
+
+def test_escolher_codificacao_com_lista_vazia_nao_comprime():
+    assert escolher_codificacao('gzip', []) is None
+    assert escolher_codificacao('gzip') == 'gzip'
@@ -0,0 +1,34 @@
+import csv
+import io
+
+from exportacao import COLUNAS_RELATORIO
+
+
+def _csv(resposta):
+    return list(csv.reader(io.StringIO(resposta.get_data(as_text=True).lstrip('﻿'))))
+
+
+def test_relatorio_exportado_no_layout_da_exportacao_do_dashboard(cliente, gravar_percursos):
+    gravar_percursos(
+        # Chegada na Martins às 06:55 (tolerância 06:25–07:00 na escala da CANAÃ)
+        {'horario_saida_programado': '06:55', 'horario_chegada_programado': '07:00',
+         'horario_chegada_real': '07:04', 'atraso_chegada': 4, 'observacoes': 'trânsito'},
+        # Saída da Martins às 23:00 (tolerância de chegada 23:10–23:40)
+        {'data': '2025-07-02', 'turno': 'segundo_turno', 'horario_saida_programado': '23:00',
+         'horario_chegada_programado': '23:40', 'horario_saida_real': '23:05', 'atraso_saida': 5},
+        # Horário fora da escala: usa a chegada programada
+        {'data': '2025-07-03', 'horario_saida_programado': '09:00', 'horario_chegada_programado': '09:40'},
+    )
+
+    resposta = cliente.get('/api/relatorio/atrasos/export', query_string={'formato': 'csv'})
+
+    assert resposta.status_code == 200
+    cabecalho, *linhas = _csv(resposta)
+    assert cabecalho == [titulo for _, titulo in COLUNAS_RELATORIO]
+    assert cabecalho[3:9] == ['Tipo Movimento', 'Horário Programado', 'Horário Retorno/Destino',
+                              'Tolerância Mínima', 'Tolerância Máxima', 'Status']
+    assert linhas == [
+        ['01/07/2025', 'CANAÃ', '1º Turno', 'Chegada', '06:55', '07:04', '06:25', '07:00', '4', 'trânsito'],
+        ['02/07/2025', 'CANAÃ', '2º Turno', 'Saída', '23:00', '23:05', '23:10', '23:40', '5', ''],
+        ['03/07/2025', 'CANAÃ', '1º Turno', 'Chegada', '09:40', 'N/A', '09:40', '09:40', '0', ''],
+    ]
@@ -0,0 +1,37 @@
+from indicadores import calcular_pontualidade_por_slot, calcular_ranking
+
+
+def test_ranking_e_slots_respeitam_janela_desde_ate(gravar_percursos):
+    gravar_percursos(
+        {'data': '2025-07-01', 'atraso_chegada': 10},
+        {'data': '2025-07-02', 'atraso_chegada': 0},
+        {'data': '2025-07-03', 'atraso_chegada': 20},
+    )
+    janela = {'desde': '2025-07-02T00:00', 'ate': '2025-07-03T23:59'}
+
+    ranking = calcular_ranking('viagens_atrasadas', **janela)
+    slots = calcular_pontualidade_por_slot(periodo='dia', **janela)
+
+    assert [(item['rota_id'], item['valor'], item['total_percursos']) for item in ranking['ranking']] == [
+        ('CANAA', 1, 2)]
+    assert [ponto['periodo'] for ponto in slots['slots'][0]['serie']] == ['2025-07-02', '2025-07-03']
+
+
+def test_janela_invalida_no_ranking_retorna_400(cliente):
+    resposta = cliente.get('/api/relatorio/ranking', query_string={'desde': 'ontem'})
+
+    assert resposta.status_code == 400
+    assert 'desde' in resposta.get_json()['erro']
+
+
+def test_slots_ignoram_percursos_sem_horario_programado(gravar_percursos):
+    gravar_percursos(
+        {'atraso_chegada': 5},
+        {'data': '2025-07-02', 'horario_saida_programado': None, 'atraso_chegada': 30},
+        {'rota_id': 'PLANALTO', 'nome_rota': 'PLANALTO', 'horario_saida_programado': None},
+    )
+
+    slots = calcular_pontualidade_por_slot()
+
+    assert [(s['rota_id'], s['horario_saida_programado'], s['total_percursos']) for s in slots['slots']] == [
+        ('CANAA', '06:00', 1)]
@@ -0,0 +1,60 @@
+import sqlite3
+
+import banco
+
+
+def _banco_legado(caminho, percursos):
+    """Banco anterior às migrações versionadas: só as tabelas, sem chave natural nem schema_version"""
+    with sqlite3.connect(caminho) as conn:
+        banco._migracao_esquema_inicial(conn.cursor())
+        conn.executemany('''
+            INSERT INTO percursos (id, rota_id, nome_rota, data, turno, horario_saida_programado,
+                                   atraso_chegada, data_criacao, data_atualizacao)
+            VALUES (?, 'CANAA', 'CANAÃ', ?, 'primeiro_turno', ?, ?, ?, ?)
+        ''', percursos)
+    conn.close()
+
+
+def test_migracao_de_banco_legado_remove_duplicatas_mantendo_a_mais_recente(banco_teste):
+    caminho = banco_teste.replace('dados.db', 'legado.db')
+    _banco_legado(caminho, [
+        ('antigo', '2025-07-01', '06:00', 1, '2025-07-01T06:00', None),
+        ('atualizado', '2025-07-01', '06:00', 2, '2025-07-01T05:00', '2025-07-01T09:00'),
+        ('reenvio', '2025-07-01', '06:00', 3, '2025-07-01T07:00', None),
+        ('outro_dia', '2025-07-02', '06:00', 4, '2025-07-02T06:00', None),
+        # Sem horário programado não há chave natural: ambos ficam
+        ('sem_horario_1', '2025-07-01', None, 5, '2025-07-01T06:00', None),
+        ('sem_horario_2', '2025-07-01', None, 6, '2025-07-01T06:00', None),
+    ])
+    token = banco.usar_banco(caminho)
+    try:
+        esquema = banco.inicializar_banco()
+        ids = {p['id'] for p in banco.obter_percursos_filtrados()}
+        novamente = banco.inicializar_banco()
+    finally:
+        banco.restaurar_banco(token)
+
+    assert esquema['versao_inicial'] == 0
+    assert esquema['versao'] == banco.VERSAO_ESQUEMA
+    assert [m['versao'] for m in esquema['migracoes']] == [versao for versao, _, _ in banco.MIGRACOES]
+    assert ids == {'atualizado', 'outro_dia', 'sem_horario_1', 'sem_horario_2'}
+    assert novamente['migracoes'] == [] and novamente['versao_inicial'] == banco.VERSAO_ESQUEMA
+
+
+def test_banco_em_versao_intermediaria_aplica_so_as_migracoes_pendentes(banco_teste, monkeypatch):
+    caminho = banco_teste.replace('dados.db', 'intermediario.db')
+    token = banco.usar_banco(caminho)
+    try:
+        with monkeypatch.context() as m:
+            m.setattr(banco, 'MIGRACOES', banco.MIGRACOES[:5])
+            m.setattr(banco, 'VERSAO_ESQUEMA', 5)
+            banco.inicializar_banco()
+        esquema = banco.inicializar_banco()
+        with banco.obter_conexao() as conn:
+            registradas = [row[0] for row in conn.execute('SELECT versao FROM schema_version ORDER BY versao')]
+    finally:
+        banco.restaurar_banco(token)
+
+    assert esquema['versao_inicial'] == 5
+    assert [m['versao'] for m in esquema['migracoes']] == [versao for versao, _, _ in banco.MIGRACOES[5:]]
+    assert registradas == [versao for versao, _, _ in banco.MIGRACOES]
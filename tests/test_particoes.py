@@ -0,0 +1,81 @@
+import multiprocessing
+import multiprocessing.spawn
+
+import pytest
+
+import banco
+import particoes
+from agregados import relatorio_de_agregado
+from replica import Replica
+
+
+@pytest.fixture
+def quatro_meses(gravar_percursos):
+    gravar_percursos(*[
+        {'data': f'2025-{mes:02d}-{dia:02d}', 'horario_chegada_real': '07:00', 'atraso_chegada': (mes * dia) % 13 - 4}
+        for mes in range(1, 5) for dia in (1, 10, 20)
+    ])
+
+
+@pytest.fixture
+def dois_processos(monkeypatch):
+    monkeypatch.setattr(particoes, 'PROCESSOS', 2)
+    yield
+    particoes.encerrar_pool()
+
+
+def _relatorio_serial(**filtros):
+    return relatorio_de_agregado(banco.agregar_atrasos_por_rota(**filtros))
+
+
+def test_particoes_em_processos_igual_ao_calculo_serial(quatro_meses, dois_processos):
+    agregado = particoes.agregar_periodo_longo(data_inicio='2025-01-01', data_fim='2025-04-30')
+
+    assert relatorio_de_agregado(agregado) == _relatorio_serial(data_inicio='2025-01-01', data_fim='2025-04-30')
+
+
+def test_processos_leem_o_snapshot_da_replica_em_arquivo(quatro_meses, dois_processos, gravar_percursos, tmp_path):
+    replica = Replica(str(tmp_path / 'replica.db'), intervalo=60).iniciar()
+    try:
+        esperado = _relatorio_serial()
+        gravar_percursos({'data': '2025-02-15', 'atraso_chegada': 90})  # só no principal
+
+        token = banco.usar_fonte_leitura(replica)
+        try:
+            assert banco.arquivo_leitura() == replica.arquivo
+            agregado = particoes.agregar_periodo_longo()
+        finally:
+            banco.restaurar_fonte_leitura(token)
+    finally:
+        replica.parar()
+
+    assert relatorio_de_agregado(agregado) == esperado
+
+
+def test_replica_em_memoria_agrega_no_proprio_processo(quatro_meses, dois_processos, monkeypatch):
+    replica = Replica(':memory:', intervalo=60).iniciar()
+    monkeypatch.setattr(particoes, '_obter_pool', lambda: pytest.fail('não deveria usar o pool'))
+    try:
+        token = banco.usar_fonte_leitura(replica)
+        try:
+            assert banco.arquivo_leitura() is None
+            agregado = particoes.agregar_periodo_longo()
+        finally:
+            banco.restaurar_fonte_leitura(token)
+    finally:
+        replica.parar()
+
+    assert relatorio_de_agregado(agregado) == _relatorio_serial()
+
+
+def test_processos_criados_com_spawn_nao_reimportam_o_script_principal(monkeypatch):
+    monkeypatch.setattr(multiprocessing, 'get_start_method', lambda *args, **kwargs: 'spawn')
+    # Como em `python servidor.py`
+    monkeypatch.setattr('__main__.__spec__', None)
+    monkeypatch.setattr('__main__.__file__', '/caminho/servidor.py', raising=False)
+
+    with particoes._sem_script_principal():
+        preparacao = multiprocessing.spawn.get_preparation_data('teste')
+
+    assert not {'init_main_from_path', 'init_main_from_name'} & set(preparacao)
+    assert multiprocessing.spawn.get_preparation_data('teste')['init_main_from_path'] == '/caminho/servidor.py'
@@ -0,0 +1,80 @@
+import banco
+
+
+def _percurso(gravar_percursos, **campos):
+    gravar_percursos({'observacoes': 'original', 'atraso_saida': 2, **campos})
+    return banco.obter_percursos_filtrados()[0]
+
+
+def test_patch_altera_so_os_campos_enviados_e_recalcula_o_atraso(cliente, gravar_percursos):
+    percurso = _percurso(gravar_percursos)
+
+    resposta = cliente.patch(f'/api/percursos/{percurso["id"]}', json={'horario_chegada_real': '07:05'})
+
+    assert resposta.status_code == 200
+    atualizado = resposta.get_json()
+    assert atualizado['horario_chegada_real'] == '07:05'
+    assert atualizado['atraso_chegada'] == 15  # programado 06:50
+    assert atualizado['atraso_saida'] == 2
+    assert atualizado['observacoes'] == 'original'
+    assert atualizado['data_atualizacao'] is not None
+    assert banco.obter_percurso_por_id(percurso['id']).para_dict() == atualizado
+
+
+def test_patch_de_rota_copia_o_nome_da_nova_rota(cliente, gravar_percursos):
+    percurso = _percurso(gravar_percursos)
+
+    resposta = cliente.patch(f'/api/percursos/{percurso["id"]}', json={'rota_id': 'PLANALTO'})
+
+    assert resposta.status_code == 200
+    assert (resposta.get_json()['rota_id'], resposta.get_json()['nome_rota']) == ('PLANALTO', 'PLANALTO')
+
+
+def test_patch_com_rota_inexistente_retorna_400(cliente, gravar_percursos):
+    percurso = _percurso(gravar_percursos)
+
+    resposta = cliente.patch(f'/api/percursos/{percurso["id"]}', json={'rota_id': 'NAO_EXISTE'})
+
+    assert resposta.status_code == 400
+    assert resposta.get_json() == {'erro': 'Rota não encontrada'}
+    assert banco.obter_percurso_por_id(percurso['id'])['rota_id'] == 'CANAA'
+
+
+def test_patch_rejeita_campos_nao_editaveis_e_percurso_inexistente(cliente, gravar_percursos):
+    percurso = _percurso(gravar_percursos)
+
+    assert cliente.patch(f'/api/percursos/{percurso["id"]}', json={'saida_programada_em': 'x'}).status_code == 400
+    assert cliente.patch('/api/percursos/nao-existe', json={'observacoes': 'x'}).status_code == 404
+
+
+def test_patch_e_um_so_comando_e_passa_o_registro_anterior_aos_ganchos(gravar_percursos, monkeypatch):
+    percurso = _percurso(gravar_percursos, horario_chegada_real='06:55', atraso_chegada=5)
+    gravacoes, comandos = [], []
+    monkeypatch.setattr(banco, '_ganchos_percurso', [lambda conn, anterior, atual: gravacoes.append((anterior, atual))])
+    nova_conexao = banco._nova_conexao
+
+    def conexao_rastreada(caminho=None):
+        conn = nova_conexao(caminho)
+        conn.set_trace_callback(comandos.append)
+        return conn
+    monkeypatch.setattr(banco, '_nova_conexao', conexao_rastreada)
+
+    banco.atualizar_percurso(percurso['id'], {'rota_id': 'PLANALTO', 'horario_chegada_real': '07:10'})
+
+    # Só o UPDATE (os triggers aparecem no rastro com o texto dele), sem SELECT antes
+    assert list(dict.fromkeys(comandos)) == ['BEGIN ', comandos[1], 'COMMIT']
+    assert comandos[1].startswith('UPDATE percursos')
+    (anterior, atual), = gravacoes
+    assert (anterior.rota_id, anterior.horario_chegada_real, anterior.atraso_chegada) == ('CANAA', '06:55', 5)
+    assert (atual.rota_id, atual.nome_rota, atual.atraso_chegada) == ('PLANALTO', 'PLANALTO', 20)
+
+
+def test_put_recalcula_o_atraso_e_recusa_rota_inexistente(cliente, gravar_percursos):
+    percurso = _percurso(gravar_percursos)
+    url = f'/api/percursos/{percurso["id"]}'
+
+    assert cliente.put(url, json={'rota_id': 'NAO_EXISTE'}).get_json() == {'erro': 'Rota não encontrada'}
+    resposta = cliente.put(url, json={'horario_saida_real': '06:07', 'atraso_saida': 99})
+
+    assert resposta.status_code == 200
+    assert resposta.get_json()['atraso_saida'] == 7
@@ -0,0 +1,27 @@
+def test_resumo_por_rota_e_detalhes(cliente, gravar_percursos):
+    gravar_percursos(
+        {'atraso_saida': 4, 'atraso_chegada': 10},
+        {'data': '2025-07-02', 'atraso_saida': 0, 'atraso_chegada': -2},
+        {'rota_id': 'PLANALTO', 'nome_rota': 'PLANALTO', 'atraso_saida': -1, 'atraso_chegada': 6},
+    )
+
+    relatorio = cliente.get('/api/relatorio/atrasos', query_string={'fields': 'data,atraso_chegada'}).get_json()
+
+    assert relatorio['resumo'] == {
+        'total_percursos': 3, 'media_atraso_saida': 1.0, 'media_atraso_chegada': 8.0,
+        'maior_atraso_saida': 4, 'maior_atraso_chegada': 10,
+        'pontualidade_saida': 66.7, 'pontualidade_chegada': 33.3,
+    }
+    assert list(relatorio['por_rota']) == ['PLANALTO', 'CANAÃ']
+    assert relatorio['por_rota']['CANAÃ']['media_atraso_chegada'] == 10.0
+    assert sorted(d['atraso_chegada'] for d in relatorio['detalhes']) == [-2, 6, 10]
+    assert set(relatorio['detalhes'][0]) == {'data', 'atraso_chegada'}
+
+
+def test_detalhes_0_so_traz_os_agregados(cliente, gravar_percursos):
+    gravar_percursos({'atraso_chegada': 3})
+
+    relatorio = cliente.get('/api/relatorio/atrasos', query_string={'detalhes': '0'}).get_json()
+
+    assert relatorio['resumo']['total_percursos'] == 1
+    assert relatorio['detalhes'] == []
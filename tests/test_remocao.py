@@ -0,0 +1,18 @@
+import banco
+
+
+def test_origem_ficticio_casa_a_marca_em_qualquer_posicao_das_observacoes(gravar_percursos):
+    gravar_percursos(
+        {'observacoes': 'Dados fictícios - No horário'},
+        {'data': '2025-07-02', 'observacoes': 'Reprocessado: Dados fictícios - Atraso de 5min'},
+        {'data': '2025-07-03', 'observacoes': 'Pneu furado'},
+        {'data': '2025-07-04'},
+    )
+
+    assert banco.contar_percursos_filtrados(origem='ficticio') == 2
+    assert banco.contar_percursos_filtrados(origem='operacao') == 2
+
+    *_, progresso = banco.remover_percursos_em_lotes(origem='ficticio', tamanho_lote=1, pausa=0)
+
+    assert progresso == {'total': 2, 'removidos': 2, 'lotes': 2}
+    assert sorted(p.data for p in banco.obter_percursos_filtrados()) == ['2025-07-03', '2025-07-04']
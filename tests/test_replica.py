@@ -0,0 +1,60 @@
+import pytest
+
+import servidor
+from replica import Replica
+
+PERIODO = {'data_inicio': '2025-07-01', 'data_fim': '2025-07-02'}
+
+
+@pytest.fixture
+def replica_ativa(banco_teste, gravar_percursos, monkeypatch):
+    gravar_percursos(
+        {'horario_saida_real': '06:05', 'horario_chegada_real': '06:58', 'atraso_saida': 5, 'atraso_chegada': 8},
+        {'data': '2025-07-02', 'horario_saida_real': '06:00', 'horario_chegada_real': '06:45'},
+    )
+    replica = Replica(':memory:', intervalo=60).iniciar()
+    monkeypatch.setattr(servidor, 'replica', replica)
+    yield replica
+    replica.parar()
+
+
+def _url_do_endpoint(endpoint):
+    regras = [regra for regra in servidor.app.url_map.iter_rules()
+              if regra.endpoint == endpoint and 'GET' in regra.methods]
+    assert len(regras) == 1
+    return regras[0].rule
+
+
+@pytest.mark.parametrize('endpoint', sorted(servidor.FRESCOR_REPLICA))
+def test_endpoints_da_replica_respondem_lendo_do_snapshot(cliente, replica_ativa, endpoint):
+    resposta = cliente.get(_url_do_endpoint(endpoint), query_string=PERIODO)
+
+    assert resposta.status_code == 200, resposta.get_data(as_text=True)
+    assert 'X-Replica-Atraso' in resposta.headers
+
+
+def test_cobertura_lida_da_replica_usa_a_escala_do_snapshot(cliente, replica_ativa):
+    resposta = cliente.get('/api/relatorio/cobertura', query_string={**PERIODO, 'rota': 'CANAA'})
+
+    assert resposta.status_code == 200, resposta.get_data(as_text=True)
+    assert 'X-Replica-Atraso' in resposta.headers
+    assert resposta.get_json()['resumo']['viagens_esperadas'] == 26
+
+
+@pytest.mark.parametrize('gravar', [
+    lambda cliente: cliente.post('/api/config/rotas', json={'id': 'NOVA', 'nome': 'NOVA', 'horarios': {}}),
+    lambda cliente: cliente.put('/api/config/rotas/CANAA', json={'nome': 'CANAÃ (NOVO NOME)'}),
+    lambda cliente: cliente.delete('/api/config/rotas/PLANALTO'),
+], ids=['criar', 'atualizar', 'remover'])
+def test_gravacao_de_rota_deixa_a_replica_pendente(cliente, replica_ativa, gravar):
+    assert replica_ativa.atraso_s() == 0
+
+    assert gravar(cliente).status_code in (200, 201)
+
+    assert replica_ativa.atraso_s() > 0
+
+
+def test_gravacao_de_rota_inexistente_nao_deixa_a_replica_pendente(cliente, replica_ativa):
+    assert cliente.delete('/api/config/rotas/NAO_EXISTE').status_code == 404
+
+    assert replica_ativa.atraso_s() == 0
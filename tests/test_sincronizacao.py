@@ -0,0 +1,39 @@
+import banco
+
+
+def _ids(percursos):
+    return sorted(percurso.id for percurso in percursos)
+
+
+def test_since_anterior_ao_horizonte_das_lapides_recebe_a_lista_completa(banco_teste, gravar_percursos):
+    gravar_percursos(*[{'horario_saida_programado': f'0{hora}:00'} for hora in range(5, 9)])
+    inicial = banco.obter_alteracoes_percursos()
+    removido, mantido = _ids(inicial['inseridos'])[:2]
+    versao_antiga = inicial['versao']
+    banco.deletar_percurso(removido)
+    gravar_percursos({'data': '2025-07-02'})
+    versao_recente = banco.obter_alteracoes_percursos()['versao']
+
+    assert banco.purgar_lapides(retencao=1) == 1
+
+    completo = banco.obter_alteracoes_percursos(versao_antiga)
+    assert completo['completo'] is True
+    assert removido not in _ids(completo['inseridos'])
+    assert mantido in _ids(completo['inseridos'])
+    assert banco.obter_alteracoes_percursos(versao_recente)['completo'] is False
+
+
+def test_lapides_recentes_e_a_ultima_versao_sao_mantidas(banco_teste, gravar_percursos):
+    gravar_percursos({}, {'data': '2025-07-02'})
+    inicial = banco.obter_alteracoes_percursos()
+    versao_antiga, percurso_id = inicial['versao'], inicial['inseridos'][0].id
+    banco.deletar_percurso(percurso_id)
+    versao = banco.obter_alteracoes_percursos()['versao']
+
+    assert banco.purgar_lapides(retencao=1) == 0
+
+    alteracoes = banco.obter_alteracoes_percursos(versao_antiga)
+    assert alteracoes['completo'] is False
+    assert alteracoes['removidos'] == [percurso_id]
+    gravar_percursos({'data': '2025-07-03'})
+    assert banco.obter_alteracoes_percursos()['versao'] == versao + 1
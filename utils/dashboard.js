@@ -1981,191 +1981,30 @@ function exportarRelatorio(formato) {
         return;
     }
     
-    const { detalhes, filtros } = window.lastRelatorio;
+    const { filtros } = window.lastRelatorio;
     
     try {
-        if (formato === 'excel') {
-            exportarParaExcel(detalhes, filtros);
-        } else if (formato === 'csv') {
-            exportarParaCSV(detalhes, filtros);
-        }
-    } catch (error) {
-        console.error('Erro ao exportar relatório:', error);
-        mostrarNotificacao('Erro ao exportar relatório: ' + error.message, 'error');
-    }
-}
-
-function exportarParaExcel(detalhes, filtros) {
-    // Preparar dados para o worksheet com nova estrutura
-    const dados = detalhes.map(item => {
-        // Detectar tipo de movimento
-        const movimento = detectarTipoMovimento(item);
-        
-        // Extrair valores com verificação mais robusta
-        const horarioMartins = (item[movimento.campo_martins] && item[movimento.campo_martins] !== '') ? item[movimento.campo_martins] : 'N/A';
-        const horarioReal = (item[movimento.campo_real] && item[movimento.campo_real] !== '') ? item[movimento.campo_real] : 'N/A';
-        const toleranciaMin = (item[movimento.campo_minima] && item[movimento.campo_minima] !== '') ? item[movimento.campo_minima] : 'N/A';
-        const toleranciaMax = (item[movimento.campo_maxima] && item[movimento.campo_maxima] !== '') ? item[movimento.campo_maxima] : 'N/A';
-        
-        // Calcular atraso se não estiver definido
-        let atraso = item.atraso;
-        
-        // Se não há atraso definido, tentar usar atraso_chegada ou atraso_saida
-        if (atraso === undefined || atraso === null) {
-            if (movimento.tipo === 'Chegada' && item.atraso_chegada !== undefined) {
-                atraso = item.atraso_chegada;
-            } else if (movimento.tipo === 'Saída' && item.atraso_saida !== undefined) {
-                atraso = item.atraso_saida;
-            } else if (horarioMartins !== 'N/A' && horarioReal !== 'N/A') {
-                // Calcular atraso manualmente apenas se necessário
-                try {
-                    const [hM, mM] = horarioMartins.split(':').map(Number);
-                    const [hR, mR] = horarioReal.split(':').map(Number);
-                    const minutosMartin = hM * 60 + mM;
-                    const minutosReal = hR * 60 + mR;
-                    atraso = minutosReal - minutosMartin;
-                } catch (error) {
-                    atraso = 0;
-                }
-            } else {
-                atraso = 0;
-            }
-        }
-        
-        return {
-            'Data': formatarDataParaExportacao(item.data),
-            'Rota': item.rota || 'N/A',
-            'Turno': item.turno === 'primeiro_turno' ? '1º Turno' : '2º Turno',
-            'Tipo Movimento': movimento.tipo,
-            'Horário Programado': horarioMartins,
-            'Horário Retorno/Destino': horarioReal,
-            'Tolerância Mínima': toleranciaMin,
-            'Tolerância Máxima': toleranciaMax,
-            'Status': atraso || 0,
-            'Observações': item.observacoes || ''
-        };
-    });
-    
-    // Criar worksheet
-    const ws = XLSX.utils.json_to_sheet(dados);
-    
-    // Ajustar largura das colunas
-    const colWidths = [
-        { wch: 12 }, // Data
-        { wch: 15 }, // Rota
-        { wch: 12 }, // Turno
-        { wch: 15 }, // Tipo Movimento
-        { wch: 18 }, // Horário Programado
-        { wch: 20 }, // Horário Retorno/Destino
-        { wch: 16 }, // Tolerância Mínima
-        { wch: 16 }, // Tolerância Máxima
-        { wch: 14 }, // Status
-        { wch: 30 }  // Observações
-    ];
-    ws['!cols'] = colWidths;
-    
-    // Criar workbook
-    const wb = XLSX.utils.book_new();
-    XLSX.utils.book_append_sheet(wb, ws, 'Relatório de Atrasos');
-    
-    // Gerar nome do arquivo
-    const dataAtual = new Date().toISOString().split('T')[0];
-    const nomeArquivo = `relatorio_${filtros.dataInicio}_${filtros.dataFim}_${dataAtual}.xlsx`;
-    
-    // Fazer download
-    XLSX.writeFile(wb, nomeArquivo);
-    
-    mostrarNotificacao('Relatório Excel exportado com sucesso!', 'success');
-}
-
-function exportarParaCSV(detalhes, filtros) {
-    // Preparar dados para o worksheet com nova estrutura
-    const dados = detalhes.map(item => {
-        // Detectar tipo de movimento
-        const movimento = detectarTipoMovimento(item);
-        
-        // Extrair valores com verificação mais robusta
-        const horarioMartins = (item[movimento.campo_martins] && item[movimento.campo_martins] !== '') ? item[movimento.campo_martins] : 'N/A';
-        const horarioReal = (item[movimento.campo_real] && item[movimento.campo_real] !== '') ? item[movimento.campo_real] : 'N/A';
-        const toleranciaMin = (item[movimento.campo_minima] && item[movimento.campo_minima] !== '') ? item[movimento.campo_minima] : 'N/A';
-        const toleranciaMax = (item[movimento.campo_maxima] && item[movimento.campo_maxima] !== '') ? item[movimento.campo_maxima] : 'N/A';
-        
-        // Calcular atraso se não estiver definido
-        let atraso = item.atraso;
-        
-        // Se não há atraso definido, tentar usar atraso_chegada ou atraso_saida
-        if (atraso === undefined || atraso === null) {
-            if (movimento.tipo === 'Chegada' && item.atraso_chegada !== undefined) {
-                atraso = item.atraso_chegada;
-            } else if (movimento.tipo === 'Saída' && item.atraso_saida !== undefined) {
-                atraso = item.atraso_saida;
-            } else if (horarioMartins !== 'N/A' && horarioReal !== 'N/A') {
-                // Calcular atraso manualmente apenas se necessário
-                try {
-                    const [hM, mM] = horarioMartins.split(':').map(Number);
-                    const [hR, mR] = horarioReal.split(':').map(Number);
-                    const minutosMartin = hM * 60 + mM;
-                    const minutosReal = hR * 60 + mR;
-                    atraso = minutosReal - minutosMartin;
-                } catch (error) {
-                    atraso = 0;
-                }
-            } else {
-                atraso = 0;
-            }
+        // A planilha é gerada em streaming pelo servidor, com os mesmos filtros do relatório
+        const params = new URLSearchParams({
+            formato: formato === 'excel' ? 'xlsx' : 'csv',
+            data_inicio: filtros.dataInicio,
+            data_fim: filtros.dataFim
+        });
+        if (filtros.rota && filtros.rota !== 'Todas') {
+            params.append('rota', filtros.rota);
         }
         
-        return {
-            'Data': formatarDataParaExportacao(item.data),
-            'Rota': item.rota || 'N/A',
-            'Turno': item.turno === 'primeiro_turno' ? '1º Turno' : '2º Turno',
-            'Tipo Movimento': movimento.tipo,
-            'Horário Programado': horarioMartins,
-            'Horário Retorno/Destino': horarioReal,
-            'Tolerância Mínima': toleranciaMin,
-            'Tolerância Máxima': toleranciaMax,
-            'Status': atraso || 0,
-            'Observações': item.observacoes || ''
-        };
-    });
-    
-    // Criar worksheet
-    const ws = XLSX.utils.json_to_sheet(dados);
-    
-    // Converter para CSV
-    const csvContent = XLSX.utils.sheet_to_csv(ws);
-    
-    // Criar Blob e fazer download
-    const blob = new Blob([csvContent], { type: 'text/csv;charset=utf-8;' });
-    const link = document.createElement('a');
-    
-    if (link.download !== undefined) {
-        const dataAtual = new Date().toISOString().split('T')[0];
-        const nomeArquivo = `relatorio_${filtros.dataInicio}_${filtros.dataFim}_${dataAtual}.csv`;
-        const url = URL.createObjectURL(blob);
-        
-        link.setAttribute('href', url);
-        link.setAttribute('download', nomeArquivo);
+        const link = document.createElement('a');
+        link.href = `${API_BASE}/relatorio/atrasos/export?${params.toString()}`;
         link.style.visibility = 'hidden';
         document.body.appendChild(link);
         link.click();
         document.body.removeChild(link);
         
-        // Limpar URL do objeto
-        URL.revokeObjectURL(url);
-        
-        mostrarNotificacao('Relatório CSV exportado com sucesso!', 'success');
-    }
-}
-
-// Função auxiliar para formatar data para exportação
-function formatarDataParaExportacao(data) {
-    try {
-        if (!data) return 'N/A';
-        const dataObj = new Date(data + 'T00:00:00');
-        return dataObj.toLocaleDateString('pt-BR');
+        mostrarNotificacao(`Exportação ${formato === 'excel' ? 'Excel' : 'CSV'} iniciada!`, 'success');
     } catch (error) {
-        return data || 'N/A';
+        console.error('Erro ao exportar relatório:', error);
+        mostrarNotificacao('Erro ao exportar relatório: ' + error.message, 'error');
     }
 }
 